@@ -1,24 +1,209 @@
-from flask import Flask, render_template, request, jsonify
+from flask import (Flask, render_template, request, jsonify, g, Response, stream_with_context,
+                   make_response, has_request_context, get_template_attribute)
+from werkzeug.middleware.proxy_fix import ProxyFix
+import base64
+import bisect
+import collections
+import concurrent.futures
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import queue
+import re
+import shutil
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
 import os
 
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when brotli is not installed
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: snapshot copies are then not coordinated between processes
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib json encoder is used when orjson is not installed
+    orjson = None
+
+# Startup timings (seconds), exported on /metrics
+_startup = {'import_started': time.perf_counter()}
+
 app = Flask(__name__)
 
 # Database path - use /data in production for volume persistence
 DATA_DIR = os.getenv('DATA_DIR', '.')
 DATABASE = os.path.join(DATA_DIR, 'farm_management.db')
 
-def get_db_connection():
-    """Create a database connection"""
-    conn = sqlite3.connect(DATABASE)
+# Settings, overridable from the environment
+app.config.update(
+    DATABASE=DATABASE,
+    SQLITE_JOURNAL_MODE=os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    SQLITE_SYNCHRONOUS=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    SQLITE_MMAP_SIZE=int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024)),
+    SQLITE_CACHE_SIZE=int(os.getenv('SQLITE_CACHE_SIZE', -16000)),  # negative = KiB
+    SQLITE_BUSY_TIMEOUT_MS=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    SQLITE_POOL_CONNECTIONS=os.getenv('SQLITE_POOL_CONNECTIONS', '1') == '1',
+    BULK_BATCH_SIZE=int(os.getenv('BULK_BATCH_SIZE', 1000)),
+    GROUP_COMMIT=os.getenv('GROUP_COMMIT', '1') == '1',
+    GROUP_COMMIT_MAX_UNITS=int(os.getenv('GROUP_COMMIT_MAX_UNITS', 64)),
+    GROUP_COMMIT_TIMEOUT_S=float(os.getenv('GROUP_COMMIT_TIMEOUT_S', 30)),
+    COMPRESS_MIN_SIZE=int(os.getenv('COMPRESS_MIN_SIZE', 1024)),
+    COMPRESS_LEVEL=int(os.getenv('COMPRESS_LEVEL', 5)),
+    METRICS_ENABLED=os.getenv('METRICS_ENABLED', '1') == '1',
+    PROFILE_SLOW_MS=int(os.getenv('PROFILE_SLOW_MS', 0)),  # 0 disables the profiler
+    PROFILE_INTERVAL_MS=int(os.getenv('PROFILE_INTERVAL_MS', 5)),
+    PROFILE_DIR=os.getenv('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles')),
+    REPORT_WORKERS=int(os.getenv('REPORT_WORKERS', 2)),
+    REPORT_TIMEOUT_S=int(os.getenv('REPORT_TIMEOUT_S', 600)),
+    REPORT_RETENTION_DAYS=int(os.getenv('REPORT_RETENTION_DAYS', 7)),
+    CHANGE_LOG_RETENTION_DAYS=int(os.getenv('CHANGE_LOG_RETENTION_DAYS', 30)),
+    SSE_MAX_CLIENTS=int(os.getenv('SSE_MAX_CLIENTS', 2)),
+    SSE_MAX_SECONDS=int(os.getenv('SSE_MAX_SECONDS', 300)),
+    SSE_POLL_MS=int(os.getenv('SSE_POLL_MS', 500)),
+    SSE_RETRY_MS=int(os.getenv('SSE_RETRY_MS', 2000)),
+    SCADENZE_PREAVVISO_DAYS=int(os.getenv('SCADENZE_PREAVVISO_DAYS', 7)),
+    SCADENZE_PREAVVISO_ORE=int(os.getenv('SCADENZE_PREAVVISO_ORE', 25)),
+    SCADENZE_CHECK_S=int(os.getenv('SCADENZE_CHECK_S', 300)),  # 0 disables the alert scheduler
+    READ_MODE=os.getenv('READ_MODE', 'primary'),  # primary, readonly or snapshot
+    READ_SNAPSHOT_PATH=os.getenv('READ_SNAPSHOT_PATH', os.path.join(DATA_DIR, 'farm_management.snapshot.db')),
+    READ_SNAPSHOT_MAX_AGE_S=int(os.getenv('READ_SNAPSHOT_MAX_AGE_S', 30)),
+    MAINTENANCE_CHECK_S=int(os.getenv('MAINTENANCE_CHECK_S', 600)),  # 0 disables the maintenance scheduler
+    MAINTENANCE_STEP_PAGES=int(os.getenv('MAINTENANCE_STEP_PAGES', 1024)),
+    MAINTENANCE_PAUSE_MS=int(os.getenv('MAINTENANCE_PAUSE_MS', 20)),
+    AUTO_VACUUM_CONVERT=os.getenv('AUTO_VACUUM_CONVERT', '0') == '1',
+    BACKUP_DIR=os.getenv('BACKUP_DIR'),  # default: backups/ next to DATABASE
+    BACKUP_INTERVAL_H=int(os.getenv('BACKUP_INTERVAL_H', 24)),  # 0 disables scheduled backups
+    BACKUP_KEEP=int(os.getenv('BACKUP_KEEP', 7)),
+    ANALYZE_INTERVAL_H=int(os.getenv('ANALYZE_INTERVAL_H', 168)),
+    ARCHIVE_DIR=os.getenv('ARCHIVE_DIR'),  # default: archive/ next to DATABASE
+    ARCHIVE_AFTER_DAYS=int(os.getenv('ARCHIVE_AFTER_DAYS', 0)),  # 0 disables archiving
+    TRUSTED_PROXIES=int(os.getenv('TRUSTED_PROXIES', 0)),  # reverse proxies in front setting X-Forwarded-For
+    RATE_LIMIT_PER_S=float(os.getenv('RATE_LIMIT_PER_S', 20)),  # 0 disables the rate limit
+    RATE_LIMIT_BURST=int(os.getenv('RATE_LIMIT_BURST', 100)),
+    RATE_LIMIT_WRITE_PER_S=float(os.getenv('RATE_LIMIT_WRITE_PER_S', 5)),  # 0 disables the write rate limit
+    RATE_LIMIT_WRITE_BURST=int(os.getenv('RATE_LIMIT_WRITE_BURST', 20)),
+    RATE_LIMIT_STORE=os.getenv('RATE_LIMIT_STORE', 'memory'),  # memory (per worker) or file (shared)
+    RATE_LIMIT_PATH=os.getenv('RATE_LIMIT_PATH', os.path.join(DATA_DIR, 'farm_management.ratelimit.db')),
+    WRITE_CONCURRENCY=int(os.getenv('WRITE_CONCURRENCY', 2)),  # 0 disables the write queue
+    WRITE_QUEUE_MAX=int(os.getenv('WRITE_QUEUE_MAX', 1)),
+    WRITE_QUEUE_TIMEOUT_MS=int(os.getenv('WRITE_QUEUE_TIMEOUT_MS', 1000)),
+)
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+# One pooled connection per worker thread
+_local = threading.local()
+
+def get_db_connection(database=None, readonly=False, immutable=False):
+    """Create a database connection (to DATABASE unless another path is given).
+
+    readonly opens the file with mode=ro; immutable also tells SQLite the
+    file never changes, so no locks are taken (for snapshots replaced whole).
+    """
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'Invalid SQLITE_SYNCHRONOUS: {synchronous}')
+
+    factory = InstrumentedConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection
+    database = database or app.config['DATABASE']
+    # How long a statement waits for another connection's lock before "database is locked"
+    timeout = app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000
+    if readonly:
+        uri = f'file:{urllib.parse.quote(os.path.abspath(database))}?mode=ro'
+        if immutable:
+            uri += '&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, factory=factory, timeout=timeout)
+    else:
+        conn = sqlite3.connect(database, factory=factory, timeout=timeout)
     conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    conn.execute(f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}")
+    conn.execute(f"PRAGMA cache_size = {int(app.config['SQLITE_CACHE_SIZE'])}")
+    conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
+def get_db():
+    """Return the connection bound to the current app context.
+
+    With pooling enabled each worker thread keeps its connection open across
+    requests; it is re-created after a fork or when DATABASE changes.
+    """
+    if 'db' not in g:
+        if not app.config['SQLITE_POOL_CONNECTIONS']:
+            g.db = get_db_connection()
+            return g.db
+
+        key = (os.getpid(), app.config['DATABASE'])
+        if getattr(_local, 'key', None) != key:
+            _local.conn = get_db_connection()
+            _local.key = key
+        g.db = _local.conn
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    """Give the connections back to the thread pool, discarding any open transaction"""
+    for name in ('db', 'read_db'):
+        conn = g.pop(name, None)
+        if conn is None:
+            continue
+        if conn.in_transaction:
+            conn.rollback()
+        if not app.config['SQLITE_POOL_CONNECTIONS']:
+            conn.close()
+
 def init_db():
-    """Initialize the database with all necessary tables"""
+    """Bring the database schema up to date and return the migrations applied.
+
+    A database already at the latest schema version is only checked: none
+    of the CREATE statements run, so a restart costs a single query.
+    """
     conn = get_db_connection()
+    try:
+        journal_mode = app.config['SQLITE_JOURNAL_MODE'].upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f'Invalid SQLITE_JOURNAL_MODE: {journal_mode}')
+        try:
+            current = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+        except sqlite3.OperationalError:
+            current = None  # new database
+        if current is None:
+            # Must be set before anything writes the file header, journal mode included;
+            # older databases are converted by the vacuum task (AUTO_VACUUM_CONVERT)
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # The journal mode is persistent in the database file, so set it once here
+        if conn.execute('PRAGMA journal_mode').fetchone()[0].upper() != journal_mode:
+            conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+        if current is not None and current >= MIGRATIONS[-1][0]:
+            return []
 
+        create_tables(conn)
+        applied = migrate(conn)
+        if applied:
+            print(f'Applied schema migrations: {applied}')
+        return applied
+    finally:
+        conn.close()
+
+def create_tables(conn):
+    """Create the base tables of the original schema; later changes are MIGRATIONS"""
     # Numbers table (original app)
     conn.execute('''
         CREATE TABLE IF NOT EXISTS numbers (
@@ -83,114 +268,2848 @@ def init_db():
         )
     ''')
 
-    # Animali e Bestiame
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS animali (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            specie VARCHAR(50) NOT NULL,
-            razza VARCHAR(50),
-            identificativo VARCHAR(50),
-            data_nascita DATE,
-            sesso VARCHAR(10),
-            peso_kg REAL,
-            stato_salute VARCHAR(50) DEFAULT 'Sano',
-            padre_id INTEGER,
-            madre_id INTEGER,
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (padre_id) REFERENCES animali(id),
-            FOREIGN KEY (madre_id) REFERENCES animali(id)
-        )
-    ''')
+    # Animali e Bestiame
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS animali (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            specie VARCHAR(50) NOT NULL,
+            razza VARCHAR(50),
+            identificativo VARCHAR(50),
+            data_nascita DATE,
+            sesso VARCHAR(10),
+            peso_kg REAL,
+            stato_salute VARCHAR(50) DEFAULT 'Sano',
+            padre_id INTEGER,
+            madre_id INTEGER,
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (padre_id) REFERENCES animali(id),
+            FOREIGN KEY (madre_id) REFERENCES animali(id)
+        )
+    ''')
+
+    # Colture
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS colture (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            terreno_id INTEGER NOT NULL,
+            tipo_coltura VARCHAR(100) NOT NULL,
+            varieta VARCHAR(100),
+            data_semina DATE,
+            data_raccolta_prevista DATE,
+            data_raccolta_effettiva DATE,
+            quantita_raccolta_kg REAL,
+            stato VARCHAR(50) DEFAULT 'In corso',
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (terreno_id) REFERENCES terreni(id)
+        )
+    ''')
+
+    # Personale/Dipendenti
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS personale (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome VARCHAR(50) NOT NULL,
+            cognome VARCHAR(50) NOT NULL,
+            ruolo VARCHAR(50),
+            telefono VARCHAR(20),
+            email VARCHAR(100),
+            data_assunzione DATE,
+            tipo_contratto VARCHAR(50),
+            retribuzione_mensile REAL,
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Magazzino (sementi, fertilizzanti, fitofarmaci)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS magazzino (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            categoria VARCHAR(50) NOT NULL,
+            nome_prodotto VARCHAR(100) NOT NULL,
+            marca VARCHAR(50),
+            quantita REAL NOT NULL,
+            unita_misura VARCHAR(20),
+            data_acquisto DATE,
+            costo_unitario REAL,
+            scadenza DATE,
+            fornitore VARCHAR(100),
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Manutenzioni
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS manutenzioni (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_oggetto VARCHAR(50) NOT NULL,
+            oggetto_id INTEGER NOT NULL,
+            data_manutenzione DATE NOT NULL,
+            tipo_manutenzione VARCHAR(50),
+            descrizione TEXT,
+            costo REAL,
+            eseguita_da VARCHAR(100),
+            prossima_manutenzione DATE,
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Finanze (Spese e Ricavi)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS finanze (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo VARCHAR(20) NOT NULL,
+            categoria VARCHAR(50) NOT NULL,
+            descrizione TEXT NOT NULL,
+            importo REAL NOT NULL,
+            data_operazione DATE NOT NULL,
+            metodo_pagamento VARCHAR(50),
+            riferimento VARCHAR(100),
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+
+# ============= SCHEMA MIGRATIONS =============
+
+def _add_terreni_geometria(conn):
+    """Databases created before the map existed lack terreni.geometria"""
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(terreni)')]
+    if 'geometria' not in columns:
+        conn.execute('ALTER TABLE terreni ADD COLUMN geometria TEXT')
+
+def _create_terreni_spatial_index(conn):
+    """Bounding boxes in an R-tree plus cached metrics, filled from existing rows"""
+    conn.execute('CREATE VIRTUAL TABLE terreni_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat)')
+    conn.execute('''
+        CREATE TABLE terreni_geo (
+            id INTEGER PRIMARY KEY,
+            area_m2 REAL,
+            centroid_lon REAL,
+            centroid_lat REAL,
+            vertici INTEGER
+        )
+    ''')
+    # Rows leave the index with their parcel; an updated geometria must be re-indexed
+    for event in ('DELETE', 'UPDATE OF geometria'):
+        conn.execute(f'''
+            CREATE TRIGGER terreni_geo_{event.split()[0].lower()} AFTER {event} ON terreni BEGIN
+                DELETE FROM terreni_rtree WHERE id = OLD.id;
+                DELETE FROM terreni_geo WHERE id = OLD.id;
+            END
+        ''')
+    for row in conn.execute('SELECT id, geometria FROM terreni WHERE geometria IS NOT NULL').fetchall():
+        try:
+            index_terreno_geometry(conn, row['id'], row['geometria'])
+        except ValueError:
+            pass  # unreadable legacy geometry stays out of the index
+
+# Text columns indexed for /api/search per table; the first one is the title
+# of the hit. The table's position here is its code in the FTS rowid.
+SEARCH_COLUMNS = {
+    'terreni': ('nome', 'tipo_terreno', 'ubicazione', 'foglio', 'particella', 'note'),
+    'trattori': ('marca', 'modello', 'targa', 'numero_telaio', 'note'),
+    'attrezzi': ('nome', 'tipo', 'marca', 'modello', 'note'),
+    'animali': ('identificativo', 'specie', 'razza', 'note'),
+    'magazzino': ('nome_prodotto', 'categoria', 'marca', 'fornitore', 'note'),
+    'manutenzioni': ('descrizione', 'tipo_manutenzione', 'eseguita_da', 'note'),
+    'finanze': ('descrizione', 'categoria', 'riferimento', 'note'),
+}
+
+# rowid = id * SEARCH_ROWID_STRIDE + table code, so triggers address a row's entry directly
+SEARCH_ROWID_STRIDE = 8
+
+def _search_entry(table, ref):
+    """(rowid, titolo, testo) SQL expressions of a row in the search index;
+    ref is NEW, OLD or the table name."""
+    code = list(SEARCH_COLUMNS).index(table)
+    title, *rest = SEARCH_COLUMNS[table]
+    text = 'TRIM(' + ' || '.join(f"COALESCE({ref}.{column} || ' ', '')" for column in rest) + ')'
+    return f'{ref}.id * {SEARCH_ROWID_STRIDE} + {code}', f"COALESCE({ref}.{title}, '')", text
+
+def _create_search_index(conn):
+    """FTS5 index over the text columns of the farm tables, filled from
+    existing rows and kept in step by triggers"""
+    conn.execute('''
+        CREATE VIRTUAL TABLE search_index USING fts5(
+            tabella UNINDEXED, riga UNINDEXED, titolo, testo,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4'
+        )
+    ''')
+    for table in SEARCH_COLUMNS:
+        new_entry, old_entry = _search_entry(table, 'NEW'), _search_entry(table, 'OLD')
+        insert = (f"INSERT INTO search_index (rowid, tabella, riga, titolo, testo) "
+                  f"VALUES ({new_entry[0]}, '{table}', NEW.id, {new_entry[1]}, {new_entry[2]});")
+        delete = f'DELETE FROM search_index WHERE rowid = {old_entry[0]};'
+        conn.execute(f'CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END')
+        conn.execute(f'CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END')
+        conn.execute(f'CREATE TRIGGER {table}_search_update AFTER UPDATE ON {table} BEGIN {delete} {insert} END')
+        rowid, title, text = _search_entry(table, table)
+        conn.execute(f"INSERT INTO search_index (rowid, tabella, riga, titolo, testo) "
+                     f"SELECT {rowid}, '{table}', id, {title}, {text} FROM {table}")
+
+# Trigger bodies keeping the stats tables in step with terreni and finanze;
+# UPDATE triggers run the DELETE body for OLD and the INSERT body for NEW.
+_TERRENI_STATS_ADD = '''
+    UPDATE stats_summary SET terreni_count = terreni_count + 1,
+        terreni_superficie = terreni_superficie + COALESCE(NEW.superficie_ettari, 0) WHERE id = 1;
+    INSERT INTO stats_terreni_tipo (tipo_terreno, terreni, superficie)
+        VALUES (COALESCE(NEW.tipo_terreno, 'Non specificato'), 1, COALESCE(NEW.superficie_ettari, 0))
+        ON CONFLICT (tipo_terreno) DO UPDATE SET terreni = terreni + 1, superficie = superficie + excluded.superficie;
+'''
+_TERRENI_STATS_REMOVE = '''
+    UPDATE stats_summary SET terreni_count = terreni_count - 1,
+        terreni_superficie = terreni_superficie - COALESCE(OLD.superficie_ettari, 0) WHERE id = 1;
+    UPDATE stats_terreni_tipo SET terreni = terreni - 1, superficie = superficie - COALESCE(OLD.superficie_ettari, 0)
+        WHERE tipo_terreno = COALESCE(OLD.tipo_terreno, 'Non specificato');
+    DELETE FROM stats_terreni_tipo WHERE tipo_terreno = COALESCE(OLD.tipo_terreno, 'Non specificato') AND terreni = 0;
+'''
+_FINANZE_STATS_ADD = '''
+    UPDATE stats_summary SET
+        spese_totali = spese_totali + CASE WHEN NEW.tipo = 'Spesa' THEN NEW.importo ELSE 0 END,
+        ricavi_totali = ricavi_totali + CASE WHEN NEW.tipo = 'Ricavo' THEN NEW.importo ELSE 0 END WHERE id = 1;
+    INSERT INTO stats_finanze_mensili (mese, tipo, totale, operazioni)
+        VALUES (substr(NEW.data_operazione, 1, 7), NEW.tipo, NEW.importo, 1)
+        ON CONFLICT (mese, tipo) DO UPDATE SET totale = totale + excluded.totale, operazioni = operazioni + 1;
+'''
+_FINANZE_STATS_REMOVE = '''
+    UPDATE stats_summary SET
+        spese_totali = spese_totali - CASE WHEN OLD.tipo = 'Spesa' THEN OLD.importo ELSE 0 END,
+        ricavi_totali = ricavi_totali - CASE WHEN OLD.tipo = 'Ricavo' THEN OLD.importo ELSE 0 END WHERE id = 1;
+    UPDATE stats_finanze_mensili SET totale = totale - OLD.importo, operazioni = operazioni - 1
+        WHERE mese = substr(OLD.data_operazione, 1, 7) AND tipo = OLD.tipo;
+    DELETE FROM stats_finanze_mensili
+        WHERE mese = substr(OLD.data_operazione, 1, 7) AND tipo = OLD.tipo AND operazioni = 0;
+'''
+
+# Trattori service interval in working hours (frozen in the migration 10 triggers)
+TRATTORI_TAGLIANDO_ORE = 250
+
+# Trigger bodies keeping the scadenze due queue in step with its sources; ref
+# is NEW or OLD. A manutenzione is due on the prossima_manutenzione of the most
+# recent maintenance of its object; the alert is re-armed when the date moves.
+_MANUTENZIONI_SCADENZA = '''
+    INSERT INTO scadenze (fonte, oggetto_tipo, oggetto_id, riga, scadenza)
+        SELECT 'manutenzioni', tipo_oggetto, oggetto_id, id, prossima_manutenzione FROM manutenzioni
+        WHERE tipo_oggetto = {ref}.tipo_oggetto AND oggetto_id = {ref}.oggetto_id
+        ORDER BY data_manutenzione DESC, id DESC LIMIT 1
+        ON CONFLICT (fonte, oggetto_tipo, oggetto_id) DO UPDATE SET riga = excluded.riga,
+            scadenza = excluded.scadenza,
+            avvisata_at = CASE WHEN scadenza IS excluded.scadenza THEN avvisata_at END;
+    DELETE FROM scadenze WHERE fonte = 'manutenzioni'
+        AND oggetto_tipo = {ref}.tipo_oggetto AND oggetto_id = {ref}.oggetto_id
+        AND (scadenza IS NULL OR riga NOT IN (SELECT id FROM manutenzioni
+                                              WHERE tipo_oggetto = {ref}.tipo_oggetto AND oggetto_id = {ref}.oggetto_id));
+'''
+_MAGAZZINO_SCADENZA = '''
+    INSERT INTO scadenze (fonte, oggetto_tipo, oggetto_id, riga, scadenza)
+        SELECT 'magazzino', 'Prodotto', NEW.id, NEW.id, NEW.scadenza
+        WHERE NEW.scadenza IS NOT NULL AND NEW.quantita > 0
+        ON CONFLICT (fonte, oggetto_tipo, oggetto_id) DO UPDATE SET scadenza = excluded.scadenza,
+            avvisata_at = CASE WHEN scadenza IS excluded.scadenza THEN avvisata_at END;
+    DELETE FROM scadenze WHERE fonte = 'magazzino' AND oggetto_id = NEW.id
+        AND (NEW.scadenza IS NULL OR NEW.quantita <= 0);
+'''
+_TRATTORI_SCADENZA = f'''
+    INSERT INTO scadenze (fonte, oggetto_tipo, oggetto_id, riga, ore_residue)
+        VALUES ('trattori', 'Trattore', NEW.id, NEW.id,
+                {TRATTORI_TAGLIANDO_ORE} - COALESCE(NEW.ore_lavoro, 0) % {TRATTORI_TAGLIANDO_ORE})
+        ON CONFLICT (fonte, oggetto_tipo, oggetto_id) DO UPDATE SET ore_residue = excluded.ore_residue,
+            avvisata_at = CASE WHEN excluded.ore_residue <= ore_residue THEN avvisata_at END;
+'''
+
+def _create_scadenze_queue(conn):
+    """Due queue of manutenzioni, magazzino expiry dates and trattori service
+    hours, filled from existing rows and kept in step by triggers"""
+    conn.execute('''
+        CREATE TABLE scadenze (
+            fonte TEXT NOT NULL,
+            oggetto_tipo TEXT NOT NULL,
+            oggetto_id INTEGER NOT NULL,
+            riga INTEGER NOT NULL,
+            scadenza DATE,
+            ore_residue INTEGER,
+            avvisata_at TIMESTAMP,
+            PRIMARY KEY (fonte, oggetto_tipo, oggetto_id)
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_scadenze_data ON scadenze (scadenza)')
+    conn.execute('CREATE INDEX idx_scadenze_ore ON scadenze (ore_residue)')
+    # Only the entries not yet alerted, so the scheduler never walks old ones
+    conn.execute('CREATE INDEX idx_scadenze_avviso_data ON scadenze (scadenza) WHERE avvisata_at IS NULL')
+    conn.execute('CREATE INDEX idx_scadenze_avviso_ore ON scadenze (ore_residue) WHERE avvisata_at IS NULL')
+
+    manutenzioni_new = _MANUTENZIONI_SCADENZA.format(ref='NEW')
+    manutenzioni_old = _MANUTENZIONI_SCADENZA.format(ref='OLD')
+    for name, event, body in (
+        ('manutenzioni_scadenze_insert', 'INSERT ON manutenzioni', manutenzioni_new),
+        ('manutenzioni_scadenze_update', 'UPDATE ON manutenzioni', manutenzioni_old + manutenzioni_new),
+        ('manutenzioni_scadenze_delete', 'DELETE ON manutenzioni', manutenzioni_old),
+        ('magazzino_scadenze_insert', 'INSERT ON magazzino', _MAGAZZINO_SCADENZA),
+        ('magazzino_scadenze_update', 'UPDATE OF scadenza, quantita ON magazzino', _MAGAZZINO_SCADENZA),
+        ('magazzino_scadenze_delete', 'DELETE ON magazzino',
+         "DELETE FROM scadenze WHERE fonte = 'magazzino' AND oggetto_id = OLD.id;"),
+        ('trattori_scadenze_insert', 'INSERT ON trattori', _TRATTORI_SCADENZA),
+        ('trattori_scadenze_update', 'UPDATE OF ore_lavoro ON trattori', _TRATTORI_SCADENZA),
+        ('trattori_scadenze_delete', 'DELETE ON trattori',
+         "DELETE FROM scadenze WHERE fonte = 'trattori' AND oggetto_id = OLD.id;"),
+    ):
+        conn.execute(f'CREATE TRIGGER {name} AFTER {event} BEGIN {body} END')
+
+    conn.execute('''
+        INSERT INTO scadenze (fonte, oggetto_tipo, oggetto_id, riga, scadenza)
+        SELECT 'manutenzioni', tipo_oggetto, oggetto_id, id, prossima_manutenzione FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY tipo_oggetto, oggetto_id
+                                         ORDER BY data_manutenzione DESC, id DESC) AS n
+            FROM manutenzioni
+        ) WHERE n = 1 AND prossima_manutenzione IS NOT NULL
+    ''')
+    conn.execute('''
+        INSERT INTO scadenze (fonte, oggetto_tipo, oggetto_id, riga, scadenza)
+        SELECT 'magazzino', 'Prodotto', id, id, scadenza FROM magazzino
+        WHERE scadenza IS NOT NULL AND quantita > 0
+    ''')
+    conn.execute(f'''
+        INSERT INTO scadenze (fonte, oggetto_tipo, oggetto_id, riga, ore_residue)
+        SELECT 'trattori', 'Trattore', id, id,
+               {TRATTORI_TAGLIANDO_ORE} - COALESCE(ore_lavoro, 0) % {TRATTORI_TAGLIANDO_ORE}
+        FROM trattori
+    ''')
+
+# Time series kept in series_rollups by migration 12 (frozen like
+# _VERSIONED_TABLES): name -> source table, time and value columns, row
+# filter ({row} is NEW, OLD or the table) and rollup steps, finest first;
+# dates marks a time column holding dates without a time
+SERIES = {
+    'numbers': {'table': 'numbers', 'time': 'created_at', 'value': 'value',
+                'where': '1', 'steps': ('hour', 'day', 'month')},
+    'spese': {'table': 'finanze', 'time': 'data_operazione', 'value': 'importo',
+              'where': "{row}.tipo = 'Spesa'", 'steps': ('day', 'month'), 'dates': True},
+    'ricavi': {'table': 'finanze', 'time': 'data_operazione', 'value': 'importo',
+               'where': "{row}.tipo = 'Ricavo'", 'steps': ('day', 'month'), 'dates': True},
+}
+
+# Rollup step -> bucket of a timestamp {t}, and the start of the bucket after {b}
+ROLLUP_STEPS = {
+    'hour': ("strftime('%Y-%m-%d %H:00:00', {t})", "datetime({b}, '+1 hour')"),
+    'day': ('date({t})', "date({b}, '+1 day')"),
+    'month': ("strftime('%Y-%m-01', {t})", "date({b}, '+1 month')"),
+}
+
+def _series_add(name):
+    spec = SERIES[name]
+    t, v = f"NEW.{spec['time']}", f"NEW.{spec['value']}"
+    return ''.join(f'''
+    INSERT INTO series_rollups (serie, step, bucket, count, sum, min, max)
+        SELECT '{name}', '{step}', {ROLLUP_STEPS[step][0].format(t=t)}, 1, {v}, {v}, {v}
+        WHERE {spec['where'].format(row='NEW')} AND {ROLLUP_STEPS[step][0].format(t=t)} IS NOT NULL
+        ON CONFLICT (serie, step, bucket) DO UPDATE SET count = count + 1, sum = sum + excluded.sum,
+            min = MIN(min, excluded.min), max = MAX(max, excluded.max);'''
+        for step in spec['steps'])
+
+def _series_remove(name):
+    """Take OLD out of its buckets. min/max are recomputed only when OLD was
+    the extreme, and then from the finer level: the source rows of the bucket
+    for the finest step, the (already updated) finer rollups above it."""
+    spec = SERIES[name]
+    t, v = f"OLD.{spec['time']}", f"OLD.{spec['value']}"
+    body = ''
+    finer = None
+    for step in spec['steps']:
+        bucket = ROLLUP_STEPS[step][0].format(t=t)
+        end = ROLLUP_STEPS[step][1].format(b='series_rollups.bucket')
+        if finer is None:
+            extreme = (f"(SELECT {{agg}}({spec['value']}) FROM {spec['table']} "
+                       f"WHERE {spec['time']} >= series_rollups.bucket AND {spec['time']} < {end} "
+                       f"AND {spec['where'].format(row=spec['table'])})")
+        else:
+            extreme = (f"(SELECT {{agg}}(r.{{agg}}) FROM series_rollups AS r WHERE r.serie = '{name}' "
+                       f"AND r.step = '{finer}' AND r.bucket >= series_rollups.bucket AND r.bucket < {end})")
+        body += f'''
+    UPDATE series_rollups SET count = count - 1, sum = sum - {v},
+        min = CASE WHEN {v} > min THEN min ELSE {extreme.format(agg='min')} END,
+        max = CASE WHEN {v} < max THEN max ELSE {extreme.format(agg='max')} END
+        WHERE serie = '{name}' AND step = '{step}' AND bucket = {bucket} AND {spec['where'].format(row='OLD')};
+    DELETE FROM series_rollups WHERE serie = '{name}' AND step = '{step}' AND bucket = {bucket} AND count <= 0;'''
+        finer = step
+    return body
+
+def _create_series_rollups(conn):
+    """Hour/day/month count, sum, min and max of the SERIES, filled from the
+    existing rows and kept in step by triggers. Rows deleted while
+    series_archiving holds a row (archive_old_rows) stay in the rollups."""
+    conn.execute('''
+        CREATE TABLE series_rollups (
+            serie TEXT NOT NULL,
+            step TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL,
+            max REAL,
+            PRIMARY KEY (serie, step, bucket)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE TABLE series_archiving (id INTEGER PRIMARY KEY)')
+
+    for name, spec in SERIES.items():
+        for step in spec['steps']:
+            bucket = ROLLUP_STEPS[step][0].format(t=spec['time'])
+            conn.execute(f'''
+                INSERT INTO series_rollups (serie, step, bucket, count, sum, min, max)
+                SELECT '{name}', '{step}', {bucket}, COUNT(*), SUM({spec['value']}),
+                       MIN({spec['value']}), MAX({spec['value']})
+                FROM {spec['table']}
+                WHERE {spec['where'].format(row=spec['table'])} AND {bucket} IS NOT NULL
+                GROUP BY 3
+            ''')
+    _create_series_triggers(conn)
+
+def _create_series_triggers(conn):
+    """(Re)create the triggers that keep series_rollups in step. Rows whose
+    time has no bucket (NULL or not an ISO date) are left out of the series."""
+    for table, columns in (('numbers', 'created_at, value'), ('finanze', 'tipo, importo, data_operazione')):
+        names = [name for name, spec in SERIES.items() if spec['table'] == table]
+        add = ''.join(_series_add(name) for name in names)
+        remove = ''.join(_series_remove(name) for name in names)
+        for kind in ('ins', 'del', 'upd'):
+            conn.execute(f'DROP TRIGGER IF EXISTS series_{table}_{kind}')
+        conn.execute(f'CREATE TRIGGER series_{table}_ins AFTER INSERT ON {table} BEGIN {add} END')
+        conn.execute(f'''CREATE TRIGGER series_{table}_del AFTER DELETE ON {table}
+                         WHEN NOT EXISTS (SELECT 1 FROM series_archiving) BEGIN {remove} END''')
+        conn.execute(f'CREATE TRIGGER series_{table}_upd AFTER UPDATE OF {columns} ON {table} BEGIN {remove} {add} END')
+
+# Tables given version triggers by migration 4 (frozen: later tables need a new step)
+_VERSIONED_TABLES = ('numbers', 'terreni', 'trattori', 'attrezzi', 'animali', 'colture',
+                     'personale', 'magazzino', 'manutenzioni', 'finanze')
+
+# Ordered schema changes applied on top of the tables created by init_db().
+# Each step is (version, description, SQL statements or a callable taking the
+# connection). Append new steps at the end; never edit or renumber applied ones.
+MIGRATIONS = [
+    (1, 'Add geometria column to terreni', _add_terreni_geometria),
+    (2, 'Indexes for list, filter and stats queries', [
+        # Replaced by wider versions below
+        'DROP INDEX IF EXISTS idx_colture_terreno',
+        'DROP INDEX IF EXISTS idx_finanze_tipo',
+
+        'CREATE INDEX IF NOT EXISTS idx_numbers_created ON numbers (created_at)',
+
+        'CREATE INDEX IF NOT EXISTS idx_terreni_created ON terreni (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_terreni_tipo ON terreni (tipo_terreno, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_terreni_catasto ON terreni (foglio, particella)',
+        'CREATE INDEX IF NOT EXISTS idx_terreni_superficie ON terreni (tipo_terreno, superficie_ettari)',
+
+        'CREATE INDEX IF NOT EXISTS idx_trattori_created ON trattori (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_trattori_stato ON trattori (stato, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_trattori_marca ON trattori (marca, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_trattori_acquisto ON trattori (data_acquisto)',
+
+        'CREATE INDEX IF NOT EXISTS idx_attrezzi_created ON attrezzi (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_attrezzi_tipo ON attrezzi (tipo, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_attrezzi_stato ON attrezzi (stato, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_attrezzi_manutenzione ON attrezzi (ultima_manutenzione)',
+
+        'CREATE INDEX IF NOT EXISTS idx_animali_created ON animali (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_animali_specie ON animali (specie, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_animali_sesso ON animali (sesso, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_animali_salute ON animali (stato_salute, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_animali_nascita ON animali (data_nascita)',
+
+        'CREATE INDEX IF NOT EXISTS idx_colture_created ON colture (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_colture_stato ON colture (stato, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_colture_terreno_created ON colture (terreno_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_colture_tipo ON colture (tipo_coltura, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_colture_semina ON colture (data_semina)',
+
+        'CREATE INDEX IF NOT EXISTS idx_personale_nome ON personale (cognome, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_personale_ruolo ON personale (ruolo, cognome, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_personale_contratto ON personale (tipo_contratto, cognome, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_personale_assunzione ON personale (data_assunzione)',
+
+        'CREATE INDEX IF NOT EXISTS idx_magazzino_categoria ON magazzino (categoria, nome_prodotto)',
+        'CREATE INDEX IF NOT EXISTS idx_magazzino_fornitore ON magazzino (fornitore, categoria, nome_prodotto)',
+        'CREATE INDEX IF NOT EXISTS idx_magazzino_scadenza ON magazzino (scadenza)',
+
+        'CREATE INDEX IF NOT EXISTS idx_manutenzioni_data ON manutenzioni (data_manutenzione)',
+        'CREATE INDEX IF NOT EXISTS idx_manutenzioni_oggetto ON manutenzioni (tipo_oggetto, oggetto_id)',
+        'CREATE INDEX IF NOT EXISTS idx_manutenzioni_tipo ON manutenzioni (tipo_manutenzione, data_manutenzione)',
+
+        'CREATE INDEX IF NOT EXISTS idx_finanze_data ON finanze (data_operazione)',
+        'CREATE INDEX IF NOT EXISTS idx_finanze_tipo_importo ON finanze (tipo, data_operazione, importo)',
+        'CREATE INDEX IF NOT EXISTS idx_finanze_categoria ON finanze (categoria, data_operazione)',
+        'CREATE INDEX IF NOT EXISTS idx_finanze_metodo ON finanze (metodo_pagamento, data_operazione)',
+    ]),
+    (3, 'Trigger-maintained summary tables behind /api/stats', [
+        '''CREATE TABLE stats_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            terreni_count INTEGER NOT NULL DEFAULT 0,
+            terreni_superficie REAL NOT NULL DEFAULT 0,
+            trattori_count INTEGER NOT NULL DEFAULT 0,
+            attrezzi_count INTEGER NOT NULL DEFAULT 0,
+            animali_count INTEGER NOT NULL DEFAULT 0,
+            colture_attive INTEGER NOT NULL DEFAULT 0,
+            personale_count INTEGER NOT NULL DEFAULT 0,
+            spese_totali REAL NOT NULL DEFAULT 0,
+            ricavi_totali REAL NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TABLE stats_terreni_tipo (
+            tipo_terreno VARCHAR(50) PRIMARY KEY,
+            terreni INTEGER NOT NULL,
+            superficie REAL NOT NULL
+        )''',
+        '''CREATE TABLE stats_finanze_mensili (
+            mese VARCHAR(7) NOT NULL,
+            tipo VARCHAR(20) NOT NULL,
+            totale REAL NOT NULL,
+            operazioni INTEGER NOT NULL,
+            PRIMARY KEY (mese, tipo)
+        )''',
+
+        # Backfill from the existing rows (the only full scans ever needed)
+        '''INSERT INTO stats_summary VALUES (1,
+            (SELECT COUNT(*) FROM terreni),
+            (SELECT COALESCE(SUM(superficie_ettari), 0) FROM terreni),
+            (SELECT COUNT(*) FROM trattori),
+            (SELECT COUNT(*) FROM attrezzi),
+            (SELECT COUNT(*) FROM animali),
+            (SELECT COUNT(*) FROM colture WHERE stato = 'In corso'),
+            (SELECT COUNT(*) FROM personale),
+            (SELECT COALESCE(SUM(importo), 0) FROM finanze WHERE tipo = 'Spesa'),
+            (SELECT COALESCE(SUM(importo), 0) FROM finanze WHERE tipo = 'Ricavo'))''',
+        '''INSERT INTO stats_terreni_tipo
+            SELECT COALESCE(tipo_terreno, 'Non specificato'), COUNT(*), COALESCE(SUM(superficie_ettari), 0)
+            FROM terreni GROUP BY 1''',
+        '''INSERT INTO stats_finanze_mensili
+            SELECT substr(data_operazione, 1, 7), tipo, SUM(importo), COUNT(*)
+            FROM finanze GROUP BY 1, 2''',
+
+        f'CREATE TRIGGER stats_terreni_ins AFTER INSERT ON terreni BEGIN {_TERRENI_STATS_ADD} END',
+        f'CREATE TRIGGER stats_terreni_del AFTER DELETE ON terreni BEGIN {_TERRENI_STATS_REMOVE} END',
+        f'''CREATE TRIGGER stats_terreni_upd AFTER UPDATE OF superficie_ettari, tipo_terreno ON terreni
+            BEGIN {_TERRENI_STATS_REMOVE} {_TERRENI_STATS_ADD} END''',
+        f'CREATE TRIGGER stats_finanze_ins AFTER INSERT ON finanze BEGIN {_FINANZE_STATS_ADD} END',
+        f'CREATE TRIGGER stats_finanze_del AFTER DELETE ON finanze BEGIN {_FINANZE_STATS_REMOVE} END',
+        f'''CREATE TRIGGER stats_finanze_upd AFTER UPDATE OF tipo, importo, data_operazione ON finanze
+            BEGIN {_FINANZE_STATS_REMOVE} {_FINANZE_STATS_ADD} END''',
+        '''CREATE TRIGGER stats_colture_ins AFTER INSERT ON colture BEGIN
+            UPDATE stats_summary SET colture_attive = colture_attive
+                + CASE WHEN NEW.stato = 'In corso' THEN 1 ELSE 0 END WHERE id = 1;
+        END''',
+        '''CREATE TRIGGER stats_colture_del AFTER DELETE ON colture BEGIN
+            UPDATE stats_summary SET colture_attive = colture_attive
+                - CASE WHEN OLD.stato = 'In corso' THEN 1 ELSE 0 END WHERE id = 1;
+        END''',
+        '''CREATE TRIGGER stats_colture_upd AFTER UPDATE OF stato ON colture BEGIN
+            UPDATE stats_summary SET colture_attive = colture_attive
+                - CASE WHEN OLD.stato = 'In corso' THEN 1 ELSE 0 END
+                + CASE WHEN NEW.stato = 'In corso' THEN 1 ELSE 0 END WHERE id = 1;
+        END''',
+    ] + [
+        f'''CREATE TRIGGER stats_{table}_{event[:3].lower()} AFTER {event} ON {table} BEGIN
+            UPDATE stats_summary SET {table}_count = {table}_count {sign} 1 WHERE id = 1;
+        END'''
+        for table in ('trattori', 'attrezzi', 'animali', 'personale')
+        for event, sign in (('INSERT', '+'), ('DELETE', '-'))
+    ]),
+    (4, 'Per-table version counters for conditional GETs', [
+        '''CREATE TABLE table_versions (
+            table_name VARCHAR(50) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ] + [
+        f"INSERT INTO table_versions (table_name, version) VALUES ('{table}', 1)"
+        for table in _VERSIONED_TABLES
+    ] + [
+        f'''CREATE TRIGGER version_{table}_{event[:3].lower()} AFTER {event} ON {table} BEGIN
+            UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+        END'''
+        for table in _VERSIONED_TABLES
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (5, 'R-tree spatial index and cached area/centroid for terreni', _create_terreni_spatial_index),
+    (6, 'Parent indexes for animali pedigree queries', [
+        'CREATE INDEX IF NOT EXISTS idx_animali_padre ON animali (padre_id)',
+        'CREATE INDEX IF NOT EXISTS idx_animali_madre ON animali (madre_id)',
+    ]),
+    (7, 'FTS5 search index over the farm tables', _create_search_index),
+    (8, 'Background report jobs', [
+        '''CREATE TABLE report_jobs (
+            id TEXT PRIMARY KEY,
+            report TEXT NOT NULL,
+            params TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )''',
+        'CREATE INDEX idx_report_jobs_cache ON report_jobs (cache_key, created_at)',
+        'CREATE INDEX idx_report_jobs_created ON report_jobs (created_at)',
+    ]),
+    (9, 'Change log for incremental sync', [
+        '''CREATE TABLE change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabella TEXT NOT NULL,
+            riga INTEGER NOT NULL,
+            operazione TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'CREATE INDEX idx_change_log_created ON change_log (created_at)',
+    ] + [
+        f'''CREATE TRIGGER changes_{table}_{event[:3].lower()} AFTER {event} ON {table} BEGIN
+            INSERT INTO change_log (tabella, riga, operazione)
+                VALUES ('{table}', {'OLD' if event == 'DELETE' else 'NEW'}.id, '{event.lower()}');
+        END'''
+        for table in _VERSIONED_TABLES if table != 'numbers'
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (10, 'Due queue for scheduled maintenance and expiry alerts', _create_scadenze_queue),
+    (11, 'Last run of the database maintenance tasks', [
+        '''CREATE TABLE maintenance_runs (
+            task TEXT PRIMARY KEY,
+            status TEXT,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            duration_s REAL,
+            detail TEXT,
+            error TEXT
+        )''',
+    ]),
+    (12, 'Hour/day/month rollups of the numbers and finanze time series', _create_series_rollups),
+    (13, 'Series triggers skip rows whose date has no bucket', _create_series_triggers),
+]
+
+def schema_version(conn):
+    """Highest migration version applied to the database (0 if none)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction, then refresh
+    the planner statistics. Returns the list of versions applied."""
+    current = schema_version(conn)
+    applied = []
+
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN')
+        try:
+            if callable(step):
+                step(conn)
+            else:
+                for statement in step:
+                    conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    if applied:
+        conn.execute('ANALYZE')
+        conn.commit()
+    return applied
+
+# ============= JSON SERIALIZATION =============
+
+# Rows encoded per chunk of a streamed JSON array
+STREAM_CHUNK_ROWS = 500
+
+JSON_FORMATS = ('json', 'columnar')
+
+def dumps(value):
+    """Compact JSON bytes of value, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+def json_format():
+    """?format= of a JSON list endpoint: 'json' (array of objects, default)
+    or 'columnar' ({"columns": [...], "rows": [[...], ...]})"""
+    fmt = request.args.get('format', 'json')
+    if fmt not in JSON_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(JSON_FORMATS)}")
+    return fmt
+
+def encode_rows(rows, fields, fmt='json'):
+    """Yield the JSON document of rows in chunks of STREAM_CHUNK_ROWS.
+
+    rows may be a cursor: it is consumed as the chunks are sent, so memory
+    stays flat whatever the number of rows.
+    """
+    columnar = fmt == 'columnar'
+    if isinstance(rows, list):
+        chunks = (rows[i:i + STREAM_CHUNK_ROWS] for i in range(0, len(rows), STREAM_CHUNK_ROWS))
+    else:
+        chunks = iter(lambda: rows.fetchmany(STREAM_CHUNK_ROWS), [])
+
+    yield b'{"columns":' + dumps(fields) + b',"rows":[' if columnar else b'['
+    separator = b''
+    for chunk in chunks:
+        if columnar:
+            values = [[row[f] for f in fields] for row in chunk]
+        else:
+            values = [{f: row[f] for f in fields} for row in chunk]
+        yield separator + dumps(values)[1:-1]
+        separator = b','
+    yield b']}' if columnar else b']'
+
+def rows_response(rows, fields, fmt='json', stream=True):
+    """JSON response of rows: streamed from the cursor, or buffered (so it
+    can be compressed whole and sized) for result sets already bounded"""
+    body = encode_rows(rows, fields, fmt)
+    if stream:
+        return Response(stream_with_context(body), mimetype='application/json')
+    return Response(b''.join(body), mimetype='application/json')
+
+def json_response(value, status=200):
+    return Response(dumps(value), status=status, mimetype='application/json')
+
+# ============= LIST QUERIES =============
+
+MAX_PAGE_SIZE = 1000
+MAX_IDS = 500
+
+# Per-table list behaviour: the ORDER BY keys (id breaks ties and makes the
+# keyset cursor unique), the columns accepted as ?<column>= equality filters,
+# the date column behind ?from=/?to=, and computed columns joined in.
+LIST_SPECS = {
+    'terreni': {
+        'order': ('created_at', 'id'), 'desc': True,
+        'filters': ('tipo_terreno', 'foglio'), 'date': 'created_at',
+        'extra': {'has_geometria': "terreni.geometria IS NOT NULL AND terreni.geometria != 'null'"},
+    },
+    'trattori': {
+        'order': ('created_at', 'id'), 'desc': True,
+        'filters': ('stato', 'marca'), 'date': 'data_acquisto',
+    },
+    'attrezzi': {
+        'order': ('created_at', 'id'), 'desc': True,
+        'filters': ('tipo', 'stato'), 'date': 'ultima_manutenzione',
+    },
+    'animali': {
+        'order': ('created_at', 'id'), 'desc': True,
+        'filters': ('specie', 'sesso', 'stato_salute'), 'date': 'data_nascita',
+    },
+    'colture': {
+        'order': ('created_at', 'id'), 'desc': True,
+        'filters': ('stato', 'terreno_id', 'tipo_coltura'), 'date': 'data_semina',
+        'join': 'LEFT JOIN terreni t ON colture.terreno_id = t.id',
+        'extra': {'nome_terreno': 't.nome'},
+    },
+    'personale': {
+        'order': ('cognome', 'nome', 'id'), 'desc': False,
+        'filters': ('ruolo', 'tipo_contratto'), 'date': 'data_assunzione',
+    },
+    'magazzino': {
+        'order': ('categoria', 'nome_prodotto', 'id'), 'desc': False,
+        'filters': ('categoria', 'fornitore'), 'date': 'scadenza',
+    },
+    'manutenzioni': {
+        'order': ('data_manutenzione', 'id'), 'desc': True,
+        'filters': ('tipo_oggetto', 'oggetto_id', 'tipo_manutenzione'), 'date': 'data_manutenzione',
+    },
+    'finanze': {
+        'order': ('data_operazione', 'id'), 'desc': True,
+        'filters': ('tipo', 'categoria', 'metodo_pagamento'), 'date': 'data_operazione',
+    },
+}
+
+_table_columns = {}
+
+def column_types(conn, table):
+    """Declared type of each column of a table, read once from the schema"""
+    if table not in _table_columns:
+        _table_columns[table] = {row['name']: row['type'].upper()
+                                 for row in conn.execute(f'PRAGMA table_info({table})')}
+    return _table_columns[table]
+
+def table_columns(conn, table):
+    """Column names of a table"""
+    return list(column_types(conn, table))
+
+def encode_cursor(values):
+    """Opaque cursor for the sort key of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+def parse_date(value, name):
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
+    return value
+
+def build_list_query(conn, table, args):
+    """Build the SELECT behind a list endpoint from the request arguments.
+
+    Supports ?fields=a,b (projection), ?ids=1,5,9 (batched primary-key
+    lookup), ?<filter>=value, ?from=/?to= on the table's date column, and
+    ?limit=N&cursor=... keyset pagination. Returns
+    (sql, params, fields, limit); limit is None when the caller did not ask
+    for a page. Raises ValueError on bad input.
+    """
+    spec = LIST_SPECS[table]
+    extra = spec.get('extra', {})
+    available = {c: f'{table}.{c}' for c in table_columns(conn, table)}
+    available.update(extra)
+
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in available]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    else:
+        fields = list(available)
+
+    # The sort key is always selected so the next cursor can be computed
+    selected = fields + [k for k in spec['order'] if k not in fields]
+    sql = f"SELECT {', '.join(f'{available[c]} AS {c}' for c in selected)} FROM {table}"
+    if spec.get('join'):
+        sql += ' ' + spec['join']
+
+    where, params = [], []
+    if args.get('ids'):
+        try:
+            ids = [int(v) for v in args['ids'].split(',')]
+        except ValueError:
+            raise ValueError('ids must be a comma-separated list of integers')
+        if len(ids) > MAX_IDS:
+            raise ValueError(f'At most {MAX_IDS} ids per request')
+        where.append(f"{table}.id IN ({', '.join('?' * len(ids))})")
+        params.extend(ids)
+    for column in spec['filters']:
+        if column in args:
+            where.append(f'{table}.{column} = ?')
+            params.append(args[column])
+    if 'from' in args:
+        where.append(f"{table}.{spec['date']} >= ?")
+        params.append(parse_date(args['from'], 'from'))
+    if 'to' in args:
+        where.append(f"{table}.{spec['date']} < date(?, '+1 day')")
+        params.append(parse_date(args['to'], 'to'))
+
+    limit = None
+    if 'limit' in args:
+        try:
+            limit = int(args['limit'])
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    keys = ', '.join(f'{table}.{k}' for k in spec['order'])
+    direction = 'DESC' if spec['desc'] else 'ASC'
+    if args.get('cursor'):
+        if limit is None:
+            raise ValueError('cursor requires limit')
+        values = decode_cursor(args['cursor'], len(spec['order']))
+        where.append(f"({keys}) {'<' if spec['desc'] else '>'} ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f'{table}.{k} {direction}' for k in spec['order'])
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    return sql, params, fields, limit
+
+def list_response(table):
+    """JSON array response for a list endpoint (with ?format=columnar, a
+    columns/rows object).
+
+    When the page is not the last one the cursor for the next page is
+    returned in the X-Next-Cursor header, keeping the body a plain array.
+    """
+    conn = read_db()
+    try:
+        sql, params, fields, limit = build_list_query(conn, table, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        fmt = json_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cursor = conn.execute(sql, params)
+    if limit is None:
+        # Whole table: streamed from the cursor, one chunk in memory at a time
+        return rows_response(cursor, fields, fmt)
+
+    rows = cursor.fetchall()  # at most MAX_PAGE_SIZE + 1
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][k] for k in LIST_SPECS[table]['order'])
+
+    response = rows_response(rows, fields, fmt, stream=False)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def item_response(table, id):
+    """JSON object for one row looked up by primary key (404 if missing).
+    Honours ?fields= like the list endpoint."""
+    conn = read_db()
+    try:
+        sql, params, fields, _ = build_list_query(conn, table, {'ids': str(id), 'fields': request.args.get('fields')})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    row = conn.execute(sql, params).fetchone()
+    if row is None:
+        return jsonify({'error': 'Record not found'}), 404
+    return json_response({f: row[f] for f in fields})
+
+# ============= METRICS AND PROFILING =============
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'requests': collections.Counter(),    # (endpoint, method, status) -> count
+    'latency': {},                        # endpoint -> [bucket counts..., +Inf count, sum]
+    'sql_queries': collections.Counter(),  # endpoint -> statements executed
+    'sql_seconds': collections.Counter(),  # endpoint -> time in execute/fetch
+    'sql_rows': collections.Counter(),     # endpoint -> rows fetched
+    'response_bytes': collections.Counter(),
+    'alerts': collections.Counter(),      # fonte -> scadenze alerts raised
+    'maintenance': collections.Counter(),  # (task, status) -> runs
+    'rejected': collections.Counter(),    # reason -> requests refused by admission control
+}
+
+def _charge_sql(seconds, queries=0, rows=0):
+    """Add SQL work to the counters of the request in progress, if any"""
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += queries
+        g.sql_seconds += seconds
+        g.sql_rows += rows
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that charges statement time and fetched rows to the current request"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _charge_sql(time.perf_counter() - start, queries=1)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _charge_sql(time.perf_counter() - start, queries=1)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        _charge_sql(time.perf_counter() - start, rows=row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _charge_sql(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        _charge_sql(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        _charge_sql(time.perf_counter() - start, rows=1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose shortcut execute methods go through InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class StackSampler:
+    """Sampling profiler for in-flight requests.
+
+    A daemon thread snapshots the stacks of the registered request threads
+    every PROFILE_INTERVAL_MS; requests slower than PROFILE_SLOW_MS are
+    written to PROFILE_DIR in collapsed-stack format, ready for
+    flamegraph.pl or speedscope.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.pid = None
+
+    def start(self, ident):
+        with self.lock:
+            if self.pid != os.getpid():
+                # First request in this (possibly forked) process
+                self.pid = os.getpid()
+                self.active = {}
+                threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+            self.active[ident] = collections.Counter()
+
+    def stop(self, ident):
+        with self.lock:
+            return self.active.pop(ident, None)
+
+    def _run(self):
+        interval = app.config['PROFILE_INTERVAL_MS'] / 1000
+        while True:
+            time.sleep(interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, samples in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[collapse_stack(frame)] += 1
+
+_sampler = StackSampler()
+
+def collapse_stack(frame):
+    """Stack of a frame as 'outer;...;inner' with function (file:line) entries"""
+    entries = []
+    while frame is not None:
+        code = frame.f_code
+        entries.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(entries))
+
+def dump_profile(endpoint, duration, samples):
+    """Write the samples of a slow request as a .folded file"""
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', endpoint).strip('_') or 'root'
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(app.config['PROFILE_DIR'], f'{stamp}-{name}-{int(duration * 1000)}ms.folded')
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+
+@app.before_request
+def start_request_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return
+    g.request_start = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+    g.sql_rows = 0
+    if app.config['PROFILE_SLOW_MS'] > 0:
+        _sampler.start(threading.get_ident())
+
+def record_request_metrics(status, response_bytes):
+    """Fold the counters of the finished request into the process-wide metrics"""
+    if 'request_start' not in g:
+        return
+    duration = time.perf_counter() - g.pop('request_start')
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+
+    with _metrics_lock:
+        _metrics['requests'][(endpoint, request.method, status)] += 1
+        histogram = _metrics['latency'].setdefault(endpoint, [0] * (len(LATENCY_BUCKETS) + 2))
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        histogram[-1] += duration
+        _metrics['sql_queries'][endpoint] += g.sql_queries
+        _metrics['sql_seconds'][endpoint] += g.sql_seconds
+        _metrics['sql_rows'][endpoint] += g.sql_rows
+        _metrics['response_bytes'][endpoint] += response_bytes
+
+    if app.config['PROFILE_SLOW_MS'] > 0:
+        samples = _sampler.stop(threading.get_ident())
+        if samples and duration * 1000 >= app.config['PROFILE_SLOW_MS']:
+            dump_profile(endpoint, duration, samples)
+
+@app.after_request
+def finish_request_metrics(response):
+    # Registered before compress_response, so it runs after it and counts
+    # the bytes actually sent; streamed bodies are not counted (sizing them
+    # would make werkzeug buffer the whole stream)
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+    record_request_metrics(response.status_code, size)
+    return response
+
+@app.teardown_request
+def abort_request_metrics(exception):
+    """Requests that raised never reach after_request; count them as 500"""
+    record_request_metrics(500, 0)
+
+def _labels(**labels):
+    # Every sample carries the worker's pid: each scrape is answered by one
+    # worker, and without it the counters of two workers would look like resets
+    return ','.join(f'{k}="{v}"' for k, v in {'worker': os.getpid(), **labels}.items())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the metrics of this worker process,
+    labelled with its pid (worker="...")"""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    with _metrics_lock:
+        family('farm_http_requests_total', 'counter', 'HTTP requests by endpoint, method and status.')
+        for (endpoint, method, status), count in sorted(_metrics['requests'].items()):
+            labels = _labels(endpoint=endpoint, method=method, status=status)
+            lines.append(f'farm_http_requests_total{{{labels}}} {count}')
+
+        family('farm_http_request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+        for endpoint, histogram in sorted(_metrics['latency'].items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+                cumulative += count
+                labels = _labels(endpoint=endpoint, le=bound)
+                lines.append(f'farm_http_request_duration_seconds_bucket{{{labels}}} {cumulative}')
+            lines.append(f'farm_http_request_duration_seconds_sum{{{_labels(endpoint=endpoint)}}} {histogram[-1]:.6f}')
+            lines.append(f'farm_http_request_duration_seconds_count{{{_labels(endpoint=endpoint)}}} {cumulative}')
+
+        for key, name, kind, help_text in (
+            ('sql_queries', 'farm_sql_queries_total', 'counter', 'SQL statements executed by endpoint.'),
+            ('sql_seconds', 'farm_sql_duration_seconds_total', 'counter',
+             'Time spent executing and fetching SQL by endpoint.'),
+            ('sql_rows', 'farm_sql_rows_total', 'counter', 'Rows fetched from SQLite by endpoint.'),
+            ('response_bytes', 'farm_http_response_bytes_total', 'counter', 'Response body bytes by endpoint.'),
+        ):
+            family(name, kind, help_text)
+            for endpoint, value in sorted(_metrics[key].items()):
+                lines.append(f'{name}{{{_labels(endpoint=endpoint)}}} {value:.6f}' if isinstance(value, float)
+                             else f'{name}{{{_labels(endpoint=endpoint)}}} {value}')
+
+        family('farm_startup_seconds', 'gauge', 'Wall time of each startup phase of the process.')
+        for phase in ('import', 'schema', 'ready'):
+            if phase in _startup:
+                lines.append(f'farm_startup_seconds{{{_labels(phase=phase)}}} {_startup[phase]:.6f}')
+        if 'cpu' in _startup:
+            family('farm_startup_cpu_seconds', 'gauge', 'CPU time used by the process until it was ready.')
+            lines.append(f"farm_startup_cpu_seconds{{{_labels()}}} {_startup['cpu']:.6f}")
+
+        family('farm_alerts_total', 'counter', 'Scadenze alerts raised by source table.')
+        for fonte, count in sorted(_metrics['alerts'].items()):
+            lines.append(f'farm_alerts_total{{{_labels(fonte=fonte)}}} {count}')
+
+        family('farm_maintenance_runs_total', 'counter', 'Maintenance task runs by task and status.')
+        for (task, status), count in sorted(_metrics['maintenance'].items()):
+            lines.append(f'farm_maintenance_runs_total{{{_labels(task=task, status=status)}}} {count}')
+
+        family('farm_requests_rejected_total', 'counter', 'Requests refused with 429/503 by reason.')
+        for reason, count in sorted(_metrics['rejected'].items()):
+            lines.append(f'farm_requests_rejected_total{{{_labels(reason=reason)}}} {count}')
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# ============= HTTP CACHING AND COMPRESSION =============
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'application/geo+json',
+                          'text/csv', 'text/html', 'text/plain'}
+
+def data_version(conn, tables):
+    """(version key, last modified) of a set of tables from table_versions"""
+    placeholders = ', '.join('?' * len(tables))
+    rows = conn.execute(f'''SELECT table_name, version, updated_at FROM table_versions
+                            WHERE table_name IN ({placeholders}) ORDER BY table_name''', tables).fetchall()
+    key = ','.join(f"{row['table_name']}:{row['version']}" for row in rows)
+    last_modified = max((row['updated_at'] for row in rows), default=None)
+    if last_modified:
+        last_modified = datetime.strptime(last_modified, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return key, last_modified
+
+def negotiate_encoding():
+    """Best content coding the client accepts: br (if brotli is installed), gzip or None"""
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def conditional(*tables):
+    """Serve a GET endpoint with a strong ETag and Last-Modified derived from
+    the versions of the tables it reads, answering 304 Not Modified without
+    running the view when the client copy is current."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key, last_modified = data_version(read_db(), tables)
+            # The representation also depends on the query string and the coding
+            seed = f'{key}|{request.full_path}|{negotiate_encoding()}'
+            etag = hashlib.sha1(seed.encode()).hexdigest()[:20]
+
+            # If-Modified-Since only when the client has no ETag to compare
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = bool(last_modified and request.if_modified_since
+                                    and last_modified <= request.if_modified_since)
+            response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+
+            # updated_at has one-second resolution: while its second is still
+            # running, a later write would keep the same value, so the copy is
+            # dated a second earlier and such a write then counts as modified
+            if last_modified and last_modified >= datetime.now(timezone.utc).replace(microsecond=0):
+                last_modified -= timedelta(seconds=1)
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.headers['Cache-Control'] = 'no-cache'
+                response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
+
+def compress_stream(chunks, encoding):
+    """Compress a streamed body chunk by chunk, flushing after each one so
+    the client receives the data as it is produced"""
+    level = app.config['COMPRESS_LEVEL']
+    chunks = (chunk.encode() if isinstance(chunk, str) else chunk for chunk in chunks)
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli-encode buffered responses above COMPRESS_MIN_SIZE, and
+    streamed ones as they are produced"""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = negotiate_encoding()
+    if (encoding is None or response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers['Content-Encoding'] = encoding
+        return response
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=app.config['COMPRESS_LEVEL'])
+    else:
+        data = gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'])
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# ============= TERRENI GEOMETRY =============
+
+EARTH_RADIUS_M = 6371008.8
+
+# Pixels of error tolerated when simplifying for a zoom level
+SIMPLIFY_PIXELS = 1.0
+
+def parse_geometry(value):
+    """Normalise an incoming geometria (GeoJSON object or text) to
+    (geometry dict, json text), keeping only the geometry of a Feature or
+    FeatureCollection. Raises ValueError if it is not GeoJSON."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError('geometria is not valid JSON')
+    if not isinstance(value, dict) or 'type' not in value:
+        raise ValueError('geometria must be a GeoJSON object')
+    try:
+        geometry_metrics(value)
+    except (IndexError, TypeError, ValueError) as e:
+        raise ValueError(f'geometria is not valid GeoJSON: {e}')
+    value = bare_geometry(value)
+    return value, json.dumps(value)
+
+def bare_geometry(geojson):
+    """The geometry of a GeoJSON object: a Feature's own, a GeometryCollection
+    of the features of a FeatureCollection, a geometry as it is; None for a
+    Feature without geometry"""
+    kind = geojson.get('type')
+    if kind == 'Feature':
+        return geojson.get('geometry') or None
+    if kind == 'FeatureCollection':
+        return {'type': 'GeometryCollection',
+                'geometries': [g for g in (bare_geometry(f) for f in geojson['features']) if g]}
+    return geojson
+
+def geometry_polygons(geojson):
+    """Yield each polygon of a GeoJSON object as a list of rings (exterior first)"""
+    kind = geojson.get('type')
+    if kind == 'FeatureCollection':
+        for feature in geojson.get('features') or []:
+            yield from geometry_polygons(feature)
+    elif kind == 'Feature':
+        if geojson.get('geometry'):
+            yield from geometry_polygons(geojson['geometry'])
+    elif kind == 'GeometryCollection':
+        for geometry in geojson.get('geometries') or []:
+            yield from geometry_polygons(geometry)
+    elif kind == 'Polygon':
+        yield geojson['coordinates']
+    elif kind == 'MultiPolygon':
+        yield from geojson['coordinates']
+
+def geometry_rings(geojson):
+    """Yield every coordinate sequence of a GeoJSON object"""
+    kind = geojson.get('type')
+    try:
+        if kind == 'FeatureCollection':
+            for feature in geojson['features']:
+                yield from geometry_rings(feature)
+        elif kind == 'Feature':
+            if geojson.get('geometry'):
+                yield from geometry_rings(geojson['geometry'])
+        elif kind == 'GeometryCollection':
+            for geometry in geojson['geometries']:
+                yield from geometry_rings(geometry)
+        elif kind == 'Point':
+            yield [geojson['coordinates']]
+        elif kind in ('LineString', 'MultiPoint'):
+            yield geojson['coordinates']
+        elif kind in ('Polygon', 'MultiLineString'):
+            yield from geojson['coordinates']
+        elif kind == 'MultiPolygon':
+            for polygon in geojson['coordinates']:
+                yield from polygon
+        else:
+            raise ValueError(f'Unsupported geometry type: {kind}')
+    except (KeyError, TypeError):
+        raise ValueError('Malformed GeoJSON')
+
+def _project(lon, lat, lat0):
+    """Local equirectangular projection to metres, accurate at parcel scale"""
+    k = math.pi / 180 * EARTH_RADIUS_M
+    return lon * k * math.cos(math.radians(lat0)), lat * k
+
+def _ring_area_centroid(ring, lat0):
+    """Signed area (m²) and centroid (lon, lat) of a ring via the shoelace formula"""
+    area = cx = cy = 0.0
+    points = [_project(p[0], p[1], lat0) for p in ring]
+    for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+        cross = x1 * y2 - x2 * y1
+        area += cross
+        cx += (x1 + x2) * cross
+        cy += (y1 + y2) * cross
+    area /= 2
+    if not area:
+        return 0.0, None
+    k = math.pi / 180 * EARTH_RADIUS_M
+    return area, (cx / (6 * area) / (k * math.cos(math.radians(lat0))), cy / (6 * area) / k)
+
+def geometry_metrics(geojson):
+    """Bounding box, area in m², area-weighted centroid and vertex count"""
+    lons, lats, vertici = [], [], 0
+    for ring in geometry_rings(geojson):
+        for point in ring:
+            lons.append(float(point[0]))
+            lats.append(float(point[1]))
+            vertici += 1
+    bbox = (min(lons), max(lons), min(lats), max(lats))
+    lat0 = (bbox[2] + bbox[3]) / 2
+
+    total = sx = sy = 0.0
+    for polygon in geometry_polygons(geojson):
+        for i, ring in enumerate(polygon):
+            area, centroid = _ring_area_centroid(ring, lat0)
+            # Holes subtract from the exterior ring whatever their winding
+            area = abs(area) if i == 0 else -abs(area)
+            if centroid:
+                total += area
+                sx += centroid[0] * area
+                sy += centroid[1] * area
+    if total:
+        centroid = (sx / total, sy / total)
+    else:
+        centroid = ((bbox[0] + bbox[1]) / 2, lat0)
+    return bbox, total, centroid, vertici
+
+def index_terreno_geometry(conn, terreno_id, geometria):
+    """Store the bounding box of a parcel in the R-tree and cache its
+    area and centroid; called whenever a terreno with geometria is written."""
+    if not geometria:
+        return
+    geojson, _ = parse_geometry(geometria)
+    bbox, area, centroid, vertici = geometry_metrics(geojson)
+    conn.execute('INSERT OR REPLACE INTO terreni_rtree VALUES (?, ?, ?, ?, ?)', (terreno_id, *bbox))
+    conn.execute('INSERT OR REPLACE INTO terreni_geo VALUES (?, ?, ?, ?, ?)',
+                 (terreno_id, area, centroid[0], centroid[1], vertici))
+
+def simplify_ring(ring, tolerance):
+    """Douglas-Peucker simplification of one coordinate sequence"""
+    if len(ring) <= 4 or tolerance <= 0:
+        return ring
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = ring[first][:2], ring[last][:2]
+        dx, dy = x2 - x1, y2 - y1
+        norm = math.hypot(dx, dy)
+        worst, index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = ring[i][:2]
+            if norm:
+                distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / norm
+            else:
+                distance = math.hypot(px - x1, py - y1)
+            if distance > worst:
+                worst, index = distance, i
+        if index is not None and worst > tolerance:
+            keep[index] = True
+            stack.extend([(first, index), (index, last)])
+    simplified = [point for point, kept in zip(ring, keep) if kept]
+    # A closed ring needs at least four positions to stay a polygon
+    if ring[0] == ring[-1] and len(simplified) < 4:
+        step = (len(ring) - 1) / 3
+        simplified = [ring[0], ring[round(step)], ring[round(2 * step)], ring[-1]]
+    return simplified
+
+def simplify_geometry(geojson, tolerance):
+    """Copy of a GeoJSON geometry (see bare_geometry) with every ring simplified"""
+    kind = geojson.get('type')
+    if kind == 'GeometryCollection':
+        return {'type': kind, 'geometries': [simplify_geometry(g, tolerance) for g in geojson['geometries']]}
+    if kind in ('LineString', 'MultiPoint'):
+        return {'type': kind, 'coordinates': simplify_ring(geojson['coordinates'], tolerance)}
+    if kind in ('Polygon', 'MultiLineString'):
+        return {'type': kind, 'coordinates': [simplify_ring(r, tolerance) for r in geojson['coordinates']]}
+    if kind == 'MultiPolygon':
+        return {'type': kind, 'coordinates': [[simplify_ring(r, tolerance) for r in polygon]
+                                              for polygon in geojson['coordinates']]}
+    return geojson
+
+def zoom_tolerance(zoom):
+    """Degrees covered by SIMPLIFY_PIXELS at a web-mercator zoom level"""
+    return SIMPLIFY_PIXELS * 360 / (256 * 2 ** zoom)
+
+# ============= ANIMALI PEDIGREE =============
+
+# Generations walked by /ancestors and /descendants when ?depth= is not given
+PEDIGREE_DEPTH = 5
+MAX_PEDIGREE_DEPTH = 50
+
+# UNION (not UNION ALL) keeps one row per (animal, generation), so inbred
+# pedigrees do not multiply the paths walked at every generation
+ANCESTORS_SQL = '''
+    WITH RECURSIVE antenati(id, generazione) AS (
+        SELECT padre_id, 1 FROM animali WHERE id = :id AND padre_id IS NOT NULL
+        UNION SELECT madre_id, 1 FROM animali WHERE id = :id AND madre_id IS NOT NULL
+        UNION SELECT a.padre_id, antenati.generazione + 1
+              FROM antenati JOIN animali a ON a.id = antenati.id
+              WHERE antenati.generazione < :depth AND a.padre_id IS NOT NULL
+        UNION SELECT a.madre_id, antenati.generazione + 1
+              FROM antenati JOIN animali a ON a.id = antenati.id
+              WHERE antenati.generazione < :depth AND a.madre_id IS NOT NULL
+    )
+    SELECT a.*, MIN(antenati.generazione) AS generazione
+    FROM antenati JOIN animali a ON a.id = antenati.id
+    GROUP BY a.id ORDER BY generazione, a.id
+'''
+
+DESCENDANTS_SQL = '''
+    WITH RECURSIVE discendenti(id, generazione) AS (
+        SELECT id, 1 FROM animali WHERE padre_id = :id
+        UNION SELECT id, 1 FROM animali WHERE madre_id = :id
+        UNION SELECT a.id, discendenti.generazione + 1
+              FROM discendenti JOIN animali a ON a.padre_id = discendenti.id
+              WHERE discendenti.generazione < :depth
+        UNION SELECT a.id, discendenti.generazione + 1
+              FROM discendenti JOIN animali a ON a.madre_id = discendenti.id
+              WHERE discendenti.generazione < :depth
+    )
+    SELECT a.*, MIN(discendenti.generazione) AS generazione
+    FROM discendenti JOIN animali a ON a.id = discendenti.id
+    GROUP BY a.id ORDER BY generazione, a.id
+'''
+
+# Generations of pedigree the inbreeding coefficient is computed over, as
+# herdbooks do: older ancestors count as unrelated founders
+INBREEDING_DEPTH = 6
+MAX_INBREEDING_DEPTH = 10
+
+# Coefficients stay valid until animali changes; past this many entries the
+# memo is dropped so a long-running worker does not grow without bound
+MAX_INBREEDING_MEMO = 100_000
+
+_inbreeding_lock = threading.Lock()
+_inbreeding = {'key': None, 'values': {}}
+
+def _generations(parents):
+    """Generation number of every animal (0 for founders), computed
+    iteratively; a parent that closes a cycle is ignored."""
+    generation = {}
+    for start in parents:
+        if start in generation:
+            continue
+        stack, visiting = [start], {start}
+        while stack:
+            node = stack[-1]
+            pending = [p for p in parents[node] if p in parents and p not in generation and p not in visiting]
+            if pending:
+                stack.extend(pending)
+                visiting.update(pending)
+                continue
+            stack.pop()
+            visiting.discard(node)
+            if node not in generation:
+                known = [generation[p] for p in parents[node] if p in generation]
+                generation[node] = 1 + max(known) if known else 0
+    return generation
+
+def coancestry(parents, a, b):
+    """Coefficient of coancestry f(a, b) (Wright) within the pedigree
+    `parents` ({id: (padre_id, madre_id) known in the pedigree}).
+
+    f(a, a) = (1 + F(a)) / 2 with F(a) = f(sire, dam); otherwise the younger
+    animal (higher generation) is replaced by its parents. Only parents of a
+    strictly lower generation are followed, so the walk always terminates.
+    """
+    generation = _generations(parents)
+    memo = {}
+
+    def older_parents(x):
+        return [p for p in parents[x] if generation.get(p, generation[x]) < generation[x]]
+
+    def lookup(x, y):
+        if x not in parents or y not in parents:
+            return 0.0
+        return memo.get((x, y) if x <= y else (y, x))
+
+    stack = [(a, b)]
+    while stack:
+        x, y = stack[-1]
+        if lookup(x, y) is not None:
+            stack.pop()
+            continue
+        if x == y:
+            sire_dam = older_parents(x)
+            needed = [tuple(sire_dam)] if len(sire_dam) == 2 else []
+        else:
+            if generation[x] < generation[y]:
+                x, y = y, x
+            needed = [(p, y) for p in older_parents(x)]
+        missing = [pair for pair in needed if lookup(*pair) is None]
+        if missing:
+            stack.extend(missing)
+            continue
+        if x == y:
+            value = (1 + (lookup(*needed[0]) if needed else 0.0)) / 2
+        else:
+            value = sum(lookup(*pair) for pair in needed) / 2
+        memo[(x, y) if x <= y else (y, x)] = value
+        stack.pop()
+    return lookup(a, b)
+
+def inbreeding(conn, padre_id, madre_id, depth=INBREEDING_DEPTH):
+    """Inbreeding coefficient of an (existing or planned) offspring of
+    padre_id x madre_id over `depth` generations: the coancestry of its
+    parents in their pedigree truncated to depth - 1 generations.
+    Memoized until animali changes."""
+    if padre_id is None or madre_id is None:
+        return 0.0
+    key = (app.config['DATABASE'], data_version(conn, ('animali',))[0])
+    args = (padre_id, madre_id, depth)
+    with _inbreeding_lock:
+        if _inbreeding['key'] != key or len(_inbreeding['values']) > MAX_INBREEDING_MEMO:
+            _inbreeding.update(key=key, values={})
+        if args in _inbreeding['values']:
+            return _inbreeding['values'][args]
+
+    parents = {}
+    for parent in {padre_id, madre_id}:
+        row = conn.execute('SELECT id, padre_id, madre_id FROM animali WHERE id = ?', (parent,)).fetchone()
+        if row is not None:
+            parents[row['id']] = (row['padre_id'], row['madre_id'])
+        if depth > 1:
+            for row in conn.execute(ANCESTORS_SQL, {'id': parent, 'depth': depth - 1}):
+                parents[row['id']] = (row['padre_id'], row['madre_id'])
+    # Links to animals outside the truncated pedigree become unknown parents
+    parents = {id: tuple(p for p in links if p in parents) for id, links in parents.items()}
+    value = coancestry(parents, padre_id, madre_id)
+
+    with _inbreeding_lock:
+        if _inbreeding['key'] == key:
+            _inbreeding['values'][args] = value
+    return value
+
+def pedigree_depth(default=PEDIGREE_DEPTH, maximum=MAX_PEDIGREE_DEPTH):
+    """?depth= of the pedigree endpoints, clamped to `maximum`"""
+    value = request.args.get('depth', default)
+    try:
+        depth = int(value)
+    except ValueError:
+        raise ValueError('depth must be an integer')
+    if depth < 1:
+        raise ValueError('depth must be positive')
+    return min(depth, maximum)
+
+def lineage_response(sql, id):
+    try:
+        depth = pedigree_depth()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conn = read_db()
+    if conn.execute('SELECT 1 FROM animali WHERE id = ?', (id,)).fetchone() is None:
+        return jsonify({'error': 'Record not found'}), 404
+    try:
+        fmt = json_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cursor = conn.execute(sql, {'id': id, 'depth': depth})
+    return rows_response(cursor, [column[0] for column in cursor.description], fmt)
+
+# ============= GROUP COMMIT =============
+
+class GroupCommitWriter:
+    """Writer thread that applies the write units queued by concurrent
+    requests on its own connection and commits them together.
+
+    Each unit is a callable taking the connection and runs inside its own
+    SAVEPOINT: a unit that raises is rolled back alone and its exception is
+    re-raised to the request that submitted it, while the rest of the group
+    shares a single COMMIT (and a single fsync). A failure of the group as a
+    whole (opening the connection included) is re-raised to all of its
+    units, and the next group starts on a fresh connection.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='group-commit', daemon=True)
+        self.thread.start()
+
+    def submit(self, unit):
+        """Run unit(conn) in the next group; returns its result or raises its exception.
+
+        A unit the writer has not started within GROUP_COMMIT_TIMEOUT_S is
+        withdrawn and fails with OperationalError; one already started is
+        waited for as long as the writer thread lives.
+        """
+        entry = {'unit': unit, 'done': threading.Event()}
+        self.queue.put(entry)
+        if not entry['done'].wait(app.config['GROUP_COMMIT_TIMEOUT_S']):
+            # setdefault is atomic: either the writer marked it running or it never will
+            if entry.setdefault('state', 'withdrawn') == 'withdrawn':
+                raise sqlite3.OperationalError('Group commit writer did not take the write in time')
+            while not entry['done'].wait(1):
+                if not self.thread.is_alive():
+                    raise sqlite3.OperationalError('Group commit writer stopped')
+        if 'error' in entry:
+            raise entry['error']
+        return entry['result']
+
+    def run(self):
+        conn = None
+        while True:
+            # Whatever queued up while the previous group was committing
+            group = [self.queue.get()]
+            while len(group) < app.config['GROUP_COMMIT_MAX_UNITS']:
+                try:
+                    group.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            group = [entry for entry in group if entry.setdefault('state', 'running') == 'running']
+            try:
+                if conn is None:
+                    conn = get_db_connection()
+                    conn.isolation_level = None  # transactions are managed explicitly below
+                conn.execute('BEGIN IMMEDIATE')
+                for entry in group:
+                    conn.execute('SAVEPOINT unit')
+                    try:
+                        entry['result'] = entry['unit'](conn)
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO unit')
+                        entry['error'] = e
+                    conn.execute('RELEASE unit')
+                conn.execute('COMMIT')
+            except Exception as e:
+                try:
+                    if conn is not None and conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                except Exception:
+                    # Unusable connection: the next group opens another
+                    conn.close()
+                    conn = None
+                for entry in group:
+                    entry.pop('result', None)
+                    entry.setdefault('error', e)
+                if conn is None:
+                    app.logger.error('Group commit writer has no connection: %s', e)
+                    time.sleep(0.1)
+            finally:
+                for entry in group:
+                    entry['done'].set()
+
+_writers_lock = threading.Lock()
+_writers = {}  # (pid, DATABASE) -> GroupCommitWriter
+
+def run_write(unit):
+    """Apply unit(conn) atomically, through this process's group-commit
+    writer or, with GROUP_COMMIT disabled, in its own transaction on the
+    request connection."""
+    if not app.config['GROUP_COMMIT']:
+        conn = get_db()
+        with conn:
+            return unit(conn)
+
+    key = (os.getpid(), app.config['DATABASE'])
+    with _writers_lock:
+        if key not in _writers or not _writers[key].thread.is_alive():
+            _writers[key] = GroupCommitWriter()
+        writer = _writers[key]
+    return writer.submit(unit)
+
+# ============= ADMISSION CONTROL =============
+
+# Never rate limited, so that health checks and scrapes get through an overload
+UNLIMITED_ENDPOINTS = {'health', 'metrics'}
+
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# Writes applied through the group-commit writer, which already runs them one
+# group at a time: the write queue would only keep them from being merged
+GROUP_COMMIT_ENDPOINTS = {'batch_write'}
+
+# Buckets kept by the in-process rate limiter, least recently used first
+MAX_RATE_BUCKETS = 10000
+
+# Shared buckets idle for this long are dropped (a bucket refills long before)
+RATE_BUCKET_IDLE_S = 3600
+
+if app.config['TRUSTED_PROXIES'] > 0:
+    # Behind a reverse proxy the client is the address it puts in X-Forwarded-For
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+def overloaded(reason, message, retry_after, status=503):
+    """Fast refusal of a request the server cannot take now, with the seconds
+    after which the client should retry in Retry-After"""
+    with _metrics_lock:
+        _metrics['rejected'][reason] += 1
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+class RateLimiter:
+    """Token buckets per client and kind of request.
+
+    A bucket holds up to `burst` tokens and refills at `rate` per second;
+    each request takes one. The buckets live in this process (each worker
+    then admits its own share) or, with RATE_LIMIT_STORE=file, in a small
+    SQLite database at RATE_LIMIT_PATH shared by all the workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = collections.OrderedDict()  # key -> (tokens, updated)
+        self.local = threading.local()
+
+    def take(self, key, rate, burst):
+        """Take a token for key: 0 if there was one, else the seconds until the next"""
+        now = time.time()
+        if app.config['RATE_LIMIT_STORE'] == 'file':
+            try:
+                tokens, admitted = self._take_shared(key, rate, burst, now)
+            except sqlite3.Error as e:
+                # The limiter must never be what takes the API down
+                app.logger.warning('Rate limit store unavailable: %s', e)
+                return 0
+        else:
+            with self.lock:
+                tokens, updated = self.buckets.pop(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                admitted = tokens >= 1
+                tokens -= admitted
+                self.buckets[key] = (tokens, now)
+                while len(self.buckets) > MAX_RATE_BUCKETS:
+                    self.buckets.popitem(last=False)
+        return 0 if admitted else (1 - tokens) / rate
+
+    def _take_shared(self, key, rate, burst, now):
+        path = app.config['RATE_LIMIT_PATH']
+        if getattr(self.local, 'key', None) != (os.getpid(), path):
+            conn = sqlite3.connect(path, timeout=1, isolation_level=None)
+            # Losing a few buckets in a crash is harmless: no fsync
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''CREATE TABLE IF NOT EXISTS rate_buckets (
+                                bucket TEXT PRIMARY KEY, tokens REAL NOT NULL,
+                                updated REAL NOT NULL, admitted INTEGER NOT NULL
+                            ) WITHOUT ROWID''')
+            self.local.conn, self.local.key, self.local.calls = conn, (os.getpid(), path), 0
+        conn = self.local.conn
+
+        self.local.calls += 1
+        if self.local.calls % 1000 == 0:
+            conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - RATE_BUCKET_IDLE_S,))
+        refill = 'MIN(:burst, tokens + (:now - updated) * :rate)'
+        return conn.execute(f'''
+            INSERT INTO rate_buckets (bucket, tokens, updated, admitted) VALUES (:key, :burst - 1, :now, 1)
+            ON CONFLICT (bucket) DO UPDATE SET
+                tokens = {refill} - ({refill} >= 1), admitted = {refill} >= 1, updated = :now
+            RETURNING tokens, admitted
+        ''', {'key': '|'.join(key), 'rate': rate, 'burst': burst, 'now': now}).fetchone()
+
+_rate_limiter = RateLimiter()
+
+class WriteGate:
+    """Bounded admission of the write requests of this process.
+
+    SQLite runs one writer at a time, so threads past the first few only
+    wait on its lock. At most WRITE_CONCURRENCY write requests run at once
+    and up to WRITE_QUEUE_MAX more wait, in order, at most
+    WRITE_QUEUE_TIMEOUT_MS for a slot; the others are refused at once. The
+    remaining threads stay free for reads.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.running = 0
+        self.waiting = collections.deque()
+
+    def enter(self):
+        """Take a slot; False if the queue is full or the wait timed out"""
+        with self.cond:
+            if self.running < app.config['WRITE_CONCURRENCY'] and not self.waiting:
+                self.running += 1
+                return True
+            if len(self.waiting) >= app.config['WRITE_QUEUE_MAX']:
+                return False
+            ticket = object()
+            self.waiting.append(ticket)
+            admitted = self.cond.wait_for(
+                lambda: self.waiting[0] is ticket and self.running < app.config['WRITE_CONCURRENCY'],
+                timeout=app.config['WRITE_QUEUE_TIMEOUT_MS'] / 1000)
+            self.waiting.remove(ticket)
+            if admitted:
+                self.running += 1
+            self.cond.notify_all()
+            return admitted
+
+    def leave(self):
+        with self.cond:
+            self.running -= 1
+            self.cond.notify_all()
+
+_write_gate = WriteGate()
+
+@app.before_request
+def admit_request():
+    """Refuse requests over the client's rate (429) or past the write queue
+    (503) before they do any work"""
+    if request.endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    write = request.method in WRITE_METHODS
+    client = request.remote_addr or 'unknown'
+    limits = [('all', app.config['RATE_LIMIT_PER_S'], app.config['RATE_LIMIT_BURST'])]
+    if write:
+        limits.append(('write', app.config['RATE_LIMIT_WRITE_PER_S'], app.config['RATE_LIMIT_WRITE_BURST']))
+    for kind, rate, burst in limits:
+        if rate > 0:
+            wait = _rate_limiter.take((client, kind), rate, burst)
+            if wait:
+                return overloaded('rate_limit', 'Too many requests', wait, 429)
+
+    grouped = app.config['GROUP_COMMIT'] and request.endpoint in GROUP_COMMIT_ENDPOINTS
+    if write and app.config['WRITE_CONCURRENCY'] > 0 and not grouped:
+        if not _write_gate.enter():
+            return overloaded('write_queue', 'Too many writes in progress',
+                              app.config['WRITE_QUEUE_TIMEOUT_MS'] / 1000)
+        g.write_slot = True
+    return None
+
+@app.teardown_request
+def release_write_slot(exception):
+    if g.pop('write_slot', False):
+        _write_gate.leave()
+
+@app.errorhandler(sqlite3.OperationalError)
+def database_busy(e):
+    """The database still locked after SQLITE_BUSY_TIMEOUT_MS: 503 with
+    Retry-After rather than a 500. Other errors propagate unchanged."""
+    if 'locked' not in str(e) and 'busy' not in str(e):
+        raise e
+    return overloaded('database_busy', f'Database busy: {e}', 1)
+
+# ============= REPORT JOBS =============
+
+def _date_range(params, column):
+    """WHERE fragment and parameters for the optional from/to of a report"""
+    where, values = [], []
+    if params.get('from'):
+        where.append(f'{column} >= ?')
+        values.append(params['from'])
+    if params.get('to'):
+        where.append(f'{column} <= ?')
+        values.append(params['to'])
+    return ' AND '.join(where) or '1', values
+
+def report_finanze_categorie(conn, params):
+    """Spese e ricavi per mese e categoria"""
+    where, values = _date_range(params, 'data_operazione')
+    rows = conn.execute(f'''
+        SELECT substr(data_operazione, 1, 7) AS mese, tipo, categoria,
+               COUNT(*) AS operazioni, ROUND(SUM(importo), 2) AS totale
+        FROM finanze WHERE {where}
+        GROUP BY mese, tipo, categoria ORDER BY mese, tipo, categoria
+    ''', values).fetchall()
+    righe = [dict(row) for row in rows]
+    spese = sum(r['totale'] for r in righe if r['tipo'] == 'Spesa')
+    ricavi = sum(r['totale'] for r in righe if r['tipo'] == 'Ricavo')
+    return {'righe': righe, 'spese': round(spese, 2), 'ricavi': round(ricavi, 2),
+            'bilancio': round(ricavi - spese, 2)}
+
+def report_raccolti_terreni(conn, params):
+    """Quantità raccolta per terreno, stagione (anno di raccolta) e coltura"""
+    raccolta = 'COALESCE(c.data_raccolta_effettiva, c.data_raccolta_prevista, c.data_semina)'
+    where, values = _date_range(params, raccolta)
+    rows = conn.execute(f'''
+        SELECT c.terreno_id, t.nome AS terreno, t.superficie_ettari,
+               substr({raccolta}, 1, 4) AS stagione, c.tipo_coltura,
+               COUNT(*) AS colture, ROUND(SUM(c.quantita_raccolta_kg), 2) AS quantita_kg
+        FROM colture c LEFT JOIN terreni t ON t.id = c.terreno_id
+        WHERE c.quantita_raccolta_kg IS NOT NULL AND {where}
+        GROUP BY c.terreno_id, stagione, c.tipo_coltura
+        ORDER BY c.terreno_id, stagione, c.tipo_coltura
+    ''', values).fetchall()
+    righe = [dict(row) for row in rows]
+    for r in righe:
+        r['kg_per_ettaro'] = round(r['quantita_kg'] / r['superficie_ettari'], 2) if r['superficie_ettari'] else None
+    return {'righe': righe}
+
+def report_costi_trattori(conn, params):
+    """Costo delle manutenzioni per trattore"""
+    where, values = _date_range(params, 'm.data_manutenzione')
+    rows = conn.execute(f'''
+        SELECT t.id, t.marca, t.modello, t.targa, t.ore_lavoro,
+               COUNT(m.id) AS interventi, ROUND(COALESCE(SUM(m.costo), 0), 2) AS costo_totale,
+               MAX(m.data_manutenzione) AS ultima_manutenzione
+        FROM trattori t
+        LEFT JOIN manutenzioni m ON m.tipo_oggetto = 'Trattore' AND m.oggetto_id = t.id AND {where}
+        GROUP BY t.id ORDER BY costo_totale DESC, t.id
+    ''', values).fetchall()
+    righe = [dict(row) for row in rows]
+    for r in righe:
+        r['costo_per_ora'] = round(r['costo_totale'] / r['ore_lavoro'], 2) if r['ore_lavoro'] else None
+    return {'righe': righe, 'costo_totale': round(sum(r['costo_totale'] for r in righe), 2)}
+
+# Report name -> function and the tables whose versions key its cache
+REPORTS = {
+    'finanze_categorie': {'run': report_finanze_categorie, 'tables': ('finanze',)},
+    'raccolti_terreni': {'run': report_raccolti_terreni, 'tables': ('colture', 'terreni')},
+    'costi_trattori': {'run': report_costi_trattori, 'tables': ('trattori', 'manutenzioni')},
+}
+
+REPORT_PARAMS = ('from', 'to')
+
+_report_pools_lock = threading.Lock()
+_report_pools = {}  # pid -> ProcessPoolExecutor
+
+def report_params(data):
+    """Validated report parameters (from/to dates)"""
+    params = data or {}
+    if not isinstance(params, dict):
+        raise ValueError('params must be an object')
+    unknown = [k for k in params if k not in REPORT_PARAMS]
+    if unknown:
+        raise ValueError(f"Unknown parameter(s): {', '.join(unknown)}")
+    return {k: parse_date(params[k], k) for k in REPORT_PARAMS if params.get(k)}
+
+def report_cache_key(report, params, version):
+    return hashlib.sha1(json.dumps([report, params, version], sort_keys=True).encode()).hexdigest()
+
+def run_report(database, job_id, report, params):
+    """Executed in a pool process: compute a report in one read transaction.
+    Returns the cache key of the data actually read and the result."""
+    conn = get_db_connection(database)
+    try:
+        with conn:
+            conn.execute("UPDATE report_jobs SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (job_id,))
+        conn.execute('BEGIN')
+        version = data_version(conn, REPORTS[report]['tables'])[0]
+        result = REPORTS[report]['run'](conn, params)
+        conn.rollback()
+        return report_cache_key(report, params, version), result
+    finally:
+        conn.close()
+
+def _finish_report(database, job_id, future):
+    """Pool callback: store the result (or the error) of a job"""
+    conn = get_db_connection(database)
+    try:
+        with conn:
+            try:
+                cache_key, result = future.result()
+            except Exception as e:
+                conn.execute('''UPDATE report_jobs SET status = 'failed', error = ?,
+                                finished_at = CURRENT_TIMESTAMP WHERE id = ?''', (str(e) or repr(e), job_id))
+            else:
+                conn.execute('''UPDATE report_jobs SET status = 'done', result = ?, cache_key = ?,
+                                finished_at = CURRENT_TIMESTAMP WHERE id = ?''',
+                             (json.dumps(result), cache_key, job_id))
+    finally:
+        conn.close()
+
+def report_pool():
+    """This worker's report process pool. Processes are spawned rather than
+    forked, as forking a threaded server process is not safe."""
+    pid = os.getpid()
+    with _report_pools_lock:
+        if pid not in _report_pools:
+            _report_pools[pid] = concurrent.futures.ProcessPoolExecutor(
+                max_workers=app.config['REPORT_WORKERS'], mp_context=multiprocessing.get_context('spawn'))
+        return _report_pools[pid]
+
+def report_expired(job):
+    """True for a job still pending after REPORT_TIMEOUT_S, e.g. because the
+    worker that owned it was restarted"""
+    if job['status'] not in ('queued', 'running'):
+        return False
+    created = datetime.strptime(job['created_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - created).total_seconds() > app.config['REPORT_TIMEOUT_S']
+
+def submit_report(conn, report, params):
+    """Job row for report/params: the newest one computed on the current data
+    or still pending, otherwise a new job queued on the process pool."""
+    key = report_cache_key(report, params, data_version(conn, REPORTS[report]['tables'])[0])
+    job = conn.execute('''SELECT * FROM report_jobs WHERE cache_key = ? AND status != 'failed'
+                          ORDER BY created_at DESC LIMIT 1''', (key,)).fetchone()
+    if job is not None and not report_expired(job):
+        return job
+
+    job_id = uuid.uuid4().hex
+    with conn:
+        conn.execute("DELETE FROM report_jobs WHERE created_at < datetime('now', ?)",
+                     (f"-{app.config['REPORT_RETENTION_DAYS']} days",))
+        conn.execute('INSERT INTO report_jobs (id, report, params, cache_key) VALUES (?, ?, ?, ?)',
+                     (job_id, report, json.dumps(params, sort_keys=True), key))
+    database = app.config['DATABASE']
+    try:
+        future = report_pool().submit(run_report, database, job_id, report, params)
+    except concurrent.futures.process.BrokenProcessPool:
+        # A pool process died (e.g. killed for memory): start a fresh pool
+        with _report_pools_lock:
+            _report_pools.pop(os.getpid(), None)
+        future = report_pool().submit(run_report, database, job_id, report, params)
+    future.add_done_callback(functools.partial(_finish_report, database, job_id))
+    return conn.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+
+def report_job_json(job):
+    body = {'id': job['id'], 'report': job['report'], 'params': json.loads(job['params']),
+            'status': job['status'], 'created_at': job['created_at'], 'started_at': job['started_at'],
+            'finished_at': job['finished_at']}
+    if job['status'] == 'done':
+        body['result'] = json.loads(job['result'])
+    elif job['status'] == 'failed':
+        body['error'] = job['error']
+    return body
+
+# ============= CHANGE FEED =============
+
+MAX_CHANGES = 500
+
+_change_log_lock = threading.Lock()
+_change_log = {'pruned_at': None}
+_sse_clients = {'count': 0}
+
+def change_log_bounds(conn):
+    """(oldest seq still in the log, last seq ever assigned)"""
+    first = conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+    last = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return first, last[0] if last else 0
+
+def prune_change_log(conn):
+    """Drop entries older than CHANGE_LOG_RETENTION_DAYS, at most once an hour per process"""
+    with _change_log_lock:
+        now = time.monotonic()
+        if _change_log['pruned_at'] is not None and now - _change_log['pruned_at'] < 3600:
+            return
+        _change_log['pruned_at'] = now
+    with conn:
+        conn.execute("DELETE FROM change_log WHERE created_at < datetime('now', ?)",
+                     (f"-{app.config['CHANGE_LOG_RETENTION_DAYS']} days",))
+
+def read_changes(conn, since, limit, with_data=False):
+    """Change log entries after seq `since`. With with_data, inserts and
+    updates carry the current row (None if it was deleted since)."""
+    rows = conn.execute('''SELECT seq, tabella, riga, operazione, created_at FROM change_log
+                           WHERE seq > ? ORDER BY seq LIMIT ?''', (since, limit)).fetchall()
+    changes = [{'seq': row['seq'], 'tabella': row['tabella'], 'id': row['riga'],
+                'operazione': row['operazione'], 'created_at': row['created_at']} for row in rows]
+    if with_data:
+        wanted = collections.defaultdict(set)
+        for change in changes:
+            if change['operazione'] != 'delete':
+                wanted[change['tabella']].add(change['id'])
+        current = {}
+        for table, ids in wanted.items():
+            sql, params, fields, _ = build_list_query(conn, table, {'ids': ','.join(map(str, ids))})
+            for row in conn.execute(sql, params):
+                current[table, row['id']] = {f: row[f] for f in fields}
+        for change in changes:
+            if change['operazione'] != 'delete':
+                change['data'] = current.get((change['tabella'], change['id']))
+    return changes
+
+# ============= SCADENZE =============
+
+MAX_SCADENZE = 1000
+
+# Title of the object an entry refers to, looked up by primary key
+SCADENZE_SQL = '''
+    SELECT s.fonte, s.oggetto_tipo, s.oggetto_id, s.riga, s.scadenza, s.ore_residue, s.avvisata_at,
+           CAST(julianday(s.scadenza) - julianday(date('now')) AS INTEGER) AS giorni,
+           CASE s.fonte
+               WHEN 'manutenzioni' THEN (SELECT COALESCE(tipo_manutenzione, descrizione)
+                                         FROM manutenzioni WHERE id = s.riga)
+               WHEN 'magazzino' THEN (SELECT nome_prodotto FROM magazzino WHERE id = s.riga)
+               WHEN 'trattori' THEN (SELECT marca || ' ' || modello FROM trattori WHERE id = s.riga)
+           END AS descrizione
+    FROM scadenze s
+'''
+
+def parse_within(value):
+    """Days of a ?within= window such as '30d' (a bare number is days too)"""
+    match = re.fullmatch(r'(\d+)d?', value)
+    if not match:
+        raise ValueError('within must be a number of days, e.g. 30d')
+    return int(match.group(1))
+
+def due_entries(conn, days, ore, limit=MAX_SCADENZE):
+    """Entries due within `days` (overdue included), soonest first, then the
+    trattori within `ore` working hours of their next service"""
+    dated = conn.execute(SCADENZE_SQL + "WHERE s.scadenza <= date('now', ?) ORDER BY s.scadenza LIMIT ?",
+                         (f'+{days} days', limit)).fetchall()
+    hours = conn.execute(SCADENZE_SQL + 'WHERE s.ore_residue <= ? ORDER BY s.ore_residue LIMIT ?',
+                         (ore, limit)).fetchall()
+    return [dict(row) for row in dated + hours]
+
+def raise_alerts(conn):
+    """Mark the entries that entered the alert window as alerted, log them
+    and return them. The UPDATE claims each entry once, so every alert is
+    raised by a single worker."""
+    rows = []
+    with conn:
+        # One range over each partial index (an OR of the two would scan one of them)
+        for condition, value in (("scadenza <= date('now', ?)", f"+{app.config['SCADENZE_PREAVVISO_DAYS']} days"),
+                                 ('ore_residue <= ?', app.config['SCADENZE_PREAVVISO_ORE'])):
+            rows += conn.execute(f'''
+                UPDATE scadenze SET avvisata_at = CURRENT_TIMESTAMP
+                WHERE avvisata_at IS NULL AND {condition}
+                RETURNING fonte, oggetto_tipo, oggetto_id, riga, scadenza, ore_residue
+            ''', (value,)).fetchall()
+    for row in rows:
+        due = f"on {row['scadenza']}" if row['scadenza'] else f"in {row['ore_residue']} working hours"
+        app.logger.warning('Due %s: %s %s (%s #%s)', due, row['oggetto_tipo'], row['oggetto_id'],
+                           row['fonte'], row['riga'])
+    with _metrics_lock:
+        for row in rows:
+            _metrics['alerts'][row['fonte']] += 1
+    return rows
+
+class AlertScheduler:
+    """Daemon thread raising the scadenze alerts every SCADENZE_CHECK_S.
+
+    A check is one UPDATE over the partial indexes of the entries not yet
+    alerted, so neither the source tables nor the alerted backlog are
+    scanned however large they grow.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # First request in this (possibly forked) process
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name='alert-scheduler', daemon=True).start()
+
+    def _run(self):
+        while True:
+            conn = get_db_connection()
+            try:
+                raise_alerts(conn)
+            except sqlite3.Error as e:
+                app.logger.error('Scadenze alert check failed: %s', e)
+            finally:
+                conn.close()
+            time.sleep(app.config['SCADENZE_CHECK_S'])
+
+_scheduler = AlertScheduler()
+
+@app.before_request
+def start_alert_scheduler():
+    if app.config['SCADENZE_CHECK_S'] > 0 and _scheduler.pid != os.getpid():
+        _scheduler.start()
+
+# ============= READ REPLICA =============
+
+READ_MODES = ('primary', 'readonly', 'snapshot')
+
+# Set after a write in snapshot mode: the client reads from the primary
+# until the snapshot has caught up with its own changes
+PRIMARY_READ_COOKIE = 'read_primary'
+
+class SnapshotRefresher:
+    """Daemon thread keeping READ_SNAPSHOT_PATH at most READ_SNAPSHOT_MAX_AGE_S old.
+
+    The primary is copied with the sqlite3 backup API into a temporary file
+    that then atomically replaces the snapshot, so readers switch over at
+    their next request and never see a partial copy. The workers coordinate
+    through a lock file: one of them copies while the others keep serving
+    the current snapshot. When no table changed only the age is reset.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # First snapshot read in this (possibly forked) process
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name='snapshot-refresher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except (OSError, sqlite3.Error) as e:
+                app.logger.error('Snapshot refresh failed: %s', e)
+            time.sleep(max(1, app.config['READ_SNAPSHOT_MAX_AGE_S'] / 4))
+
+    def age(self, path):
+        """Seconds since the snapshot was taken (None if there is none yet)"""
+        try:
+            return time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        """Replace the snapshot if it is stale; returns True when a copy was made"""
+        path = app.config['READ_SNAPSHOT_PATH']
+        age = self.age(path)
+        if age is not None and age < app.config['READ_SNAPSHOT_MAX_AGE_S']:
+            return False
+
+        with open(path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False  # another worker is copying
+            age = self.age(path)
+            if age is not None and age < app.config['READ_SNAPSHOT_MAX_AGE_S']:
+                return False  # refreshed while we waited for the lock
+
+            source = get_db_connection()
+            try:
+                if age is not None:
+                    snapshot = get_db_connection(path, readonly=True, immutable=True)
+                    try:
+                        unchanged = (data_version(snapshot, _VERSIONED_TABLES)[0]
+                                     == data_version(source, _VERSIONED_TABLES)[0])
+                    finally:
+                        snapshot.close()
+                    if unchanged:
+                        os.utime(path)
+                        return False
+
+                temp = path + '.tmp'  # ours while we hold the lock
+                target = sqlite3.connect(temp)
+                try:
+                    source.backup(target)
+                    # Readers open it read-only: a rollback journal needs no -wal/-shm files
+                    target.execute('PRAGMA journal_mode = DELETE')
+                finally:
+                    target.close()
+                os.replace(temp, path)
+                return True
+            finally:
+                source.close()
+
+_snapshots = SnapshotRefresher()
+
+def read_db():
+    """Connection for the GET handlers that only read, by READ_MODE:
+
+    primary: the request connection of get_db().
+    readonly: a pooled read-only connection to the primary database, which
+    in WAL mode never waits for (or blocks) the writers.
+    snapshot: the latest copy made by SnapshotRefresher, opened immutable so
+    reads take no locks at all. Falls back to the primary until the first
+    copy exists, and for clients carrying the PRIMARY_READ_COOKIE.
+    """
+    mode = app.config['READ_MODE']
+    if mode not in READ_MODES:
+        raise ValueError(f'Invalid READ_MODE: {mode}')
+    if mode == 'primary' or request.cookies.get(PRIMARY_READ_COOKIE):
+        return get_db()
+    if 'read_db' in g:
+        return g.read_db
+
+    path = app.config['DATABASE']
+    version = None
+    if mode == 'snapshot':
+        _snapshots.start()
+        path = app.config['READ_SNAPSHOT_PATH']
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return get_db()
+        # A refresh replaces the file, so a new inode means a new snapshot
+        version = (stat.st_dev, stat.st_ino)
+
+    immutable = mode == 'snapshot'
+    if not app.config['SQLITE_POOL_CONNECTIONS']:
+        g.read_db = get_db_connection(path, readonly=True, immutable=immutable)
+        return g.read_db
+
+    key = (os.getpid(), mode, path, version)
+    if getattr(_local, 'read_key', None) != key:
+        _local.read_conn = get_db_connection(path, readonly=True, immutable=immutable)
+        _local.read_key = key
+    g.read_db = _local.read_conn
+    return g.read_db
+
+@app.after_request
+def mark_primary_reads(response):
+    """After a successful write in snapshot mode, send the client's reads to
+    the primary for as long as the snapshot may still predate the write"""
+    if (app.config['READ_MODE'] == 'snapshot' and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400):
+        response.set_cookie(PRIMARY_READ_COOKIE, '1', max_age=2 * app.config['READ_SNAPSHOT_MAX_AGE_S'],
+                            httponly=True, samesite='Lax')
+    return response
+
+# ============= MAINTENANCE =============
+
+# Rows moved to the monthly archives by ARCHIVE_AFTER_DAYS: table -> date column
+ARCHIVED_TABLES = {'numbers': 'created_at', 'finanze': 'data_operazione'}
+
+# A run still marked running after this long is assumed to have died with its worker
+MAINTENANCE_STALE_S = 3600
+
+def _pause():
+    time.sleep(app.config['MAINTENANCE_PAUSE_MS'] / 1000)
+
+def maintenance_dir(setting, name):
+    """BACKUP_DIR or ARCHIVE_DIR, by default a folder next to the database in
+    use (resolved when the task runs, so it follows app.config['DATABASE'])"""
+    return app.config[setting] or os.path.join(os.path.dirname(os.path.abspath(app.config['DATABASE'])), name)
+
+def list_backups():
+    """Names of the backups in BACKUP_DIR, oldest first"""
+    directory = maintenance_dir('BACKUP_DIR', 'backups')
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith('farm_management-') and name.endswith('.db'))
+
+def backup_database(conn):
+    """Consistent online copy of the database into BACKUP_DIR, keeping the
+    newest BACKUP_KEEP copies.
+
+    The copy is made with the backup API, MAINTENANCE_STEP_PAGES pages at a
+    time with a pause in between, inside one read transaction: in WAL mode
+    that does not block the writers, and it pins the copy to a single
+    snapshot (otherwise each commit of another connection would restart the
+    copy from the first page).
+    """
+    directory = maintenance_dir('BACKUP_DIR', 'backups')
+    os.makedirs(directory, exist_ok=True)
+    # Microseconds keep two backups taken in the same second apart
+    path = os.path.join(directory, f'farm_management-{datetime.now(timezone.utc):%Y%m%d-%H%M%S-%f}.db')
+    temp = path + '.tmp'
+    try:
+        target = sqlite3.connect(temp)
+        try:
+            conn.execute('BEGIN')
+            conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone()
+            try:
+                conn.backup(target, pages=app.config['MAINTENANCE_STEP_PAGES'], progress=lambda *_: _pause())
+            finally:
+                conn.rollback()
+            # A self-contained file, restorable by copying it back
+            target.execute('PRAGMA journal_mode = DELETE')
+            check = target.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            target.close()
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f'Backup failed quick_check: {check}')
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+    backups = list_backups()
+    removed = backups[:-app.config['BACKUP_KEEP']] if app.config['BACKUP_KEEP'] > 0 else []
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return {'path': path, 'bytes': os.path.getsize(path), 'removed': removed}
+
+def incremental_vacuum(conn):
+    """Give the free pages back to the filesystem, MAINTENANCE_STEP_PAGES per
+    write transaction so that writers wait at most one short step"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        if not app.config['AUTO_VACUUM_CONVERT']:
+            return {'skipped': 'auto_vacuum is not INCREMENTAL (AUTO_VACUUM_CONVERT=1 converts it)'}
+        # One-off rewrite of a database created before auto_vacuum was set:
+        # writers wait for the whole VACUUM, hence opt-in
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return {'converted': True, 'free_pages': conn.execute('PRAGMA freelist_count').fetchone()[0]}
+    before = free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    while free > 0:
+        # execute() steps the pragma once, which frees a single page; a
+        # script runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({int(app.config['MAINTENANCE_STEP_PAGES'])})")
+        remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+        _pause()
+    return {'freed_pages': before - free, 'free_pages': free}
+
+def optimize_database(conn):
+    """PRAGMA optimize: re-analyzes only the tables whose statistics are stale"""
+    conn.execute('PRAGMA optimize').fetchall()
+    return {}
+
+def analyze_database(conn):
+    """Full refresh of the planner statistics. analysis_limit samples each
+    index instead of reading it whole, keeping the write lock short."""
+    conn.execute('PRAGMA analysis_limit = 1000')
+    conn.execute('ANALYZE')
+    conn.commit()
+    return {}
+
+def archive_path(month):
+    return os.path.join(maintenance_dir('ARCHIVE_DIR', 'archive'), f'farm_management-{month}.db.gz')
+
+def write_archive(conn, month, rows):
+    """Add rows ({table: [row, ...]}) to the gzip-compressed archive database
+    of a month, creating it with the schema of the live tables. Rows keep
+    their id, so archiving the same rows twice is harmless."""
+    path = archive_path(month)
+    working = path[:-len('.gz')]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        with gzip.open(path, 'rb') as src, open(working, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    elif os.path.exists(working):
+        os.remove(working)  # left over by an interrupted run
+
+    archive = sqlite3.connect(working)
+    try:
+        with archive:
+            for table, table_rows in rows.items():
+                schema = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                      (table,)).fetchone()[0]
+                archive.execute(schema.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1))
+                # Columns added to the live table after the archive was created
+                existing = {row[1] for row in archive.execute(f'PRAGMA table_info({table})')}
+                for column in table_rows[0].keys():
+                    if column not in existing:
+                        archive.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+                columns = table_rows[0].keys()
+                archive.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(row) for row in table_rows])
+    finally:
+        archive.close()
+
+    with open(working, 'rb') as src, gzip.open(path + '.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    with open(path + '.tmp', 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    os.remove(working)
+    return path
+
+def archive_old_rows(conn):
+    """Move the numbers and finanze rows of the months that ended more than
+    ARCHIVE_AFTER_DAYS ago to one compressed archive database per month.
+
+    Each month is written (and synced) to its archive before its rows are
+    deleted, in one transaction, from the live database; the triggers keep
+    stats, search index and change log in step (the series rollups keep
+    counting the archived rows), and the incremental vacuum later returns
+    the freed pages.
+    """
+    cutoff = conn.execute("SELECT date('now', ?, 'start of month')",
+                          (f"-{app.config['ARCHIVE_AFTER_DAYS']} days",)).fetchone()[0]
+    archived = collections.Counter()
+    months = []
+    start = ''
+    while True:
+        # Jump straight to the next month holding rows, however sparse the dates
+        firsts = [conn.execute(f'SELECT MIN({column}) FROM {table} WHERE {column} >= ?', (start,)).fetchone()[0]
+                  for table, column in ARCHIVED_TABLES.items()]
+        first = min((value for value in firsts if value), default=None)
+        if first is None or first >= cutoff:
+            break
+        month = first[:7]
+        start = min(conn.execute("SELECT date(?, '+1 month')", (f'{month}-01',)).fetchone()[0], cutoff)
+
+        rows = {}
+        for table, column in ARCHIVED_TABLES.items():
+            table_rows = conn.execute(f'SELECT * FROM {table} WHERE {column} >= ? AND {column} < ?',
+                                      (f'{month}-01', start)).fetchall()
+            if table_rows:
+                rows[table] = table_rows
+        if not rows:
+            continue
+        write_archive(conn, month, rows)
+        with conn:
+            # The time series keep the archived rows
+            conn.execute('INSERT INTO series_archiving DEFAULT VALUES')
+            for table, table_rows in rows.items():
+                conn.execute(f'DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))',
+                             (json.dumps([row['id'] for row in table_rows]),))
+                archived[table] += len(table_rows)
+            conn.execute('DELETE FROM series_archiving')
+        months.append(month)
+        _pause()
+    return {'before': cutoff, 'months': months, 'rows': dict(archived)}
+
+# Task -> function and the setting giving its interval in hours (None: every
+# check). Archiving first and vacuuming right after reclaims its pages at once.
+MAINTENANCE = {
+    'archive': {'run': archive_old_rows, 'every_h': 24},
+    'vacuum': {'run': incremental_vacuum, 'every_h': None},
+    'optimize': {'run': optimize_database, 'every_h': None},
+    'analyze': {'run': analyze_database, 'every_h': 'ANALYZE_INTERVAL_H'},
+    'backup': {'run': backup_database, 'every_h': 'BACKUP_INTERVAL_H'},
+}
+
+def maintenance_interval(task):
+    """Seconds between scheduled runs of a task, 0 when it is disabled"""
+    every = MAINTENANCE[task]['every_h']
+    if task == 'archive' and app.config['ARCHIVE_AFTER_DAYS'] <= 0:
+        return 0
+    if every is None:
+        return app.config['MAINTENANCE_CHECK_S']
+    if isinstance(every, str):
+        every = app.config[every]
+    return every * 3600
+
+def run_maintenance(conn, task, interval=0):
+    """Run a task unless it ran less than `interval` seconds ago or is running
+    in another worker. Returns its maintenance_runs row, or None if skipped.
+    The claim is a single UPDATE, so each run happens in one worker only."""
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO maintenance_runs (task) VALUES (?)', (task,))
+        claimed = conn.execute('''
+            UPDATE maintenance_runs SET status = 'running', started_at = CURRENT_TIMESTAMP
+            WHERE task = ? AND (started_at IS NULL OR started_at <= datetime('now', ?))
+              AND (status IS NOT 'running' OR started_at <= datetime('now', ?))
+            RETURNING task
+        ''', (task, f'-{interval} seconds', f'-{MAINTENANCE_STALE_S} seconds')).fetchone()
+    if claimed is None:
+        return None
+
+    start = time.perf_counter()
+    try:
+        detail, error, status = MAINTENANCE[task]['run'](conn), None, 'ok'
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        detail, error, status = None, str(e), 'failed'
+        app.logger.error('Maintenance task %s failed: %s', task, e)
+    with conn:
+        conn.execute('''UPDATE maintenance_runs SET status = ?, finished_at = CURRENT_TIMESTAMP,
+                        duration_s = ?, detail = ?, error = ? WHERE task = ?''',
+                     (status, round(time.perf_counter() - start, 3),
+                      None if detail is None else json.dumps(detail), error, task))
+    with _metrics_lock:
+        _metrics['maintenance'][task, status] += 1
+    return conn.execute('SELECT * FROM maintenance_runs WHERE task = ?', (task,)).fetchone()
+
+def maintenance_run_json(row):
+    body = dict(row)
+    body['detail'] = json.loads(row['detail']) if row['detail'] else None
+    return body
+
+class MaintenanceScheduler:
+    """Daemon thread running the due MAINTENANCE tasks every MAINTENANCE_CHECK_S.
+
+    Every worker has one; the last run of each task is kept in the
+    maintenance_runs table, so between them (and across restarts) each task
+    runs once per interval.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # First request in this (possibly forked) process
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name='maintenance-scheduler', daemon=True).start()
+
+    def _run(self):
+        while True:
+            conn = get_db_connection()
+            try:
+                for task in MAINTENANCE:
+                    interval = maintenance_interval(task)
+                    if interval > 0:
+                        run_maintenance(conn, task, interval)
+            except sqlite3.Error as e:
+                app.logger.error('Maintenance check failed: %s', e)
+            finally:
+                conn.close()
+            time.sleep(app.config['MAINTENANCE_CHECK_S'])
+
+_maintenance = MaintenanceScheduler()
+
+@app.before_request
+def start_maintenance_scheduler():
+    # Not under tests: the first check backs up at once, next to their database
+    if app.config['MAINTENANCE_CHECK_S'] > 0 and not app.testing and _maintenance.pid != os.getpid():
+        _maintenance.start()
+
+# ============= DASHBOARD FRAGMENTS =============
+
+# Rows in a page of a dashboard section; "Carica altri" fetches the next one
+DASHBOARD_PAGE_SIZE = 100
+
+# Tables behind the stats grid
+STATS_TABLES = ('terreni', 'trattori', 'attrezzi', 'animali', 'colture', 'personale', 'finanze')
+
+# Section of farm.html -> tables its fragment is rendered from (their versions key the cache)
+DASHBOARD_SECTIONS = {
+    'dashboard': STATS_TABLES,
+    'terreni': ('terreni',),
+    'trattori': ('trattori',),
+    'attrezzi': ('attrezzi',),
+    'animali': ('animali',),
+    'colture': ('colture', 'terreni'),
+    'personale': ('personale',),
+    'magazzino': ('magazzino',),
+    'manutenzioni': ('manutenzioni',),
+    'finanze': ('finanze',),
+}
+
+# Every table shown by farm.html
+DASHBOARD_TABLES = tuple(table for table in _VERSIONED_TABLES if table != 'numbers')
+
+# Rendered fragments, least recently used first
+MAX_FRAGMENTS = 256
+
+_fragments_lock = threading.Lock()
+_fragments = collections.OrderedDict()  # (section, cursor, version key) -> (html, next cursor)
+
+@app.template_filter('num')
+def format_number(value):
+    """Numbers as the dashboard always showed them: 12 rather than 12.0"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def render_fragment(conn, section, cursor=None, ids=None):
+    """(HTML, next page cursor) of a dashboard section: the stats grid, or a
+    page of a table (the whole table markup for the first page, only its
+    rows after a cursor or, with ids, only the rows with those ids). Cached
+    until one of the section's tables changes. Raises ValueError on a bad
+    cursor or ids list.
+    """
+    # Read the version before the rows: a write in between makes the cached
+    # fragment newer than its key, never older
+    key = (section, cursor, ids, data_version(conn, DASHBOARD_SECTIONS[section])[0])
+    with _fragments_lock:
+        if key in _fragments:
+            _fragments.move_to_end(key)
+            return _fragments[key]
+
+    macro = get_template_attribute('farm_fragments.html', 'stats' if section == 'dashboard' else section)
+    next_cursor = None
+    if section == 'dashboard':
+        html = str(macro(compute_stats(conn)))
+    elif ids:
+        sql, params, _, _ = build_list_query(conn, section, {'ids': ids})
+        html = str(macro(conn.execute(sql, params).fetchall(), None, page=True))
+    else:
+        args = {'limit': str(DASHBOARD_PAGE_SIZE)}
+        if cursor:
+            args['cursor'] = cursor
+        sql, params, _, limit = build_list_query(conn, section, args)
+        rows = conn.execute(sql, params).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][k] for k in LIST_SPECS[section]['order'])
+        html = str(macro(rows, next_cursor, page=bool(cursor)))
+
+    with _fragments_lock:
+        _fragments[key] = (html, next_cursor)
+        while len(_fragments) > MAX_FRAGMENTS:
+            _fragments.popitem(last=False)
+    return html, next_cursor
+
+# ============= TIME SERIES =============
+
+# ?step= units: length in seconds, or in months for the uneven mo and y
+SERIES_UNITS = {'m': (60, 0), 'h': (3600, 0), 'd': (86400, 0), 'w': (7 * 86400, 0), 'mo': (0, 1), 'y': (0, 12)}
+
+# Rollup steps of a fixed length (month rollups serve the mo and y steps)
+ROLLUP_SECONDS = {'hour': 3600, 'day': 86400}
+
+# Points a series query returns at most; without ?step= the finest rollup
+# step within it is used
+MAX_SERIES_POINTS = 2000
 
-    # Colture
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS colture (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            terreno_id INTEGER NOT NULL,
-            tipo_coltura VARCHAR(100) NOT NULL,
-            varieta VARCHAR(100),
-            data_semina DATE,
-            data_raccolta_prevista DATE,
-            data_raccolta_effettiva DATE,
-            quantita_raccolta_kg REAL,
-            stato VARCHAR(50) DEFAULT 'In corso',
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (terreno_id) REFERENCES terreni(id)
-        )
-    ''')
+# Monday 1970-01-05, so that weekly buckets start on Mondays
+WEEK_ORIGIN = 4 * 86400
 
-    # Personale/Dipendenti
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS personale (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome VARCHAR(50) NOT NULL,
-            cognome VARCHAR(50) NOT NULL,
-            ruolo VARCHAR(50),
-            telefono VARCHAR(20),
-            email VARCHAR(100),
-            data_assunzione DATE,
-            tipo_contratto VARCHAR(50),
-            retribuzione_mensile REAL,
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def parse_step(value):
+    """'15m', '6h', '1d', '2w', '1mo', '1y' -> (seconds, months), one of them 0"""
+    match = re.fullmatch(r'([1-9][0-9]{0,5})(mo|m|h|d|w|y)', value or '')
+    if not match:
+        raise ValueError(f"step must be a number followed by one of: {', '.join(SERIES_UNITS)} (e.g. 1h, 1d, 1mo)")
+    seconds, months = SERIES_UNITS[match.group(2)]
+    return seconds * int(match.group(1)), months * int(match.group(1))
 
-    # Magazzino (sementi, fertilizzanti, fitofarmaci)
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS magazzino (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            categoria VARCHAR(50) NOT NULL,
-            nome_prodotto VARCHAR(100) NOT NULL,
-            marca VARCHAR(50),
-            quantita REAL NOT NULL,
-            unita_misura VARCHAR(20),
-            data_acquisto DATE,
-            costo_unitario REAL,
-            scadenza DATE,
-            fornitore VARCHAR(100),
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def series_bucket(column, seconds, months):
+    """SQL for the start of the step-long bucket holding the timestamp column"""
+    if months:
+        index = f"(CAST(strftime('%Y', {column}) AS INTEGER) * 12 + CAST(strftime('%m', {column}) AS INTEGER) - 1)"
+        start = f'({index} - {index} % {months})'
+        return f"printf('%04d-%02d-01', {start} / 12, {start} % 12 + 1)"
+    origin = WEEK_ORIGIN if seconds % (7 * 86400) == 0 else 0
+    epoch = f"(CAST(strftime('%s', {column}) AS INTEGER) - {origin})"
+    start = f'{epoch} - {epoch} % {seconds} + {origin}'
+    return f"{'date' if seconds % 86400 == 0 else 'datetime'}({start}, 'unixepoch')"
 
-    # Manutenzioni
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS manutenzioni (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tipo_oggetto VARCHAR(50) NOT NULL,
-            oggetto_id INTEGER NOT NULL,
-            data_manutenzione DATE NOT NULL,
-            tipo_manutenzione VARCHAR(50),
-            descrizione TEXT,
-            costo REAL,
-            eseguita_da VARCHAR(100),
-            prossima_manutenzione DATE,
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def series_query(conn, name, start, end, step=None):
+    """(sql, params, rollup, step) of a series between the dates start and
+    end (inclusive), one row (t, count, sum, min, max, avg) per step.
 
-    # Finanze (Spese e Ricavi)
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS finanze (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tipo VARCHAR(20) NOT NULL,
-            categoria VARCHAR(50) NOT NULL,
-            descrizione TEXT NOT NULL,
-            importo REAL NOT NULL,
-            data_operazione DATE NOT NULL,
-            metodo_pagamento VARCHAR(50),
-            riferimento VARCHAR(100),
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    The coarsest rollup that divides the step is read and re-aggregated;
+    steps finer than (or not a multiple of) every rollup read the source
+    rows. Without a step the finest rollup step within MAX_SERIES_POINTS is
+    used. Raises ValueError on a bad step or one giving too many points.
+    """
+    spec = SERIES[name]
+    first = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)
+    if step is None:
+        days = (last - first).days
+        step = next((step for unit, step, points in (('hour', '1h', days * 24), ('day', '1d', days),
+                                                      ('month', '1mo', days / 28))
+                     if unit in spec['steps'] and points <= MAX_SERIES_POINTS), '1y')
+    seconds, months = parse_step(step)
 
-    conn.commit()
-    conn.close()
+    if months:
+        points = ((last.year - first.year) * 12 + last.month - first.month) / months
+    else:
+        points = (last - first).total_seconds() / seconds
+    if points > MAX_SERIES_POINTS:
+        raise ValueError(f'step {step} gives more than {MAX_SERIES_POINTS} points over the range: '
+                         'use a coarser step or a shorter range')
+
+    if months:
+        rollup = 'month'
+    else:
+        rollup = next((s for s in reversed(spec['steps'])
+                       if s in ROLLUP_SECONDS and seconds % ROLLUP_SECONDS[s] == 0), 'raw')
+
+    # The range starts with the step holding its first day (and the rollup
+    # bucket holding that); the date is validated, so it can be inlined
+    begin = series_bucket(f"'{start}'", seconds, months)
+    if rollup != 'raw':
+        begin = ROLLUP_STEPS[rollup][0].format(t=begin)
+    begin = conn.execute(f'SELECT {begin}').fetchone()[0]
+    end = last.strftime('%Y-%m-%d')
+
+    if rollup == 'raw':
+        if spec.get('dates'):
+            # A date sorts before the same date with a time: compare with the
+            # first whole day at or after the start of the range instead
+            begin = conn.execute("SELECT date(?, '+86399 seconds')", (begin,)).fetchone()[0]
+        sql = f'''
+            SELECT {series_bucket(spec['time'], seconds, 0)} AS t, COUNT(*) AS count,
+                   SUM({spec['value']}) AS sum, MIN({spec['value']}) AS min, MAX({spec['value']}) AS max,
+                   AVG({spec['value']}) AS avg
+            FROM {spec['table']}
+            WHERE {spec['where'].format(row=spec['table'])} AND {spec['time']} >= ? AND {spec['time']} < ?
+            GROUP BY 1 ORDER BY 1
+        '''
+        return sql, (begin, end), rollup, step
+
+    if seconds == ROLLUP_SECONDS.get(rollup) or months == 1:
+        # The rollup rows are the points
+        sql = '''
+            SELECT bucket AS t, count, sum, min, max, sum / count AS avg
+            FROM series_rollups WHERE serie = ? AND step = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        '''
+    else:
+        sql = f'''
+            SELECT {series_bucket('bucket', seconds, months)} AS t, SUM(count) AS count, SUM(sum) AS sum,
+                   MIN(min) AS min, MAX(max) AS max, SUM(sum) / SUM(count) AS avg
+            FROM series_rollups WHERE serie = ? AND step = ? AND bucket >= ? AND bucket < ?
+            GROUP BY 1 ORDER BY 1
+        '''
+    return sql, (name, rollup, begin, end), rollup, step
 
 # ============= ROUTES MENU =============
 
@@ -204,22 +3123,29 @@ def health():
     """Health check endpoint for monitoring"""
     try:
         # Test database connectivity
-        conn = get_db_connection()
+        conn = get_db()
         conn.execute('SELECT 1').fetchone()
-        conn.close()
         return jsonify({'status': 'healthy', 'database': 'connected'}), 200
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
 # ============= ROUTES NUMBER APP =============
 
+# Numbers listed by /numbers, newest first
+NUMBERS_PAGE_SIZE = 100
+
 @app.route('/numbers')
 def numbers_index():
-    """Render the numbers storage page"""
-    conn = get_db_connection()
-    numbers = conn.execute('SELECT * FROM numbers ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return render_template('index.html', numbers=numbers)
+    """Render the numbers storage page: the latest numbers, and the totals
+    of all of them from the series rollups"""
+    conn = get_db()
+    numbers = conn.execute('SELECT * FROM numbers ORDER BY created_at DESC LIMIT ?',
+                           (NUMBERS_PAGE_SIZE,)).fetchall()
+    summary = conn.execute("""
+        SELECT SUM(count) AS count, MIN(min) AS min, MAX(max) AS max, SUM(sum) / SUM(count) AS avg
+        FROM series_rollups WHERE serie = 'numbers' AND step = 'month'
+    """).fetchone()
+    return render_template('index.html', numbers=numbers, summary=summary)
 
 @app.route('/add', methods=['POST'])
 def add_number():
@@ -235,20 +3161,18 @@ def add_number():
     except ValueError:
         return jsonify({'error': 'Invalid number format'}), 400
 
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('INSERT INTO numbers (value) VALUES (?)', (number,))
     conn.commit()
-    conn.close()
 
     return jsonify({'success': True, 'message': 'Number stored successfully'})
 
 @app.route('/delete/<int:id>', methods=['DELETE'])
 def delete_number(id):
     """Delete a number from the database"""
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM numbers WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
 
     return jsonify({'success': True, 'message': 'Number deleted successfully'})
 
@@ -256,8 +3180,8 @@ def delete_number(id):
 
 @app.route('/farm')
 def farm_index():
-    """Render the farm management main page"""
-    return render_template('farm.html')
+    """Render the farm management main page, with the stats grid already in it"""
+    return render_template('farm.html', stats=render_fragment(read_db(), 'dashboard')[0])
 
 @app.route('/terreni')
 def terreni_map():
@@ -267,52 +3191,131 @@ def terreni_map():
 # ===== TERRENI ROUTES =====
 
 @app.route('/api/terreni', methods=['GET'])
+@conditional('terreni')
 def get_terreni():
-    conn = get_db_connection()
-    terreni = conn.execute('SELECT * FROM terreni ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return jsonify([dict(t) for t in terreni])
+    return list_response('terreni')
+
+@app.route('/api/terreni/<int:id>', methods=['GET'])
+@conditional('terreni')
+def get_terreno(id):
+    return item_response('terreni', id)
 
 @app.route('/api/terreni', methods=['POST'])
 def add_terreno():
-    import json
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
 
-    # Convert geometria to JSON string if present
-    geometria_json = json.dumps(data.get('geometria')) if data.get('geometria') else None
+    # Parse geometria once here so the map never has to: the bounding box
+    # goes into the R-tree and area/centroid into terreni_geo
+    geometria_json = None
+    if data.get('geometria'):
+        try:
+            _, geometria_json = parse_geometry(data['geometria'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-    conn.execute('''INSERT INTO terreni
+    cursor = conn.execute('''INSERT INTO terreni
         (nome, superficie_ettari, tipo_terreno, ubicazione, foglio, particella, subalterno, geometria, note)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
         (data['nome'], data.get('superficie_ettari'), data.get('tipo_terreno'),
          data.get('ubicazione'), data.get('foglio'), data.get('particella'),
          data.get('subalterno'), geometria_json, data.get('note')))
+    index_terreno_geometry(conn, cursor.lastrowid, geometria_json)
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Terreno aggiunto con successo'})
 
 @app.route('/api/terreni/<int:id>', methods=['DELETE'])
 def delete_terreno(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM terreni WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Terreno eliminato con successo'})
 
+@app.route('/api/terreni/geo', methods=['GET'])
+@conditional('terreni')
+def get_terreni_geo():
+    """GeoJSON FeatureCollection of the parcels intersecting
+    ?bbox=min_lon,min_lat,max_lon,max_lat, found through the R-tree, or of
+    the parcels listed in ?ids=.
+
+    With ?zoom= the geometries are simplified to about one pixel at that
+    zoom level, and parcels smaller than that are sent as their centroid.
+    """
+    if 'ids' in request.args:
+        try:
+            ids = [int(v) for v in request.args['ids'].split(',')]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+        if len(ids) > MAX_IDS:
+            return jsonify({'error': f'At most {MAX_IDS} ids per request'}), 400
+        where, params = f"r.id IN ({', '.join('?' * len(ids))})", ids
+    else:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(v) for v in request.args['bbox'].split(','))
+        except (KeyError, ValueError):
+            return jsonify({'error': 'bbox=min_lon,min_lat,max_lon,max_lat or ids= is required'}), 400
+        where = 'r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?'
+        params = (min_lon, max_lon, min_lat, max_lat)
+    try:
+        tolerance = zoom_tolerance(float(request.args['zoom'])) if 'zoom' in request.args else 0
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'zoom must be a number'}), 400
+
+    conn = read_db()
+    rows = conn.execute(f'''
+        SELECT t.id, t.nome, t.tipo_terreno, t.superficie_ettari, t.geometria,
+               g.area_m2, g.centroid_lon, g.centroid_lat,
+               r.min_lon, r.max_lon, r.min_lat, r.max_lat
+        FROM terreni_rtree r
+        JOIN terreni t ON t.id = r.id
+        JOIN terreni_geo g ON g.id = r.id
+        WHERE {where}
+    ''', params)
+
+    features = []
+    for row in rows:
+        if tolerance and max(row['max_lon'] - row['min_lon'], row['max_lat'] - row['min_lat']) < tolerance:
+            geometry = {'type': 'Point', 'coordinates': [row['centroid_lon'], row['centroid_lat']]}
+        else:
+            # Rows saved before geometria was normalised may hold a Feature or FeatureCollection
+            geometry = bare_geometry(json.loads(row['geometria']))
+            if tolerance:
+                geometry = simplify_geometry(geometry, tolerance)
+        features.append({
+            'type': 'Feature',
+            'id': row['id'],
+            'geometry': geometry,
+            'bbox': [row['min_lon'], row['min_lat'], row['max_lon'], row['max_lat']],
+            'properties': {
+                'id': row['id'],
+                'nome': row['nome'],
+                'tipo_terreno': row['tipo_terreno'],
+                'superficie_ettari': row['superficie_ettari'],
+                'area_ettari': round(row['area_m2'] / 10000, 4),
+                'centroide': [row['centroid_lon'], row['centroid_lat']],
+            },
+        })
+
+    response = jsonify({'type': 'FeatureCollection', 'features': features})
+    response.mimetype = 'application/geo+json'
+    return response
+
 # ===== TRATTORI ROUTES =====
 
 @app.route('/api/trattori', methods=['GET'])
+@conditional('trattori')
 def get_trattori():
-    conn = get_db_connection()
-    trattori = conn.execute('SELECT * FROM trattori ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return jsonify([dict(t) for t in trattori])
+    return list_response('trattori')
+
+@app.route('/api/trattori/<int:id>', methods=['GET'])
+@conditional('trattori')
+def get_trattore(id):
+    return item_response('trattori', id)
 
 @app.route('/api/trattori', methods=['POST'])
 def add_trattore():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO trattori
         (marca, modello, anno, targa, numero_telaio, potenza_cv, ore_lavoro,
          data_acquisto, costo_acquisto, stato, note)
@@ -322,30 +3325,31 @@ def add_trattore():
          data.get('data_acquisto'), data.get('costo_acquisto'),
          data.get('stato', 'Operativo'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Trattore aggiunto con successo'})
 
 @app.route('/api/trattori/<int:id>', methods=['DELETE'])
 def delete_trattore(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM trattori WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Trattore eliminato con successo'})
 
 # ===== ATTREZZI ROUTES =====
 
 @app.route('/api/attrezzi', methods=['GET'])
+@conditional('attrezzi')
 def get_attrezzi():
-    conn = get_db_connection()
-    attrezzi = conn.execute('SELECT * FROM attrezzi ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return jsonify([dict(a) for a in attrezzi])
+    return list_response('attrezzi')
+
+@app.route('/api/attrezzi/<int:id>', methods=['GET'])
+@conditional('attrezzi')
+def get_attrezzo(id):
+    return item_response('attrezzi', id)
 
 @app.route('/api/attrezzi', methods=['POST'])
 def add_attrezzo():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO attrezzi
         (nome, tipo, marca, modello, anno_acquisto, costo_acquisto, stato, ultima_manutenzione, note)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
@@ -353,30 +3357,79 @@ def add_attrezzo():
          data.get('anno_acquisto'), data.get('costo_acquisto'),
          data.get('stato', 'Buono'), data.get('ultima_manutenzione'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Attrezzo aggiunto con successo'})
 
 @app.route('/api/attrezzi/<int:id>', methods=['DELETE'])
 def delete_attrezzo(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM attrezzi WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Attrezzo eliminato con successo'})
 
 # ===== ANIMALI ROUTES =====
 
 @app.route('/api/animali', methods=['GET'])
+@conditional('animali')
 def get_animali():
-    conn = get_db_connection()
-    animali = conn.execute('SELECT * FROM animali ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return jsonify([dict(a) for a in animali])
+    return list_response('animali')
+
+@app.route('/api/animali/<int:id>', methods=['GET'])
+@conditional('animali')
+def get_animale(id):
+    return item_response('animali', id)
+
+@app.route('/api/animali/<int:id>/ancestors', methods=['GET'])
+@conditional('animali')
+def get_animale_ancestors(id):
+    """Ancestors up to ?depth= generations back, each with the nearest
+    generation (1 = parents) it appears at"""
+    return lineage_response(ANCESTORS_SQL, id)
+
+@app.route('/api/animali/<int:id>/descendants', methods=['GET'])
+@conditional('animali')
+def get_animale_descendants(id):
+    """Descendants up to ?depth= generations down (1 = offspring)"""
+    return lineage_response(DESCENDANTS_SQL, id)
+
+@app.route('/api/animali/<int:id>/inbreeding', methods=['GET'])
+@conditional('animali')
+def get_animale_inbreeding(id):
+    """Inbreeding coefficient over ?depth= generations of pedigree"""
+    try:
+        depth = pedigree_depth(INBREEDING_DEPTH, MAX_INBREEDING_DEPTH)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conn = read_db()
+    row = conn.execute('SELECT padre_id, madre_id FROM animali WHERE id = ?', (id,)).fetchone()
+    if row is None:
+        return jsonify({'error': 'Record not found'}), 404
+    return jsonify({'id': id, 'padre_id': row['padre_id'], 'madre_id': row['madre_id'], 'generazioni': depth,
+                    'coefficiente': inbreeding(conn, row['padre_id'], row['madre_id'], depth)})
+
+@app.route('/api/animali/inbreeding', methods=['GET'])
+@conditional('animali')
+def get_mating_inbreeding():
+    """Inbreeding coefficient the offspring of ?padre_id=&madre_id= would
+    have, over ?depth= generations"""
+    try:
+        padre_id, madre_id = int(request.args['padre_id']), int(request.args['madre_id'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'padre_id and madre_id must be integers'}), 400
+    try:
+        depth = pedigree_depth(INBREEDING_DEPTH, MAX_INBREEDING_DEPTH)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conn = read_db()
+    found = conn.execute('SELECT COUNT(*) FROM animali WHERE id IN (?, ?)', (padre_id, madre_id)).fetchone()[0]
+    if found < len({padre_id, madre_id}):
+        return jsonify({'error': 'Record not found'}), 404
+    return jsonify({'padre_id': padre_id, 'madre_id': madre_id, 'generazioni': depth,
+                    'coefficiente': inbreeding(conn, padre_id, madre_id, depth)})
 
 @app.route('/api/animali', methods=['POST'])
 def add_animale():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO animali
         (specie, razza, identificativo, data_nascita, sesso, peso_kg,
          stato_salute, padre_id, madre_id, note)
@@ -386,35 +3439,31 @@ def add_animale():
          data.get('stato_salute', 'Sano'), data.get('padre_id'),
          data.get('madre_id'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Animale aggiunto con successo'})
 
 @app.route('/api/animali/<int:id>', methods=['DELETE'])
 def delete_animale(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM animali WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Animale eliminato con successo'})
 
 # ===== COLTURE ROUTES =====
 
 @app.route('/api/colture', methods=['GET'])
+@conditional('colture', 'terreni')
 def get_colture():
-    conn = get_db_connection()
-    colture = conn.execute('''
-        SELECT c.*, t.nome as nome_terreno
-        FROM colture c
-        LEFT JOIN terreni t ON c.terreno_id = t.id
-        ORDER BY c.created_at DESC
-    ''').fetchall()
-    conn.close()
-    return jsonify([dict(c) for c in colture])
+    return list_response('colture')
+
+@app.route('/api/colture/<int:id>', methods=['GET'])
+@conditional('colture', 'terreni')
+def get_coltura(id):
+    return item_response('colture', id)
 
 @app.route('/api/colture', methods=['POST'])
 def add_coltura():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO colture
         (terreno_id, tipo_coltura, varieta, data_semina, data_raccolta_prevista,
          data_raccolta_effettiva, quantita_raccolta_kg, stato, note)
@@ -424,30 +3473,31 @@ def add_coltura():
          data.get('data_raccolta_effettiva'), data.get('quantita_raccolta_kg'),
          data.get('stato', 'In corso'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Coltura aggiunta con successo'})
 
 @app.route('/api/colture/<int:id>', methods=['DELETE'])
 def delete_coltura(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM colture WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Coltura eliminata con successo'})
 
 # ===== PERSONALE ROUTES =====
 
 @app.route('/api/personale', methods=['GET'])
+@conditional('personale')
 def get_personale():
-    conn = get_db_connection()
-    personale = conn.execute('SELECT * FROM personale ORDER BY cognome, nome').fetchall()
-    conn.close()
-    return jsonify([dict(p) for p in personale])
+    return list_response('personale')
+
+@app.route('/api/personale/<int:id>', methods=['GET'])
+@conditional('personale')
+def get_dipendente(id):
+    return item_response('personale', id)
 
 @app.route('/api/personale', methods=['POST'])
 def add_personale():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO personale
         (nome, cognome, ruolo, telefono, email, data_assunzione,
          tipo_contratto, retribuzione_mensile, note)
@@ -456,30 +3506,31 @@ def add_personale():
          data.get('email'), data.get('data_assunzione'), data.get('tipo_contratto'),
          data.get('retribuzione_mensile'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Dipendente aggiunto con successo'})
 
 @app.route('/api/personale/<int:id>', methods=['DELETE'])
 def delete_personale(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM personale WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Dipendente eliminato con successo'})
 
 # ===== MAGAZZINO ROUTES =====
 
 @app.route('/api/magazzino', methods=['GET'])
+@conditional('magazzino')
 def get_magazzino():
-    conn = get_db_connection()
-    magazzino = conn.execute('SELECT * FROM magazzino ORDER BY categoria, nome_prodotto').fetchall()
-    conn.close()
-    return jsonify([dict(m) for m in magazzino])
+    return list_response('magazzino')
+
+@app.route('/api/magazzino/<int:id>', methods=['GET'])
+@conditional('magazzino')
+def get_prodotto(id):
+    return item_response('magazzino', id)
 
 @app.route('/api/magazzino', methods=['POST'])
 def add_magazzino():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO magazzino
         (categoria, nome_prodotto, marca, quantita, unita_misura, data_acquisto,
          costo_unitario, scadenza, fornitore, note)
@@ -488,30 +3539,31 @@ def add_magazzino():
          data.get('unita_misura'), data.get('data_acquisto'), data.get('costo_unitario'),
          data.get('scadenza'), data.get('fornitore'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Prodotto aggiunto con successo'})
 
 @app.route('/api/magazzino/<int:id>', methods=['DELETE'])
 def delete_magazzino(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM magazzino WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Prodotto eliminato con successo'})
 
 # ===== MANUTENZIONI ROUTES =====
 
 @app.route('/api/manutenzioni', methods=['GET'])
+@conditional('manutenzioni')
 def get_manutenzioni():
-    conn = get_db_connection()
-    manutenzioni = conn.execute('SELECT * FROM manutenzioni ORDER BY data_manutenzione DESC').fetchall()
-    conn.close()
-    return jsonify([dict(m) for m in manutenzioni])
+    return list_response('manutenzioni')
+
+@app.route('/api/manutenzioni/<int:id>', methods=['GET'])
+@conditional('manutenzioni')
+def get_manutenzione(id):
+    return item_response('manutenzioni', id)
 
 @app.route('/api/manutenzioni', methods=['POST'])
 def add_manutenzione():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO manutenzioni
         (tipo_oggetto, oggetto_id, data_manutenzione, tipo_manutenzione,
          descrizione, costo, eseguita_da, prossima_manutenzione, note)
@@ -520,30 +3572,31 @@ def add_manutenzione():
          data.get('tipo_manutenzione'), data.get('descrizione'), data.get('costo'),
          data.get('eseguita_da'), data.get('prossima_manutenzione'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Manutenzione registrata con successo'})
 
 @app.route('/api/manutenzioni/<int:id>', methods=['DELETE'])
 def delete_manutenzione(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM manutenzioni WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Manutenzione eliminata con successo'})
 
 # ===== FINANZE ROUTES =====
 
 @app.route('/api/finanze', methods=['GET'])
+@conditional('finanze')
 def get_finanze():
-    conn = get_db_connection()
-    finanze = conn.execute('SELECT * FROM finanze ORDER BY data_operazione DESC').fetchall()
-    conn.close()
-    return jsonify([dict(f) for f in finanze])
+    return list_response('finanze')
+
+@app.route('/api/finanze/<int:id>', methods=['GET'])
+@conditional('finanze')
+def get_finanza(id):
+    return item_response('finanze', id)
 
 @app.route('/api/finanze', methods=['POST'])
 def add_finanza():
     data = request.get_json()
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('''INSERT INTO finanze
         (tipo, categoria, descrizione, importo, data_operazione,
          metodo_pagamento, riferimento, note)
@@ -552,38 +3605,741 @@ def add_finanza():
          data['data_operazione'], data.get('metodo_pagamento'),
          data.get('riferimento'), data.get('note')))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Operazione registrata con successo'})
 
 @app.route('/api/finanze/<int:id>', methods=['DELETE'])
 def delete_finanza(id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM finanze WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True, 'message': 'Operazione eliminata con successo'})
 
+# ===== BULK IMPORT/EXPORT ROUTES =====
+
+# Columns accepted when writing rows: required ones, then optional ones with
+# the same defaults the single-row add_* handlers use.
+WRITE_SPECS = {
+    'terreni': {
+        'required': ('nome',),
+        'optional': {'superficie_ettari': None, 'tipo_terreno': None, 'ubicazione': None, 'foglio': None,
+                     'particella': None, 'subalterno': None, 'geometria': None, 'note': None},
+    },
+    'trattori': {
+        'required': ('marca', 'modello'),
+        'optional': {'anno': None, 'targa': None, 'numero_telaio': None, 'potenza_cv': None, 'ore_lavoro': 0,
+                     'data_acquisto': None, 'costo_acquisto': None, 'stato': 'Operativo', 'note': None},
+    },
+    'attrezzi': {
+        'required': ('nome',),
+        'optional': {'tipo': None, 'marca': None, 'modello': None, 'anno_acquisto': None, 'costo_acquisto': None,
+                     'stato': 'Buono', 'ultima_manutenzione': None, 'note': None},
+    },
+    'animali': {
+        'required': ('specie',),
+        'optional': {'razza': None, 'identificativo': None, 'data_nascita': None, 'sesso': None, 'peso_kg': None,
+                     'stato_salute': 'Sano', 'padre_id': None, 'madre_id': None, 'note': None},
+    },
+    'colture': {
+        'required': ('terreno_id', 'tipo_coltura'),
+        'optional': {'varieta': None, 'data_semina': None, 'data_raccolta_prevista': None,
+                     'data_raccolta_effettiva': None, 'quantita_raccolta_kg': None, 'stato': 'In corso',
+                     'note': None},
+    },
+    'personale': {
+        'required': ('nome', 'cognome'),
+        'optional': {'ruolo': None, 'telefono': None, 'email': None, 'data_assunzione': None,
+                     'tipo_contratto': None, 'retribuzione_mensile': None, 'note': None},
+    },
+    'magazzino': {
+        'required': ('categoria', 'nome_prodotto', 'quantita'),
+        'optional': {'marca': None, 'unita_misura': None, 'data_acquisto': None, 'costo_unitario': None,
+                     'scadenza': None, 'fornitore': None, 'note': None},
+    },
+    'manutenzioni': {
+        'required': ('tipo_oggetto', 'oggetto_id', 'data_manutenzione'),
+        'optional': {'tipo_manutenzione': None, 'descrizione': None, 'costo': None, 'eseguita_da': None,
+                     'prossima_manutenzione': None, 'note': None},
+    },
+    'finanze': {
+        'required': ('tipo', 'categoria', 'descrizione', 'importo', 'data_operazione'),
+        'optional': {'metodo_pagamento': None, 'riferimento': None, 'note': None},
+    },
+}
+
+# Columns produced by an export that an import silently drops
+IGNORED_IMPORT_FIELDS = ('id', 'created_at')
+
+MAX_REPORTED_ERRORS = 100
+EXPORT_CHUNK_ROWS = 500
+
+def write_columns(table):
+    spec = WRITE_SPECS[table]
+    return list(spec['required']) + list(spec['optional'])
+
+def row_values(conn, table, data):
+    """Validate one incoming record and return its values in write_columns()
+    order. Empty strings (as found in CSV) count as missing and numeric
+    columns are converted from text. Raises ValueError describing the first
+    problem."""
+    spec = WRITE_SPECS[table]
+    unknown = [k for k in data if k not in spec['optional'] and k not in spec['required']
+               and k not in IGNORED_IMPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+
+    values = []
+    for column in spec['required']:
+        value = data.get(column)
+        if value is None or value == '':
+            raise ValueError(f'Missing required field: {column}')
+        values.append(value)
+    for column, default in spec['optional'].items():
+        value = data.get(column)
+        values.append(default if value is None or value == '' else value)
+
+    types = column_types(conn, table)
+    for i, column in enumerate(write_columns(table)):
+        if isinstance(values[i], str) and types[column] in ('INTEGER', 'REAL'):
+            try:
+                number = float(values[i])
+            except ValueError:
+                raise ValueError(f'Invalid number for {column}: {values[i]}')
+            values[i] = int(number) if types[column] == 'INTEGER' and number.is_integer() else number
+
+    # geometria is validated and stored as GeoJSON text
+    if table == 'terreni':
+        index = write_columns(table).index('geometria')
+        if values[index] is not None:
+            _, values[index] = parse_geometry(values[index])
+    return values
+
+def _index_inserted_terreno(conn, terreno_id, values):
+    index_terreno_geometry(conn, terreno_id, values[write_columns('terreni').index('geometria')])
+
+# Per-table work done in the same transaction after each inserted row
+AFTER_INSERT = {
+    'terreni': _index_inserted_terreno,
+}
+
+class WSGIInput(io.RawIOBase):
+    """Raw file view of a WSGI input stream for io.TextIOWrapper. werkzeug
+    hands over the server's own stream when it marks the body as
+    terminated, and gunicorn's only has read()."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def read_import_records(stream, fmt):
+    """Yield (line number, record dict or ValueError) from a CSV or NDJSON body"""
+    text = io.TextIOWrapper(io.BufferedReader(WSGIInput(stream)), encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, ValueError('Too many values in row')
+            else:
+                yield reader.line_num, record
+        return
+
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_num, ValueError('Invalid JSON')
+            continue
+        if isinstance(record, dict):
+            yield line_num, record
+        else:
+            yield line_num, ValueError('Each line must be a JSON object')
+
+def insert_batch(conn, table, sql, batch, errors):
+    """Insert a batch in one transaction. If the batch fails, retry it row by
+    row so only the offending rows are reported. Returns rows inserted."""
+    after_insert = AFTER_INSERT.get(table)
+
+    def insert(values):
+        row_id = conn.execute(sql, values).lastrowid
+        after_insert(conn, row_id, values)
+
+    try:
+        with conn:
+            if after_insert:
+                for _, values in batch:
+                    insert(values)
+            else:
+                conn.executemany(sql, [values for _, values in batch])
+        return len(batch)
+    except sqlite3.Error:
+        pass
+
+    inserted = 0
+    for line_num, values in batch:
+        try:
+            with conn:
+                if after_insert:
+                    insert(values)
+                else:
+                    conn.execute(sql, values)
+            inserted += 1
+        except sqlite3.Error as e:
+            errors.append({'row': line_num, 'error': str(e)})
+    return inserted
+
+def import_format():
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('format must be csv or ndjson')
+    return fmt
+
+@app.route('/api/<table>/bulk', methods=['POST'])
+def bulk_import(table):
+    """Insert many rows from a streamed CSV or NDJSON body.
+
+    Rows are inserted with executemany in transactions of BULK_BATCH_SIZE.
+    Invalid rows are skipped and reported with their line number.
+    """
+    if table not in WRITE_SPECS:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    try:
+        fmt = import_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db()
+    columns = write_columns(table)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    batch_size = app.config['BULK_BATCH_SIZE']
+
+    inserted, errors, batch = 0, [], []
+    try:
+        for line_num, record in read_import_records(request.stream, fmt):
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                values = row_values(conn, table, record)
+            except ValueError as e:
+                errors.append({'row': line_num, 'error': str(e)})
+                continue
+            batch.append((line_num, values))
+            if len(batch) >= batch_size:
+                inserted += insert_batch(conn, table, sql, batch, errors)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        errors.append({'row': None, 'error': f'Unreadable body: {e}'})
+    if batch:
+        inserted += insert_batch(conn, table, sql, batch, errors)
+
+    return jsonify({
+        'success': not errors,
+        'inserted': inserted,
+        'error_count': len(errors),
+        'errors': errors[:MAX_REPORTED_ERRORS],
+        'message': f'{inserted} righe importate, {len(errors)} scartate',
+    }), 200 if inserted or not errors else 400
+
+@app.route('/api/<table>/export', methods=['GET'])
+def bulk_export(table):
+    """Stream a table as CSV or NDJSON straight from the cursor.
+
+    Accepts the same ?fields=, filter and date arguments as the list endpoint.
+    """
+    if table not in LIST_SPECS:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    conn = read_db()
+    try:
+        sql, params, fields, _ = build_list_query(conn, table, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cursor = conn.execute(sql, params)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(fields)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                if writer:
+                    writer.writerow([row[f] for f in fields])
+                else:
+                    buffer.write(dumps({f: row[f] for f in fields}).decode() + '\n')
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{fmt}'
+    return response
+
+# ===== BATCH WRITE ROUTES =====
+
+MAX_BATCH_OPERATIONS = 1000
+
+def batch_operations(conn, data):
+    """Validate a /api/batch body and return (op, table, id or values) tuples.
+    Raises ValueError naming the first invalid operation."""
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f'At most {MAX_BATCH_OPERATIONS} operations per batch')
+
+    validated = []
+    for i, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise ValueError('must be an object')
+            op, table = operation.get('op'), operation.get('table')
+            if table not in WRITE_SPECS:
+                raise ValueError(f'Unknown table: {table}')
+            if op == 'insert':
+                if not isinstance(operation.get('data'), dict):
+                    raise ValueError('data must be an object')
+                validated.append((op, table, row_values(conn, table, operation['data'])))
+            elif op == 'delete':
+                if not isinstance(operation.get('id'), int):
+                    raise ValueError('id must be an integer')
+                validated.append((op, table, operation['id']))
+            else:
+                raise ValueError('op must be insert or delete')
+        except ValueError as e:
+            raise ValueError(f'operations[{i}]: {e}')
+    return validated
+
+def apply_operations(conn, operations):
+    """Write unit for run_write(): execute validated operations in order"""
+    results = []
+    for i, (op, table, arg) in enumerate(operations):
+        try:
+            if op == 'insert':
+                columns = write_columns(table)
+                row_id = conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                      f"VALUES ({', '.join('?' * len(columns))})", arg).lastrowid
+                if table in AFTER_INSERT:
+                    AFTER_INSERT[table](conn, row_id, arg)
+                results.append({'op': op, 'table': table, 'id': row_id})
+            else:
+                deleted = conn.execute(f'DELETE FROM {table} WHERE id = ?', (arg,)).rowcount
+                results.append({'op': op, 'table': table, 'id': arg, 'deleted': deleted})
+        except sqlite3.Error as e:
+            raise ValueError(f'operations[{i}]: {e}')
+    return results
+
+@app.route('/api/batch', methods=['POST'])
+def batch_write():
+    """Apply a list of inserts and deletes across the farm tables with
+    all-or-nothing semantics.
+
+    Body: {"operations": [{"op": "insert", "table": "terreni", "data": {...}},
+                          {"op": "delete", "table": "animali", "id": 7}, ...]}
+    """
+    conn = get_db()
+    try:
+        operations = batch_operations(conn, request.get_json(silent=True))
+        results = run_write(functools.partial(apply_operations, operations=operations))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.OperationalError as e:
+        return overloaded('database_busy', f'Database unavailable: {e}', 1)
+    return jsonify({'success': True, 'results': results,
+                    'message': f'{len(results)} operazioni eseguite con successo'})
+
+# ===== SEARCH ROUTES =====
+
+MAX_SEARCH_RESULTS = 100
+
+def search_query(q):
+    """FTS5 MATCH expression for free text: every word must match, the last
+    one also as a prefix; words are quoted so FTS syntax is never interpreted"""
+    words = re.findall(r'\w+', q)
+    if not words:
+        raise ValueError('q must contain at least one word')
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_excerpt(text, words, size=12):
+    """About `size` words of text around the first one matching a query word"""
+    tokens = (text or '').split()
+    hit = next((i for i, token in enumerate(tokens)
+                if any(token.lower().startswith(word) for word in words)), 0)
+    start = max(0, min(hit - size // 3, len(tokens) - size))
+    excerpt = ' '.join(tokens[start:start + size])
+    return ('…' if start > 0 else '') + excerpt + ('…' if start + size < len(tokens) else '')
+
+@app.route('/api/search', methods=['GET'])
+@conditional(*SEARCH_COLUMNS)
+def search():
+    """Ranked hits for ?q= across the farm tables.
+
+    ?tipo= restricts the search to some tables (comma-separated) and
+    ?limit= (default 20) pages the results with the cursor returned in the
+    X-Next-Cursor header, as for the list endpoints.
+    """
+    try:
+        match = search_query(request.args.get('q', ''))
+        limit = int(request.args.get('limit', 20))
+        if not 1 <= limit <= MAX_SEARCH_RESULTS:
+            raise ValueError(f'limit must be between 1 and {MAX_SEARCH_RESULTS}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    candidates, params = 'search_index MATCH ?', [match]
+    if request.args.get('tipo'):
+        tables = request.args['tipo'].split(',')
+        unknown = [t for t in tables if t not in SEARCH_COLUMNS]
+        if unknown:
+            return jsonify({'error': f"Unknown tipo: {', '.join(unknown)}"}), 400
+        candidates += f" AND tabella IN ({', '.join('?' * len(tables))})"
+        params += tables
+    after = ''
+    if request.args.get('cursor'):
+        try:
+            score, rowid = decode_cursor(request.args['cursor'], 2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        after = 'WHERE score > ? OR (score = ? AND rowid > ?)'
+        params += [score, score, rowid]
+
+    # Every match is scored, so any hit is reachable whatever its table or
+    # age; title matches weigh more than the other text columns
+    conn = read_db()
+    rows = conn.execute(f'''
+        SELECT * FROM (
+            SELECT rowid, tabella, riga, titolo, bm25(search_index, 0, 0, 10.0, 1.0) AS score
+            FROM search_index WHERE {candidates}
+        ) {after}
+        ORDER BY score, rowid LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    page = rows[:limit]
+
+    # Excerpts only for the rows returned, looked up by rowid: snippet()
+    # would need the MATCH again, which walks the whole doclist
+    texts = dict(conn.execute(f'''
+        SELECT rowid, testo FROM search_index WHERE rowid IN ({', '.join('?' * len(page))})
+    ''', [row['rowid'] for row in page]).fetchall()) if page else {}
+    words = [w.lower() for w in re.findall(r'\w+', request.args['q'])]
+
+    response = jsonify([{'tipo': row['tabella'], 'id': row['riga'], 'titolo': row['titolo'],
+                         'estratto': search_excerpt(texts.get(row['rowid']), words),
+                         'punteggio': round(-row['score'], 6)}
+                        for row in page])
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor([page[-1]['score'], page[-1]['rowid']])
+    return response
+
+# ===== REPORT ROUTES =====
+
+@app.route('/api/reports', methods=['POST'])
+def create_report():
+    """Queue a report: {"report": "finanze_categorie", "params": {"from": ..., "to": ...}}.
+
+    Answers 200 with the result when it is already cached for the current
+    data, otherwise 202 with the job to poll at /api/reports/<id>.
+    """
+    data = request.get_json(silent=True) or {}
+    report = data.get('report')
+    if report not in REPORTS:
+        return jsonify({'error': f"report must be one of: {', '.join(REPORTS)}"}), 400
+    try:
+        params = report_params(data.get('params'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = submit_report(get_db(), report, params)
+    body = report_job_json(job)
+    body['url'] = f"/api/reports/{job['id']}"
+    return jsonify(body), 200 if job['status'] == 'done' else 202
+
+@app.route('/api/reports/<job_id>', methods=['GET'])
+def get_report(job_id):
+    conn = get_db()
+    job = conn.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is None:
+        return jsonify({'error': 'Record not found'}), 404
+    if report_expired(job):
+        with conn:
+            conn.execute('''UPDATE report_jobs SET status = 'failed', error = 'Timed out',
+                            finished_at = CURRENT_TIMESTAMP WHERE id = ?''', (job_id,))
+        job = conn.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+    return jsonify(report_job_json(job))
+
+# ===== CHANGE FEED ROUTES =====
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Inserts, updates and deletes after ?since=<seq>, oldest first, with
+    the current row of inserted/updated records. Without ?since= only the
+    current position is returned, to start syncing from.
+
+    Answers 410 Gone when entries after `since` have already been pruned:
+    the client must reload the tables and restart from last_seq.
+    """
+    conn = get_db()
+    prune_change_log(conn)
+    first, last = change_log_bounds(conn)
+    if 'since' not in request.args:
+        return jsonify({'changes': [], 'last_seq': last, 'has_more': False})
+    try:
+        since = int(request.args['since'])
+        limit = min(int(request.args.get('limit', MAX_CHANGES)), MAX_CHANGES)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < last and (first is None or since < first - 1):
+        return jsonify({'error': 'Changes no longer available, reload the data', 'last_seq': last}), 410
+
+    changes = read_changes(conn, since, limit, with_data=True)
+    return jsonify({'changes': changes, 'last_seq': changes[-1]['seq'] if changes else max(since, last),
+                    'has_more': len(changes) == limit})
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """Server-sent events for every change after Last-Event-ID (or ?since=).
+
+    Each stream holds a server thread, so at most SSE_MAX_CLIENTS are open
+    per process (503 beyond that; clients fall back to polling /api/changes)
+    and each is closed after SSE_MAX_SECONDS, when EventSource reconnects
+    and resumes from the last event id.
+    """
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', -1))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+    # The slot is taken here, under the same lock as the check, and given
+    # back when the server closes the response (even if never iterated)
+    with _change_log_lock:
+        if _sse_clients['count'] >= app.config['SSE_MAX_CLIENTS']:
+            response = jsonify({'error': 'Too many event streams'})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+        _sse_clients['count'] += 1
+
+    def release():
+        with _change_log_lock:
+            _sse_clients['count'] -= 1
+
+    def generate(since):
+        conn = get_db()
+        if since < 0:
+            since = change_log_bounds(conn)[1]
+        yield f"retry: {app.config['SSE_RETRY_MS']}\n\n"
+        deadline = time.monotonic() + app.config['SSE_MAX_SECONDS']
+        heartbeat = time.monotonic()
+        while time.monotonic() < deadline:
+            changes = read_changes(conn, since, MAX_CHANGES)
+            for change in changes:
+                yield f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+                since = change['seq']
+            if changes:
+                continue
+            if time.monotonic() - heartbeat > 15:
+                yield ': keepalive\n\n'
+                heartbeat = time.monotonic()
+            time.sleep(app.config['SSE_POLL_MS'] / 1000)
+
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(release)
+    return response
+
+# ===== SCADENZE ROUTES =====
+
+@app.route('/api/scadenze', methods=['GET'])
+def get_scadenze():
+    """Manutenzioni and magazzino expiries due within ?within= (default 30d,
+    overdue ones included), soonest first, followed by the trattori within
+    ?ore= working hours of their next service. Answered from the scadenze
+    queue, without reading the source tables."""
+    try:
+        days = parse_within(request.args.get('within', '30d'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        ore = int(request.args.get('ore', app.config['SCADENZE_PREAVVISO_ORE']))
+    except ValueError:
+        return jsonify({'error': 'ore must be an integer'}), 400
+    return jsonify(due_entries(get_db(), days, ore))
+
+# ===== MAINTENANCE ROUTES =====
+
+@app.route('/api/maintenance', methods=['GET'])
+def get_maintenance():
+    """Last run of each maintenance task, database size and the backups kept"""
+    conn = get_db()
+    runs = {row['task']: maintenance_run_json(row) for row in conn.execute('SELECT * FROM maintenance_runs')}
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return jsonify({
+        'tasks': [runs.get(task, {'task': task, 'status': None}) | {'interval_s': maintenance_interval(task)}
+                  for task in MAINTENANCE],
+        'database': {'bytes': page_size * conn.execute('PRAGMA page_count').fetchone()[0],
+                     'free_bytes': page_size * conn.execute('PRAGMA freelist_count').fetchone()[0],
+                     'auto_vacuum': ('none', 'full', 'incremental')[conn.execute('PRAGMA auto_vacuum').fetchone()[0]]},
+        'backups': list_backups(),
+    })
+
+@app.route('/api/maintenance/<task>', methods=['POST'])
+def run_maintenance_task(task):
+    """Run a maintenance task now, e.g. a backup before an upgrade"""
+    if task not in MAINTENANCE:
+        return jsonify({'error': f"task must be one of: {', '.join(MAINTENANCE)}"}), 400
+    if task == 'archive' and app.config['ARCHIVE_AFTER_DAYS'] <= 0:
+        return jsonify({'error': 'Archiving is disabled (ARCHIVE_AFTER_DAYS=0)'}), 400
+    row = run_maintenance(get_db(), task)
+    if row is None:
+        return jsonify({'error': f'{task} is already running'}), 409
+    if row['status'] == 'failed':
+        return jsonify({'error': f"{task} failed: {row['error']}"}), 500
+    return jsonify(maintenance_run_json(row))
+
+# ===== DASHBOARD ROUTES =====
+
+@app.route('/api/dashboard', methods=['GET'])
+@conditional(*DASHBOARD_TABLES)
+def get_dashboard():
+    """Everything farm.html needs to paint a section, from one connection:
+    the stats (data and rendered grid), the first page of ?section= as HTML
+    and, with ?terreni=1, the terreni for the colture form select."""
+    section = request.args.get('section', 'dashboard')
+    if section not in DASHBOARD_SECTIONS:
+        return jsonify({'error': f"section must be one of: {', '.join(DASHBOARD_SECTIONS)}"}), 400
+
+    conn = read_db()
+    fragments = {'dashboard': render_fragment(conn, 'dashboard')[0]}
+    if section != 'dashboard':
+        fragments[section] = render_fragment(conn, section)[0]
+    body = {'section': section, 'stats': compute_stats(conn), 'fragments': fragments}
+    if request.args.get('terreni') == '1':
+        sql, params, fields, _ = build_list_query(conn, 'terreni', {'fields': 'id,nome,superficie_ettari'})
+        body['terreni'] = [{f: row[f] for f in fields} for row in conn.execute(sql, params)]
+    return json_response(body)
+
+@app.route('/api/dashboard/<section>', methods=['GET'])
+@conditional(*DASHBOARD_TABLES)
+def get_dashboard_fragment(section):
+    """HTML of a dashboard section; ?cursor= (from X-Next-Cursor or the
+    "Carica altri" button) returns the rows of the following page, ?ids=
+    only the rows with those ids (the rows the live updates patch)"""
+    if section not in DASHBOARD_SECTIONS:
+        return jsonify({'error': 'Record not found'}), 404
+    try:
+        html, next_cursor = render_fragment(read_db(), section, request.args.get('cursor'),
+                                            request.args.get('ids'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = Response(html, mimetype='text/html')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# ===== SERIES ROUTES =====
+
+@app.route('/api/series/<name>', methods=['GET'])
+@conditional('numbers', 'finanze')
+def get_series(name):
+    """Downsampled time series (numbers, spese, ricavi): count, sum, min, max
+    and avg per ?step= (15m, 1h, 1d, 1w, 1mo, 1y, ...) between ?from= and
+    ?to= (dates, to included; default from the first point to today). The
+    rollup read and the step used are returned in X-Series-Rollup and
+    X-Series-Step."""
+    if name not in SERIES:
+        return jsonify({'error': 'Record not found'}), 404
+    conn = read_db()
+    try:
+        fmt = json_format()
+        end = parse_date(request.args['to'], 'to') if 'to' in request.args \
+            else datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        if 'from' in request.args:
+            start = parse_date(request.args['from'], 'from')
+        else:
+            start = conn.execute("SELECT MIN(bucket) FROM series_rollups WHERE serie = ? AND step = 'month'",
+                                 (name,)).fetchone()[0] or end
+        if start > end:
+            raise ValueError('from must not be after to')
+        sql, params, rollup, step = series_query(conn, name, start, end, request.args.get('step'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = rows_response(conn.execute(sql, params), ['t', 'count', 'sum', 'min', 'max', 'avg'], fmt,
+                             stream=False)
+    response.headers['X-Series-Rollup'] = rollup
+    response.headers['X-Series-Step'] = step
+    return response
+
 # ===== STATISTICS ROUTES =====
 
+def compute_stats(conn):
+    """Dashboard figures read from the summary tables that the stats_*
+    triggers keep up to date, so the cost does not grow with the data."""
+    stats = dict(conn.execute('SELECT * FROM stats_summary WHERE id = 1').fetchone())
+    del stats['id']
+    stats['terreni_superficie'] = round(stats['terreni_superficie'], 4)
+    stats['spese_totali'] = round(stats['spese_totali'], 2)
+    stats['ricavi_totali'] = round(stats['ricavi_totali'], 2)
+    stats['bilancio'] = round(stats['ricavi_totali'] - stats['spese_totali'], 2)
+
+    stats['superficie_per_tipo'] = [
+        {'tipo_terreno': row['tipo_terreno'], 'terreni': row['terreni'],
+         'superficie': round(row['superficie'], 4)}
+        for row in conn.execute('SELECT * FROM stats_terreni_tipo ORDER BY tipo_terreno')
+    ]
+
+    mensili = {}
+    for row in conn.execute('SELECT mese, tipo, totale FROM stats_finanze_mensili ORDER BY mese'):
+        mese = mensili.setdefault(row['mese'], {'mese': row['mese'], 'spese': 0, 'ricavi': 0})
+        if row['tipo'] == 'Spesa':
+            mese['spese'] = round(row['totale'], 2)
+        elif row['tipo'] == 'Ricavo':
+            mese['ricavi'] = round(row['totale'], 2)
+    stats['finanze_mensili'] = list(mensili.values())
+    return stats
+
 @app.route('/api/stats', methods=['GET'])
+@conditional(*STATS_TABLES)
 def get_stats():
-    conn = get_db_connection()
+    return jsonify(compute_stats(read_db()))
+
+# ============= STARTUP =============
+
+_startup['import'] = time.perf_counter() - _startup['import_started']
+
+def bootstrap():
+    """Application factory for gunicorn --preload ('app:bootstrap()').
 
-    stats = {
-        'terreni_count': conn.execute('SELECT COUNT(*) as count FROM terreni').fetchone()['count'],
-        'terreni_superficie': conn.execute('SELECT COALESCE(SUM(superficie_ettari), 0) as sum FROM terreni').fetchone()['sum'],
-        'trattori_count': conn.execute('SELECT COUNT(*) as count FROM trattori').fetchone()['count'],
-        'attrezzi_count': conn.execute('SELECT COUNT(*) as count FROM attrezzi').fetchone()['count'],
-        'animali_count': conn.execute('SELECT COUNT(*) as count FROM animali').fetchone()['count'],
-        'colture_attive': conn.execute("SELECT COUNT(*) as count FROM colture WHERE stato = 'In corso'").fetchone()['count'],
-        'personale_count': conn.execute('SELECT COUNT(*) as count FROM personale').fetchone()['count'],
-        'spese_totali': conn.execute("SELECT COALESCE(SUM(importo), 0) as sum FROM finanze WHERE tipo = 'Spesa'").fetchone()['sum'],
-        'ricavi_totali': conn.execute("SELECT COALESCE(SUM(importo), 0) as sum FROM finanze WHERE tipo = 'Ricavo'").fetchone()['sum']
-    }
-
-    conn.close()
-    return jsonify(stats)
+    Runs once in the master process: the schema check happens before any
+    worker exists, and the workers fork from the already imported app
+    instead of importing it again each.
+    """
+    start = time.perf_counter()
+    applied = init_db()
+    _startup['schema'] = time.perf_counter() - start
+    _startup['ready'] = time.perf_counter() - _startup['import_started']
+    _startup['cpu'] = time.process_time()  # includes the interpreter and library imports
+    print(f"Startup: ready in {_startup['ready']:.3f}s (import {_startup['import']:.3f}s, "
+          f"schema {_startup['schema']:.3f}s, {len(applied)} migrations applied), "
+          f"{_startup['cpu']:.3f}s CPU since process start", flush=True)
+    return app
 
 if __name__ == '__main__':
-    init_db()
+    bootstrap()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,158 @@
+"""Fail if an endpoint returns wrong results for data written through the API.
+
+Each check builds a fresh database through init_db(), writes its rows with
+the same requests the web pages send and compares what the read endpoints
+answer with the expected values. Exits non-zero listing the failed checks.
+
+    python bench/api_checks.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db, get_db_connection  # noqa: E402
+
+
+def post(client, url, data):
+    response = client.post(url, json=data)
+    if response.status_code != 200:
+        raise AssertionError(f'POST {url} returned {response.status_code}: {response.get_data(as_text=True)}')
+    return response.get_json()
+
+
+def run_report(client, report, params=None):
+    """Result of a report, waiting for the job if it was queued"""
+    job = client.post('/api/reports', json={'report': report, 'params': params or {}}).get_json()
+    deadline = time.monotonic() + 60
+    while job['status'] not in ('done', 'failed') and time.monotonic() < deadline:
+        time.sleep(0.1)
+        job = client.get(f"/api/reports/{job['id']}").get_json()
+    if job['status'] != 'done':
+        raise AssertionError(f"report {report} ended {job['status']}: {job.get('error')}")
+    return job['result']
+
+
+def check_costi_trattori(client):
+    """Maintenance entered from the manutenzioni form counts towards its tractor"""
+    post(client, '/api/trattori', {'marca': 'Fiat', 'modello': '880', 'ore_lavoro': 100})
+    post(client, '/api/trattori', {'marca': 'Landini', 'modello': '6500'})
+    for costo, data in ((500, '2026-03-01'), (250.5, '2026-05-10')):
+        post(client, '/api/manutenzioni', {'tipo_oggetto': 'Trattore', 'oggetto_id': 1,
+                                           'data_manutenzione': data, 'costo': costo})
+    post(client, '/api/manutenzioni', {'tipo_oggetto': 'Attrezzo', 'oggetto_id': 2,
+                                       'data_manutenzione': '2026-03-01', 'costo': 99})
+
+    result = run_report(client, 'costi_trattori')
+    righe = {r['id']: r for r in result['righe']}
+    assert (righe[1]['interventi'], righe[1]['costo_totale']) == (2, 750.5), righe[1]
+    assert righe[1]['costo_per_ora'] == 7.5, righe[1]
+    assert (righe[2]['interventi'], righe[2]['costo_totale']) == (0, 0), righe[2]
+    assert result['costo_totale'] == 750.5, result
+    result = run_report(client, 'costi_trattori', {'from': '2026-04-01'})
+    assert result['costo_totale'] == 250.5, result
+
+
+def check_series_first_day(client):
+    """Sub-day steps read the source rows: a date-only row on the first day
+    of the range must count, as it does with the rollup steps"""
+    for data, importo in (('2025-01-01', 10), ('2025-01-02', 20), ('2025-01-03', 40), ('2025-01-04', 80)):
+        post(client, '/api/finanze', {'tipo': 'Spesa', 'categoria': 'Gasolio', 'descrizione': 'Pieno',
+                                      'importo': importo, 'data_operazione': data})
+    for step in ('12h', '6h', '1d', '1w', '1mo'):
+        response = client.get(f'/api/series/spese?from=2025-01-01&to=2025-01-03&step={step}')
+        points = response.get_json()
+        assert response.status_code == 200, (step, points)
+        assert points and points[0]['t'].startswith(('2024-12-30', '2025-01-01')), (step, points)
+        if step in ('12h', '6h', '1d'):
+            # A week or month bucket may reach outside the range
+            assert sum(p['sum'] for p in points) == 70, (step, points)
+
+
+def check_concurrent_batches(client):
+    """Concurrent /api/batch calls under the default admission settings all
+    go through (and reach the group-commit writer together)"""
+    clients = 16
+    start = threading.Barrier(clients)
+
+    def send(n):
+        operations = [{'op': 'insert', 'table': 'finanze',
+                       'data': {'tipo': 'Spesa', 'categoria': 'Gasolio', 'descrizione': f'Batch {n}',
+                                'importo': 1, 'data_operazione': '2026-01-01'}} for _ in range(5)]
+        own = app.test_client()
+        own.environ_base.update(client.environ_base)
+        start.wait()
+        return own.post('/api/batch', json={'operations': operations}).status_code
+
+    with ThreadPoolExecutor(clients) as pool:
+        statuses = list(pool.map(send, range(clients)))
+    assert statuses == [200] * clients, statuses
+    total = client.get('/api/stats').get_json()['spese_totali']
+    assert total == clients * 5, total
+
+
+def check_dashboard_rows(client):
+    """?ids= renders only the rows the live updates patch, current after a write"""
+    for nome in ('Campo Nord', 'Campo Sud', 'Vigna'):
+        post(client, '/api/terreni', {'nome': nome, 'superficie_ettari': 1})
+    post(client, '/api/colture', {'terreno_id': 2, 'tipo_coltura': 'Mais'})
+    client.get('/api/dashboard/colture?ids=1')
+    # No endpoint edits a terreno: rename it as another tool would
+    conn = get_db_connection()
+    conn.execute("UPDATE terreni SET nome = 'Campo Est' WHERE id = 2")
+    conn.commit()
+    conn.close()
+
+    html = client.get('/api/dashboard/terreni?ids=3,1').get_data(as_text=True)
+    assert '<table' not in html and html.count('<tr data-id=') == 2, html
+    assert html.index('data-id="3"') < html.index('data-id="1"'), html
+    html = client.get('/api/dashboard/colture?ids=1').get_data(as_text=True)
+    assert 'data-terreno="2"' in html and 'Campo Est' in html, html
+    for ids in ('1,x', ','.join(['1'] * 501)):
+        response = client.get(f'/api/dashboard/terreni?ids={ids}')
+        assert response.status_code == 400, (ids[:10], response.status_code)
+
+
+def check_terreni_geo_ids(client):
+    """/api/terreni/geo?ids= takes as many ids as the list endpoints"""
+    post(client, '/api/terreni', {'nome': 'Campo Nord', 'superficie_ettari': 1,
+                                  'geometria': {'type': 'Point', 'coordinates': [11.0, 45.0]}})
+    response = client.get('/api/terreni/geo?ids=' + ','.join(['1'] * 500))
+    assert response.status_code == 200 and len(response.get_json()['features']) == 1, response.status_code
+    response = client.get('/api/terreni/geo?ids=' + ','.join(['1'] * 501))
+    assert response.status_code == 400, response.status_code
+    assert response.get_json() == {'error': 'At most 500 ids per request'}, response.get_json()
+
+
+CHECKS = [check_costi_trattori, check_series_first_day, check_concurrent_batches, check_dashboard_rows,
+          check_terreni_geo_ids]
+
+
+def main():
+    app.config['RATE_LIMIT_PER_S'] = 0
+    app.config['MAINTENANCE_CHECK_S'] = 0
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, check in enumerate(CHECKS, 1):
+            app.config['DATABASE'] = os.path.join(tmp, f'{check.__name__}.db')
+            init_db()
+            # Each check is a new client for the write rate limit
+            client = app.test_client()
+            client.environ_base['REMOTE_ADDR'] = f'127.0.0.{n}'
+            try:
+                check(client)
+            except AssertionError as e:
+                failures.append((check.__name__, e))
+
+    for name, error in failures:
+        print(f'FAILED: {name}: {error}')
+    print(f'{len(CHECKS) - len(failures)}/{len(CHECKS)} checks passed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
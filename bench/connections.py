@@ -0,0 +1,104 @@
+"""Compare req/s on the /api/* GET endpoints with and without pooled connections.
+
+The "before" run reproduces the old behaviour (a fresh connection per request,
+rollback journal, synchronous=FULL); the "after" run uses the per-thread pool
+with WAL and the tuned PRAGMAs.
+
+    python bench/connections.py --requests 2000 --threads 4 --rows 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db, get_db_connection  # noqa: E402
+
+ENDPOINTS = [
+    '/api/terreni', '/api/trattori', '/api/attrezzi', '/api/animali',
+    '/api/colture', '/api/personale', '/api/magazzino', '/api/manutenzioni',
+    '/api/finanze', '/api/stats',
+]
+
+CONFIGS = {
+    'before': {
+        'SQLITE_POOL_CONNECTIONS': False,
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_MMAP_SIZE': 0,
+        'SQLITE_CACHE_SIZE': -2000,
+    },
+    'after': {
+        'SQLITE_POOL_CONNECTIONS': True,
+        'SQLITE_JOURNAL_MODE': 'WAL',
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+        'SQLITE_MMAP_SIZE': 64 * 1024 * 1024,
+        'SQLITE_CACHE_SIZE': -16000,
+    },
+}
+
+
+def seed(rows):
+    """Fill every farm table with `rows` small rows"""
+    conn = get_db_connection()
+    for i in range(rows):
+        conn.execute('INSERT INTO terreni (nome, superficie_ettari, tipo_terreno) VALUES (?, ?, ?)',
+                     (f'Campo {i}', 1.5, 'Seminativo'))
+        conn.execute('INSERT INTO trattori (marca, modello) VALUES (?, ?)', ('Fiat', f'M{i}'))
+        conn.execute('INSERT INTO attrezzi (nome) VALUES (?)', (f'Aratro {i}',))
+        conn.execute('INSERT INTO animali (specie) VALUES (?)', ('Bovino',))
+        conn.execute('INSERT INTO colture (terreno_id, tipo_coltura) VALUES (?, ?)', (i + 1, 'Grano'))
+        conn.execute('INSERT INTO personale (nome, cognome) VALUES (?, ?)', ('Mario', f'Rossi {i}'))
+        conn.execute('INSERT INTO magazzino (categoria, nome_prodotto, quantita) VALUES (?, ?, ?)',
+                     ('Sementi', f'Seme {i}', 10))
+        conn.execute('''INSERT INTO manutenzioni (tipo_oggetto, oggetto_id, data_manutenzione)
+                        VALUES (?, ?, ?)''', ('Trattore', 1, '2024-01-01'))
+        conn.execute('''INSERT INTO finanze (tipo, categoria, descrizione, importo, data_operazione)
+                        VALUES (?, ?, ?, ?, ?)''', ('Spesa', 'Carburante', 'Gasolio', 50.0, '2024-01-01'))
+    conn.commit()
+    conn.close()
+
+
+def run(name, args):
+    app.config.update(CONFIGS[name])
+    app.config['RATE_LIMIT_PER_S'] = 0  # one client measuring the server, not its own limit
+    app.config['MAINTENANCE_CHECK_S'] = 0  # no backup of the dataset in the middle of the run
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        init_db()
+        seed(args.rows)
+
+        def worker(n):
+            client = app.test_client()
+            for i in range(n):
+                response = client.get(ENDPOINTS[i % len(ENDPOINTS)])
+                assert response.status_code == 200, response.status_code
+
+        per_thread = args.requests // args.threads
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(worker, [per_thread] * args.threads))
+        elapsed = time.perf_counter() - start
+
+    total = per_thread * args.threads
+    return {'requests': total, 'seconds': round(elapsed, 3), 'req_per_s': round(total / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=200)
+    args = parser.parse_args()
+
+    results = {name: run(name, args) for name in CONFIGS}
+    results['speedup'] = round(results['after']['req_per_s'] / results['before']['req_per_s'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Deterministic synthetic farm databases for benchmarks.
+
+terreni (polygon geometries, indexed in the R-tree), animali (padre/madre
+pedigrees over several generations), finanze and manutenzioni get the
+requested number of rows each; the other tables get a small fixed set so
+every endpoint has something to return.
+
+    python bench/datasets.py --size 100k
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db, get_db_connection, index_terreno_geometry  # noqa: E402
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+DATA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+BATCH = 10_000
+
+TIPI_TERRENO = ['Seminativo', 'Vigneto', 'Uliveto', 'Frutteto', 'Pascolo', 'Bosco']
+SPECIE = [('Bovino', ['Frisona', 'Bruna', 'Chianina']), ('Ovino', ['Sarda', 'Comisana']),
+          ('Suino', ['Large White', 'Cinta Senese'])]
+CATEGORIE_SPESA = ['Carburante', 'Sementi', 'Fertilizzanti', 'Manodopera', 'Veterinario', 'Manutenzione']
+CATEGORIE_RICAVO = ['Vendita latte', 'Vendita cereali', 'Vendita vino', 'Contributi PAC']
+METODI = ['Bonifico', 'Contanti', 'Carta', 'RID']
+START = date(2015, 1, 1)
+DAYS = 10 * 365
+
+
+def parse_size(value):
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def dataset_dir(size, seed=1):
+    return os.path.join(DATA_ROOT, f'{size}-seed{seed}')
+
+
+def day(rng):
+    return (START + timedelta(days=rng.randrange(DAYS))).isoformat()
+
+
+def parcel(rng, i, rows):
+    """Irregular polygon of roughly 1-10 ha on a grid over the Po valley"""
+    side = max(1, math.isqrt(rows))
+    lon = 9.0 + (i % side) * 3.0 / side + rng.uniform(0, 0.3 / side)
+    lat = 44.5 + (i // side) * 1.5 / side + rng.uniform(0, 0.15 / side)
+    radius = rng.uniform(0.0006, 0.0018)
+    vertices = rng.randint(5, 24)
+    ring = []
+    for k in range(vertices):
+        angle = 2 * math.pi * k / vertices
+        r = radius * rng.uniform(0.7, 1.0)
+        ring.append([round(lon + r * math.cos(angle) / math.cos(math.radians(lat)), 7),
+                     round(lat + r * math.sin(angle), 7)])
+    ring.append(ring[0])
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def generate_terreni(conn, rng, rows):
+    for start in range(0, rows, BATCH):
+        with conn:
+            for i in range(start, min(rows, start + BATCH)):
+                geometria = json.dumps(parcel(rng, i, rows))
+                cursor = conn.execute('''INSERT INTO terreni
+                    (nome, superficie_ettari, tipo_terreno, ubicazione, foglio, particella, geometria)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (f'Appezzamento {i + 1}', round(rng.uniform(1, 10), 2), rng.choice(TIPI_TERRENO),
+                     'Pianura Padana', str(rng.randint(1, 200)), str(rng.randint(1, 2000)), geometria))
+                index_terreno_geometry(conn, cursor.lastrowid, geometria)
+
+
+def generate_animali(conn, rng, rows):
+    """Animals born in order; after the founders every animal gets a sire and
+    a dam drawn from the preceding generations, so pedigrees are deep."""
+    males, females = [], []
+    founders = max(2, rows // 20)
+    for start in range(0, rows, BATCH):
+        batch = []
+        for i in range(start, min(rows, start + BATCH)):
+            specie, razze = SPECIE[0] if i % 10 < 7 else rng.choice(SPECIE[1:])
+            sesso = 'M' if rng.random() < 0.3 else 'F'
+            padre = madre = None
+            if i >= founders and males and females:
+                # Parents come from a recent window, like a real herd
+                padre = rng.choice(males[-500:])
+                madre = rng.choice(females[-2000:])
+            batch.append((specie, rng.choice(razze), f'IT{i + 1:012d}', day(rng), sesso,
+                          round(rng.uniform(50, 800), 1), padre, madre))
+            (males if sesso == 'M' else females).append(i + 1)
+        with conn:
+            conn.executemany('''INSERT INTO animali
+                (specie, razza, identificativo, data_nascita, sesso, peso_kg, padre_id, madre_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+
+
+def generate_finanze(conn, rng, rows):
+    for start in range(0, rows, BATCH):
+        batch = []
+        for i in range(start, min(rows, start + BATCH)):
+            spesa = rng.random() < 0.65
+            categoria = rng.choice(CATEGORIE_SPESA if spesa else CATEGORIE_RICAVO)
+            batch.append(('Spesa' if spesa else 'Ricavo', categoria, f'{categoria} #{i + 1}',
+                          round(rng.lognormvariate(5, 1.2), 2), day(rng), rng.choice(METODI), f'RIF-{i + 1}'))
+        with conn:
+            conn.executemany('''INSERT INTO finanze
+                (tipo, categoria, descrizione, importo, data_operazione, metodo_pagamento, riferimento)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''', batch)
+
+
+def generate_manutenzioni(conn, rng, rows, trattori, attrezzi):
+    for start in range(0, rows, BATCH):
+        batch = []
+        for i in range(start, min(rows, start + BATCH)):
+            trattore = rng.random() < 0.6
+            data = day(rng)
+            prossima = (date.fromisoformat(data) + timedelta(days=rng.choice([90, 180, 365]))).isoformat()
+            batch.append(('Trattore' if trattore else 'Attrezzo',
+                          rng.randint(1, trattori if trattore else attrezzi), data,
+                          rng.choice(['Ordinaria', 'Straordinaria', 'Revisione']),
+                          f'Intervento {i + 1}: cambio olio e filtri', round(rng.uniform(50, 3000), 2),
+                          rng.choice(['Officina Rossi', 'Interno', 'Concessionario']), prossima))
+        with conn:
+            conn.executemany('''INSERT INTO manutenzioni
+                (tipo_oggetto, oggetto_id, data_manutenzione, tipo_manutenzione, descrizione, costo,
+                 eseguita_da, prossima_manutenzione)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+
+
+def generate_small_tables(conn, rng, terreni):
+    trattori, attrezzi = 50, 120
+    with conn:
+        conn.executemany('INSERT INTO trattori (marca, modello, anno, ore_lavoro, stato) VALUES (?, ?, ?, ?, ?)',
+                         [(rng.choice(['Fiat', 'New Holland', 'John Deere', 'Landini']), f'M{i}',
+                           rng.randint(1990, 2024), rng.randint(0, 12000),
+                           rng.choice(['Operativo', 'In manutenzione'])) for i in range(trattori)])
+        conn.executemany('INSERT INTO attrezzi (nome, tipo, stato) VALUES (?, ?, ?)',
+                         [(f'Attrezzo {i}', rng.choice(['Aratro', 'Erpice', 'Seminatrice']), 'Buono')
+                          for i in range(attrezzi)])
+        conn.executemany('INSERT INTO colture (terreno_id, tipo_coltura, data_semina, stato, quantita_raccolta_kg) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         [(rng.randint(1, terreni), rng.choice(['Grano', 'Mais', 'Soia', 'Vite']), day(rng),
+                           rng.choice(['In corso', 'Raccolto']), round(rng.uniform(0, 50000), 1))
+                          for _ in range(min(terreni, 2000))])
+        conn.executemany('INSERT INTO personale (nome, cognome, ruolo) VALUES (?, ?, ?)',
+                         [(f'Nome{i}', f'Cognome{i}', rng.choice(['Trattorista', 'Mungitore', 'Operaio']))
+                          for i in range(40)])
+        conn.executemany('INSERT INTO magazzino (categoria, nome_prodotto, quantita, scadenza) VALUES (?, ?, ?, ?)',
+                         [(rng.choice(['Sementi', 'Fertilizzanti', 'Fitofarmaci']), f'Prodotto {i}',
+                           rng.uniform(1, 500), day(rng)) for i in range(300)])
+    return trattori, attrezzi
+
+
+def build(size, seed=1, force=False):
+    """Create (or reuse) the dataset directory for a size; returns its path.
+    The database is named farm_management.db so DATA_DIR can point at it.
+    A reused database gets any migration added since it was generated."""
+    rows = parse_size(size)
+    directory = dataset_dir(size, seed)
+    path = os.path.join(directory, 'farm_management.db')
+    app.config['DATABASE'] = path
+    if os.path.exists(path) and not force:
+        with contextlib.redirect_stdout(sys.stderr):
+            init_db()
+        return directory
+    os.makedirs(directory, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(seed)
+    with contextlib.redirect_stdout(sys.stderr):
+        init_db()
+    conn = get_db_connection()
+    started = time.perf_counter()
+    generate_terreni(conn, rng, rows)
+    trattori, attrezzi = generate_small_tables(conn, rng, rows)
+    generate_animali(conn, rng, rows)
+    generate_finanze(conn, rng, rows)
+    generate_manutenzioni(conn, rng, rows, trattori, attrezzi)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    print(f'Generated {size} dataset in {time.perf_counter() - started:.1f}s: {path}', file=sys.stderr)
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic farm database')
+    parser.add_argument('--size', default='1k', help='1k, 100k, 1m or a row count')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='regenerate even if it exists')
+    args = parser.parse_args()
+    print(build(args.size, args.seed, args.force))
+
+
+if __name__ == '__main__':
+    main()
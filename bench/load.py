@@ -0,0 +1,253 @@
+"""Load test the API on a synthetic dataset and report per-endpoint latency.
+
+Drives the app either in-process through the Flask test client or over HTTP
+against a local gunicorn, with --concurrency client threads cycling through
+a fixed endpoint mix. Request parameters are drawn from a seeded RNG, so two
+runs on the same dataset issue the same requests. The JSON report (requests,
+errors, req/s, mean and p50/p95/p99 per endpoint) has sorted keys and is
+meant to be diffed between commits.
+
+    python bench/load.py --size 100k --mode client --concurrency 8 --requests 5000
+    python bench/load.py --size 1m --mode gunicorn --workers 4 --threads 4 --output after.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.datasets import build, parse_size  # noqa: E402
+
+
+def _bbox(rng, rows):
+    """A window of about 4x4 km somewhere on the dataset grid"""
+    lon, lat = rng.uniform(9.0, 11.95), rng.uniform(44.5, 45.97)
+    return f'/api/terreni/geo?bbox={lon:.4f},{lat:.4f},{lon + 0.05:.4f},{lat + 0.03:.4f}&zoom=14'
+
+
+def _finanze_range(rng, rows):
+    year, month = rng.randint(2015, 2024), rng.randint(1, 12)
+    return (f'/api/finanze?tipo=Spesa&from={year}-{month:02d}-01&to={year}-{month:02d}-28'
+            f'&limit=100')
+
+
+# (name, path builder); builders get the thread's RNG and the dataset size
+ENDPOINTS = [
+    ('health', lambda rng, rows: '/health'),
+    ('stats', lambda rng, rows: '/api/stats'),
+    ('terreni_page', lambda rng, rows: '/api/terreni?limit=100&fields=id,nome,tipo_terreno,superficie_ettari'),
+    ('terreni_item', lambda rng, rows: f'/api/terreni/{rng.randint(1, rows)}'),
+    ('terreni_geo', _bbox),
+    ('trattori_list', lambda rng, rows: '/api/trattori'),
+    ('animali_page', lambda rng, rows: '/api/animali?limit=100'),
+    ('animali_columnar', lambda rng, rows: '/api/animali?limit=100&format=columnar'),
+    ('animali_item', lambda rng, rows: f'/api/animali/{rng.randint(1, rows)}'),
+    ('animali_ids', lambda rng, rows: '/api/animali?ids=' + ','.join(
+        str(rng.randint(1, rows)) for _ in range(20))),
+    ('colture_page', lambda rng, rows: '/api/colture?limit=100'),
+    ('finanze_page', lambda rng, rows: '/api/finanze?limit=100'),
+    ('finanze_range', _finanze_range),
+    ('manutenzioni_page', lambda rng, rows: '/api/manutenzioni?limit=100'),
+    ('manutenzioni_trattore', lambda rng, rows: (
+        f'/api/manutenzioni?tipo_oggetto=Trattore&oggetto_id={rng.randint(1, 50)}&limit=100')),
+    ('search_identificativo', lambda rng, rows: f'/api/search?q=IT{rng.randint(1, rows):012d}'[:-2]),
+    ('search_text', lambda rng, rows: '/api/search?q=' + rng.choice(['olio', 'carburante', 'frisona', 'officina'])),
+    ('scadenze', lambda rng, rows: '/api/scadenze?within=30d'),
+    ('dashboard', lambda rng, rows: '/api/dashboard?section=' + rng.choice(['animali', 'finanze', 'manutenzioni'])),
+    ('series', lambda rng, rows: '/api/series/' + rng.choice(['spese', 'ricavi']) + '?step=' + rng.choice(['1d', '1w', '1mo'])
+        + '&from=2024-01-01&to=2024-12-31'),
+]
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(samples, elapsed):
+    """samples: {endpoint: [(seconds, ok), ...]}"""
+    report = {}
+    for name, values in samples.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in values)
+        report[name] = {
+            'requests': len(values),
+            'errors': sum(1 for _, ok in values if not ok),
+            'req_per_s': round(len(values) / elapsed, 1),
+            'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+        }
+    return report
+
+
+def client_session(app):
+    """In-process requester; returns (status, body length)"""
+    client = app.test_client()
+
+    def get(path):
+        response = client.get(path)
+        return response.status_code, len(response.get_data())
+    return get
+
+
+def http_session(port):
+    """Keep-alive HTTP requester for one client thread"""
+    state = {'conn': None}
+
+    def get(path):
+        for attempt in range(2):
+            if state['conn'] is None:
+                state['conn'] = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            try:
+                state['conn'].request('GET', path)
+                response = state['conn'].getresponse()
+                return response.status, len(response.read())
+            except (http.client.HTTPException, OSError):
+                state['conn'].close()
+                state['conn'] = None
+                if attempt:
+                    raise
+    return get
+
+
+def drive(make_session, rows, args):
+    """Run the endpoint mix from --concurrency threads; returns (samples, elapsed)"""
+    samples = {name: [] for name, _ in ENDPOINTS}
+    lock = threading.Lock()
+    per_thread = args.requests // args.concurrency
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        get = make_session()
+        for name, build_path in ENDPOINTS:  # warm-up, not recorded
+            get(build_path(rng, rows))
+        local = []
+        for i in range(per_thread):
+            name, build_path = ENDPOINTS[(i + index) % len(ENDPOINTS)]
+            path = build_path(rng, rows)
+            started = time.perf_counter()
+            try:
+                status, _ = get(path)
+                ok = status < 400 or (status == 404 and name.endswith('_item'))
+            except (http.client.HTTPException, OSError):
+                ok = False
+            local.append((name, time.perf_counter() - started, ok))
+        with lock:
+            for name, seconds, ok in local:
+                samples[name].append((seconds, ok))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def run_client(directory, rows, args):
+    from app import app
+    app.config['DATABASE'] = os.path.join(directory, 'farm_management.db')
+    app.config['RATE_LIMIT_PER_S'] = 0  # one client measuring the server, not its own limit
+    app.config['MAINTENANCE_CHECK_S'] = 0  # no backup of the dataset in the middle of the run
+    return drive(lambda: client_session(app), rows, args)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_gunicorn(directory, rows, args):
+    port = free_port()
+    env = dict(os.environ, DATA_DIR=directory, RATE_LIMIT_PER_S='0', MAINTENANCE_CHECK_S='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(args.workers), '--threads', str(args.threads),
+         '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=env)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if http_session(port)('/health')[0] == 200:
+                    break
+            except OSError:
+                pass
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit('gunicorn did not start')
+            time.sleep(0.2)
+        return drive(lambda: http_session(port), rows, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='1k', help='1k, 100k, 1m or a row count')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mode', choices=('client', 'gunicorn'), default='client')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    parser.add_argument('--requests', type=int, default=2000, help='total measured requests')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    args = parser.parse_args()
+
+    rows = parse_size(args.size)
+    directory = build(args.size, args.seed)
+    runner = run_gunicorn if args.mode == 'gunicorn' else run_client
+    samples, elapsed = runner(directory, rows, args)
+
+    total = sum(len(values) for values in samples.values())
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'size': args.size, 'rows': rows, 'seed': args.seed, 'mode': args.mode,
+            'concurrency': args.concurrency,
+            'workers': args.workers if args.mode == 'gunicorn' else None,
+            'threads': args.threads if args.mode == 'gunicorn' else None,
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+        },
+        'total': {
+            'requests': total,
+            'errors': sum(1 for values in samples.values() for _, ok in values if not ok),
+            'seconds': round(elapsed, 3),
+            'req_per_s': round(total / elapsed, 1),
+        },
+        'endpoints': summarize(samples, elapsed),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if report['total']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
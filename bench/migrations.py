@@ -0,0 +1,115 @@
+"""Fail if the schema migrations break on a database holding legacy data.
+
+Builds databases as older releases left them -- the original tables with no
+schema_version, and the schema at each version from 11 on -- fills them with
+rows the old handlers accepted (dates not in ISO format, timestamps with a
+'T'), runs init_db() and checks that every migration applies, that the
+series rollups match a recount of the rows and that the write endpoints
+still take such rows. Exits non-zero listing the failed checks.
+
+    python bench/migrations.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as farm  # noqa: E402
+from app import app, init_db, create_tables, migrate, get_db_connection, MIGRATIONS, SERIES, ROLLUP_STEPS  # noqa: E402
+
+LEGACY_NUMBERS = [(1.5, '2026-10-01 10:15:00'), (2.5, '2026-10-01T11:30:00'), (4.0, 'ieri')]
+
+LEGACY_FINANZE = [
+    ('Spesa', 'Gasolio', 'Pieno trattore', 120.0, '2026-10-01'),
+    ('Spesa', 'Sementi', 'Mais', 80.0, '01/10/2026'),
+    ('Ricavo', 'Vendita', 'Grano', 900.0, '1 ottobre 2026'),
+    ('Ricavo', 'Vendita', 'Orzo', 300.0, '2026-10-02'),
+]
+
+
+def baseline(path, version):
+    """A database at schema `version` (None: before schema_version existed) with legacy rows"""
+    conn = get_db_connection(path)
+    create_tables(conn)
+    if version is not None:
+        applied = MIGRATIONS[:]
+        farm.MIGRATIONS[:] = [step for step in applied if step[0] <= version]
+        try:
+            migrate(conn)
+        finally:
+            farm.MIGRATIONS[:] = applied
+    conn.executemany('INSERT INTO numbers (value, created_at) VALUES (?, ?)', LEGACY_NUMBERS)
+    conn.executemany('''INSERT INTO finanze (tipo, categoria, descrizione, importo, data_operazione)
+                        VALUES (?, ?, ?, ?, ?)''', LEGACY_FINANZE)
+    conn.commit()
+    conn.close()
+
+
+def rollup_mismatches(conn):
+    """(serie, step) whose rollups differ from a GROUP BY over the rows"""
+    mismatches = []
+    for name, spec in SERIES.items():
+        for step in spec['steps']:
+            bucket = ROLLUP_STEPS[step][0].format(t=spec['time'])
+            expected = conn.execute(f'''
+                SELECT {bucket}, COUNT(*), SUM({spec['value']}) FROM {spec['table']}
+                WHERE {spec['where'].format(row=spec['table'])} AND {bucket} IS NOT NULL
+                GROUP BY 1 ORDER BY 1''').fetchall()
+            actual = conn.execute('''SELECT bucket, count, sum FROM series_rollups
+                                     WHERE serie = ? AND step = ? ORDER BY bucket''', (name, step)).fetchall()
+            if [tuple(row) for row in expected] != [tuple(row) for row in actual]:
+                mismatches.append((name, step))
+    return mismatches
+
+
+def check(label, version, tmp):
+    failures = []
+    app.config['DATABASE'] = os.path.join(tmp, f'{label}.db')
+    baseline(app.config['DATABASE'], version)
+    try:
+        init_db()
+    except Exception as e:
+        return [f'{label}: init_db() failed: {e!r}']
+
+    conn = get_db_connection()
+    current = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+    if current != MIGRATIONS[-1][0]:
+        failures.append(f'{label}: schema at version {current}, expected {MIGRATIONS[-1][0]}')
+    failures += [f'{label}: rollups of {name}/{step} do not match the rows' for name, step in rollup_mismatches(conn)]
+
+    client = app.test_client()
+    finanza = {'tipo': 'Spesa', 'categoria': 'Gasolio', 'descrizione': 'Legacy', 'importo': 10,
+               'data_operazione': '15/10/2026'}
+    response = client.post('/api/finanze', json=finanza)
+    if response.status_code != 200:
+        failures.append(f'{label}: POST /api/finanze with a non-ISO date returned {response.status_code}')
+    response = client.post('/api/finanze', json=dict(finanza, data_operazione='2026-10-15'))
+    if response.status_code != 200:
+        failures.append(f'{label}: POST /api/finanze returned {response.status_code}')
+    conn.execute("UPDATE finanze SET data_operazione = '2026-10-03' WHERE data_operazione = '01/10/2026'")
+    conn.execute("DELETE FROM finanze WHERE data_operazione = '1 ottobre 2026'")
+    conn.commit()
+    failures += [f'{label}: rollups of {name}/{step} drift after writes' for name, step in rollup_mismatches(conn)]
+    conn.close()
+    return failures
+
+
+def main():
+    app.config['RATE_LIMIT_PER_S'] = 0
+    app.config['MAINTENANCE_CHECK_S'] = 0
+    versions = [None] + [version for version, _, _ in MIGRATIONS if version >= 11]
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for version in versions:
+            label = 'v0' if version is None else f'v{version}'
+            failures += check(label, version, tmp)
+
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    print(f'{len(versions)} baseline databases, {len(failures)} failed checks')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Fail if any hot query falls back to a full table scan.
+
+Builds a fresh database through init_db() (so every migration is applied),
+runs EXPLAIN QUERY PLAN over the list queries of every endpoint (default
+order, each filter, date ranges, keyset pages) plus the stats and join
+queries, and exits non-zero listing the queries whose plan contains a bare
+"SCAN <table>" step.
+
+    python bench/query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (app, init_db, get_db_connection, build_list_query, encode_cursor, LIST_SPECS,  # noqa: E402
+                 ANCESTORS_SQL, DESCENDANTS_SQL, SCADENZE_SQL, SERIES, series_query)
+
+# Queries issued outside build_list_query()
+EXTRA_QUERIES = [
+    'SELECT * FROM numbers ORDER BY created_at DESC LIMIT 100',
+    # min/max recomputed by the series triggers when the extreme is deleted
+    "SELECT MIN(value) FROM numbers WHERE created_at >= '2024-01-01 10:00:00' AND created_at < '2024-01-01 11:00:00'",
+    "SELECT MAX(importo) FROM finanze WHERE data_operazione >= '2024-01-01' AND data_operazione < '2024-01-02' "
+    "AND finanze.tipo = 'Spesa'",
+    "SELECT MIN(r.min) FROM series_rollups AS r WHERE r.serie = 'numbers' AND r.step = 'day' "
+    "AND r.bucket >= '2024-01-01' AND r.bucket < '2024-02-01'",
+    'SELECT * FROM stats_summary WHERE id = 1',
+    'SELECT * FROM stats_terreni_tipo ORDER BY tipo_terreno',
+    'SELECT mese, tipo, totale FROM stats_finanze_mensili ORDER BY mese',
+    'SELECT c.id, t.nome FROM terreni t JOIN colture c ON c.terreno_id = t.id WHERE t.id = 1',
+    '''SELECT t.id, t.geometria, g.area_m2 FROM terreni_rtree r
+       JOIN terreni t ON t.id = r.id JOIN terreni_geo g ON g.id = r.id
+       WHERE r.max_lon >= 9 AND r.min_lon <= 10 AND r.max_lat >= 44 AND r.min_lat <= 45''',
+    ANCESTORS_SQL,
+    DESCENDANTS_SQL,
+    SCADENZE_SQL + "WHERE s.scadenza <= date('now', '+30 days') ORDER BY s.scadenza LIMIT 1000",
+    SCADENZE_SQL + 'WHERE s.ore_residue <= 25 ORDER BY s.ore_residue LIMIT 1000',
+    "UPDATE scadenze SET avvisata_at = CURRENT_TIMESTAMP WHERE avvisata_at IS NULL AND scadenza <= date('now', '+7 days')",
+    'UPDATE scadenze SET avvisata_at = CURRENT_TIMESTAMP WHERE avvisata_at IS NULL AND ore_residue <= 25',
+    "SELECT MIN(data_operazione) FROM finanze WHERE data_operazione >= '2024-01-01'",
+    "SELECT MIN(created_at) FROM numbers WHERE created_at >= '2024-01-01'",
+    "SELECT * FROM finanze WHERE data_operazione >= '2024-01-01' AND data_operazione < '2024-02-01'",
+    "SELECT * FROM numbers WHERE created_at >= '2024-01-01' AND created_at < '2024-02-01'",
+    "UPDATE maintenance_runs SET status = 'running' WHERE task = 'backup'",
+]
+
+# Named parameters of the queries above that take some
+NAMED_PARAMS = {ANCESTORS_SQL: {'id': 1, 'depth': 5}, DESCENDANTS_SQL: {'id': 1, 'depth': 5}}
+
+# Scanning the work queue of a recursive CTE is expected
+CTE_QUEUES = {'antenati', 'discendenti'}
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def list_queries(conn):
+    """(label, sql, params) for every list endpoint variant"""
+    for table, spec in LIST_SPECS.items():
+        cursor = encode_cursor(['x'] * len(spec['order']))
+        variants = [{}, {'ids': '1,5,9'}, {'limit': '50'}, {'limit': '50', 'cursor': cursor},
+                    {'from': '2024-01-01', 'to': '2024-12-31'}]
+        variants += [{column: '1'} for column in spec['filters']]
+        for args in variants:
+            sql, params, _, _ = build_list_query(conn, table, args)
+            yield f'{table} {args}', sql, params
+
+
+
+def series_queries(conn):
+    """(label, sql, params) for /api/series at each kind of step"""
+    for name in SERIES:
+        for step in (None, '15m', '1h', '6h', '1d', '1w', '1mo', '1y'):
+            sql, params, _, _ = series_query(conn, name, '2024-01-01', '2024-01-10', step)
+            yield f'series {name} {step}', sql, params
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'plans.db')
+        init_db()
+        conn = get_db_connection()
+
+        queries = list(list_queries(conn)) + list(series_queries(conn))
+        queries += [(sql, sql, NAMED_PARAMS.get(sql, [])) for sql in EXTRA_QUERIES]
+        for label, sql, params in queries:
+            plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+            scans = (FULL_SCAN.match(step) for step in plan)
+            if any(scan and scan.group(1) not in CTE_QUEUES for scan in scans):
+                failures.append((label, plan))
+        conn.close()
+
+    for label, plan in failures:
+        print(f'FULL SCAN: {label}')
+        for step in plan:
+            print(f'    {step}')
+    print(f'{len(queries) - len(failures)}/{len(queries)} queries use an index')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
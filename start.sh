@@ -9,43 +9,13 @@ echo "Data directory: $DATA_DIR"
 # Ensure data directory exists
 mkdir -p $DATA_DIR
 
-# Initialize database (create tables if they don't exist)
-echo "Initializing database..."
-python -c "from app import init_db; init_db()"
-echo "Database initialized!"
-
-# Run migrations (add missing columns)
-echo "Running database migrations..."
-python -c "
-import sqlite3
-import os
-
-DATABASE = os.path.join(os.getenv('DATA_DIR', '.'), 'farm_management.db')
-conn = sqlite3.connect(DATABASE)
-
-# Check if geometria column exists, if not add it
-try:
-    cursor = conn.cursor()
-    cursor.execute('PRAGMA table_info(terreni)')
-    columns = [row[1] for row in cursor.fetchall()]
-
-    if 'geometria' not in columns:
-        print('Adding geometria column to terreni table...')
-        cursor.execute('ALTER TABLE terreni ADD COLUMN geometria TEXT')
-        conn.commit()
-        print('✅ Column geometria added successfully')
-    else:
-        print('✅ Column geometria already exists')
-
-except Exception as e:
-    print(f'Migration error: {e}')
-finally:
-    conn.close()
-"
-echo "Migrations completed!"
-
-# Start gunicorn
+# Start gunicorn. With --preload the master imports the app and brings the
+# database schema up to date once (bootstrap), then forks the workers from it.
+# Each open /api/changes/stream holds one of a worker's --threads until it is
+# closed: SSE_MAX_CLIENTS (2 per worker) must stay below --threads, or the
+# streams leave no thread to the other requests
 exec gunicorn \
+    --preload \
     --bind 0.0.0.0:$PORT \
     --workers 2 \
     --threads 4 \
@@ -53,4 +23,4 @@ exec gunicorn \
     --access-logfile - \
     --error-logfile - \
     --log-level info \
-    app:app
+    'app:bootstrap()'